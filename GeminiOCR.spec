@@ -10,7 +10,7 @@ a = Analysis(
     hookspath=[],
     hooksconfig={},
     runtime_hooks=[],
-    excludes=[],
+    excludes=['tkinter', 'IPython', 'jedi', 'matplotlib', 'pandas', 'scipy', 'pytest', 'google.genai', 'watchdog'],
     noarchive=False,
     optimize=0,
 )
@@ -0,0 +1,120 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+DEFAULT_WORKERS = 4
+
+
+class BatchControl:
+    """Pause and cancel an iter_batch run from another thread (such as a GUI).
+
+    Both are cooperative: no new items are started while paused or after
+    cancel(), but items already running finish and their results are still
+    yielded. After cancel() the iteration ends once they are done.
+    """
+
+    def __init__(self):
+        self.unpaused = threading.Event()
+        self.unpaused.set()
+        self.stopped = threading.Event()
+
+    def pause(self):
+        self.unpaused.clear()
+
+    def resume(self):
+        self.unpaused.set()
+
+    def cancel(self):
+        self.stopped.set()
+        self.unpaused.set()
+
+    @property
+    def paused(self):
+        return not self.unpaused.is_set()
+
+    @property
+    def cancelled(self):
+        return self.stopped.is_set()
+
+    def wait(self):
+        """Block while paused; returns False if the run was cancelled."""
+        self.unpaused.wait()
+        return not self.cancelled
+
+
+def iter_batch(items, func, workers=DEFAULT_WORKERS, progress_callback=None, control=None, weight=None):
+    """Run func(item) for every item on a bounded thread pool.
+
+    Yields (index, result) pairs in input order. At most a small window of
+    items is in flight at once, so memory stays bounded even for very large
+    inputs. progress_callback(completed, total) is called from the calling
+    thread every time an item finishes, in completion order. total is None
+    when items has no length. With weight, a finished item counts as
+    weight(result) units of progress instead of one (total is then None).
+    An optional BatchControl pauses or cancels the run; a cancelled run
+    yields only the items that were started.
+    """
+    workers = max(1, int(workers or 1))
+    try:
+        total = len(items) if weight is None else None
+    except TypeError:
+        total = None
+    completed = 0
+
+    if workers == 1:
+        for index, item in enumerate(items):
+            if control is not None and not control.wait():
+                return
+            result = func(item)
+            completed += weight(result) if weight else 1
+            if progress_callback:
+                progress_callback(completed, total)
+            yield index, result
+        return
+
+    window = workers * 2
+    source = iter(enumerate(items))
+    pending = {}
+    done_results = {}
+    next_index = 0
+    exhausted = False
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        while True:
+            if control is not None and control.cancelled:
+                exhausted = True
+
+            # Keep the pool fed up to the window size, unless paused
+            while (not exhausted and len(pending) + len(done_results) < window
+                   and (control is None or not control.paused)):
+                try:
+                    index, item = next(source)
+                except StopIteration:
+                    exhausted = True
+                    break
+                pending[executor.submit(func, item)] = index
+
+            if not pending and not done_results:
+                if exhausted:
+                    break
+                # Paused with nothing left running
+                control.wait()
+                continue
+
+            if pending:
+                finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    index = pending.pop(future)
+                    done_results[index] = future.result()
+                    completed += weight(done_results[index]) if weight else 1
+                    if progress_callback:
+                        progress_callback(completed, total)
+
+            # Release everything that is now contiguous with the last yielded index
+            while next_index in done_results:
+                yield next_index, done_results.pop(next_index)
+                next_index += 1
+
+
+def run_batch(items, func, workers=DEFAULT_WORKERS, progress_callback=None):
+    """Run func over items concurrently and return the results in input order."""
+    return [result for _, result in iter_batch(items, func, workers, progress_callback)]
@@ -0,0 +1,215 @@
+import os
+import json
+import time
+import uuid
+import base64
+import shutil
+
+from image_input import read_job, prepare_upload, job_label
+from journal import job_key
+from ocr_client import StubBackend, PREPROCESS_SKIP_MIME_TYPES
+
+# Batch job states, as reported by the Gemini Batch API
+SUCCEEDED = 'JOB_STATE_SUCCEEDED'
+PARTIALLY_SUCCEEDED = 'JOB_STATE_PARTIALLY_SUCCEEDED'
+FINISHED_STATES = {SUCCEEDED, PARTIALLY_SUCCEEDED, 'JOB_STATE_FAILED', 'JOB_STATE_CANCELLED', 'JOB_STATE_EXPIRED'}
+COLLECTABLE_STATES = {SUCCEEDED, PARTIALLY_SUCCEEDED}
+
+DEFAULT_POLL_INTERVAL = 60
+
+
+def default_record_path(output_path):
+    """Batch record file kept next to the output file."""
+    return output_path + '.batch.json'
+
+
+def default_manifest_path(output_path):
+    return output_path + '.batch_manifest.jsonl'
+
+
+def rest_schema(schema):
+    """Convert a response schema to the REST form, which spells types in upper case."""
+    converted = dict(schema)
+    if isinstance(converted.get('type'), str):
+        converted['type'] = converted['type'].upper()
+    if 'properties' in converted:
+        converted['properties'] = {name: rest_schema(prop) for name, prop in converted['properties'].items()}
+    if 'items' in converted:
+        converted['items'] = rest_schema(converted['items'])
+    return converted
+
+
+def encode_request(prompt, upload_bytes, mime_type, generation_config=None):
+    """Build one GenerateContent request in the JSON form used by batch input files."""
+    request = {
+        'contents': [{
+            'role': 'user',
+            'parts': [
+                {'text': prompt},
+                {'inline_data': {'mime_type': mime_type, 'data': base64.b64encode(upload_bytes).decode('ascii')}},
+            ],
+        }],
+    }
+    if generation_config:
+        config = dict(generation_config)
+        if 'response_schema' in config:
+            config['response_schema'] = rest_schema(config['response_schema'])
+        request['generation_config'] = config
+    return request
+
+
+def decode_contents(request):
+    """Turn a batch request back into the contents list passed to a backend."""
+    contents = []
+    for part in request['contents'][0]['parts']:
+        if 'text' in part:
+            contents.append(part['text'])
+        else:
+            inline = part['inline_data']
+            contents.append({'mime_type': inline['mime_type'], 'data': base64.b64decode(inline['data'])})
+    return contents
+
+
+def response_text(entry):
+    """Return the response text of one batch output line; raises ValueError for a failed request."""
+    error = entry.get('error')
+    if error:
+        raise ValueError(error.get('message', str(error)) if isinstance(error, dict) else str(error))
+    candidates = entry.get('response', {}).get('candidates') or []
+    if not candidates:
+        raise ValueError('Empty response')
+    parts = candidates[0].get('content', {}).get('parts', [])
+    return ''.join(part.get('text', '') for part in parts)
+
+
+def build_manifest(jobs, manifest_path, prompt, preprocessor=None, generation_config=None):
+    """Write the batch input file with one request per job.
+
+    Returns {job_key: error message} for the jobs that could not be read;
+    they are left out of the manifest and reported as errors on collect.
+    """
+    errors = {}
+    with open(manifest_path, 'w', encoding='utf-8') as f:
+        for job in jobs:
+            try:
+                upload_bytes, mime_type = prepare_upload(read_job(job), job.page)
+                if preprocessor is not None and mime_type not in PREPROCESS_SKIP_MIME_TYPES:
+                    upload_bytes, mime_type = preprocessor.process(upload_bytes, mime_type)
+            except Exception as e:
+                print(f"Error processing image {job_label(job)}: {e}")
+                errors[job_key(job)] = str(e)
+                continue
+            request = encode_request(prompt, upload_bytes, mime_type, generation_config)
+            f.write(json.dumps({'key': job_key(job), 'request': request}) + '\n')
+    return errors
+
+
+def save_record(path, record):
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(record, f, ensure_ascii=False)
+
+
+def load_record(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+class GeminiBatchTransport:
+    """Submits batch jobs to the Gemini Batch API (requires the google-genai package)."""
+
+    def __init__(self, api_key):
+        # Imported on first use; the SDK is slow to import and only needed for the real API
+        try:
+            from google import genai as google_genai
+        except ImportError:
+            raise ImportError("Batch jobs require the google-genai package")
+        self.client = google_genai.Client(api_key=api_key)
+
+    def submit(self, manifest_path, model, display_name):
+        """Upload the manifest, start a batch job and return its name."""
+        uploaded = self.client.files.upload(file=manifest_path,
+                                            config={'display_name': display_name, 'mime_type': 'jsonl'})
+        job = self.client.batches.create(model=model, src=uploaded.name, config={'display_name': display_name})
+        return job.name
+
+    def status(self, name):
+        return self.client.batches.get(name=name).state.name
+
+    def results(self, name):
+        """Yield the output lines of a finished job as dicts."""
+        job = self.client.batches.get(name=name)
+        content = self.client.files.download(file=job.dest.file_name)
+        for line in content.decode('utf-8').splitlines():
+            if line.strip():
+                yield json.loads(line)
+
+
+class LocalBatchTransport:
+    """File-based stand-in for the batch API, for tests and trying the flow offline.
+
+    Jobs live in a directory each under root. A job stays pending for delay
+    seconds after submission; the first status check after that answers
+    every request with the backend (the stub by default) and writes the
+    output file in the same format as the Gemini Batch API.
+    """
+
+    def __init__(self, root, backend=None, delay=0.0):
+        self.root = root
+        self.backend = backend
+        self.delay = delay
+
+    def job_dir(self, name):
+        return os.path.join(self.root, name.split('/')[-1])
+
+    def read_state(self, name):
+        with open(os.path.join(self.job_dir(name), 'job.json'), 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def write_state(self, name, state):
+        with open(os.path.join(self.job_dir(name), 'job.json'), 'w', encoding='utf-8') as f:
+            json.dump(state, f)
+
+    def submit(self, manifest_path, model, display_name):
+        name = f"batches/local-{uuid.uuid4().hex[:12]}"
+        os.makedirs(self.job_dir(name))
+        shutil.copyfile(manifest_path, os.path.join(self.job_dir(name), 'input.jsonl'))
+        self.write_state(name, {'state': 'JOB_STATE_PENDING', 'model': model, 'display_name': display_name,
+                                'created': time.time(), 'delay': self.delay})
+        return name
+
+    def status(self, name):
+        state = self.read_state(name)
+        if state['state'] == 'JOB_STATE_PENDING' and time.time() - state['created'] >= state['delay']:
+            self.run(name, state['model'])
+            state['state'] = SUCCEEDED
+            self.write_state(name, state)
+        return state['state']
+
+    def run(self, name, model):
+        """Answer every request of the job and write the output file."""
+        backend = self.backend or StubBackend(model=model)
+        job_dir = self.job_dir(name)
+        with open(os.path.join(job_dir, 'input.jsonl'), 'r', encoding='utf-8') as src, \
+                open(os.path.join(job_dir, 'output.jsonl'), 'w', encoding='utf-8') as dst:
+            for line in src:
+                entry = json.loads(line)
+                request = entry['request']
+                try:
+                    text = backend.generate(decode_contents(request), request.get('generation_config'))
+                    result = {'key': entry['key'],
+                              'response': {'candidates': [{'content': {'parts': [{'text': text}], 'role': 'model'}}]}}
+                except Exception as e:
+                    result = {'key': entry['key'], 'error': {'message': str(e)}}
+                dst.write(json.dumps(result, ensure_ascii=False) + '\n')
+
+    def results(self, name):
+        with open(os.path.join(self.job_dir(name), 'output.jsonl'), 'r', encoding='utf-8') as f:
+            for line in f:
+                yield json.loads(line)
+
+
+def open_transport(name, api_key=None, root=None, delay=0.0):
+    """Create the transport named in a batch record ('gemini' or 'local')."""
+    if name == 'local':
+        return LocalBatchTransport(root, delay=delay)
+    return GeminiBatchTransport(api_key)
@@ -0,0 +1,80 @@
+"""Micro-benchmark for response parsing.
+
+Parses a corpus of recorded model responses with the current parser and
+with the original fenced-block-only parser, and reports the parse cost
+per response and how many responses were recovered as JSON.
+
+    python benchmarks/bench_parser.py [--iterations 2000] [--verbose]
+"""
+import os
+import re
+import sys
+import json
+import time
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import response_parser  # noqa: E402
+
+CORPUS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'responses.jsonl')
+
+
+def legacy_parse_response(response_text):
+    """The parser process_image used before response_parser existed."""
+    try:
+        json_match = re.search(r'```json\n(.*?)\n```', response_text, re.DOTALL)
+        if json_match:
+            json_str = json_match.group(1)
+        else:
+            json_str = response_text
+        return json.loads(json_str)
+    except json.JSONDecodeError:
+        return {"raw_text": response_text}
+
+
+def load_corpus(path=CORPUS_PATH):
+    with open(path, 'r', encoding='utf-8') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def run(parser, corpus, iterations):
+    """Return (microseconds per response, recovered count, per-case results)."""
+    responses = [case['response'] for case in corpus]
+    start = time.perf_counter()
+    for _ in range(iterations):
+        for text in responses:
+            parser(text)
+    elapsed = time.perf_counter() - start
+    results = [parser(text) for text in responses]
+    recovered = sum(1 for result in results if response_parser.is_parsed(result))
+    return elapsed / (iterations * len(responses)) * 1e6, recovered, results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark response parsing over recorded responses')
+    parser.add_argument('--iterations', type=int, default=2000, help='Passes over the corpus')
+    parser.add_argument('--corpus', default=CORPUS_PATH, help='JSONL file with {"name", "response"} records')
+    parser.add_argument('--verbose', action='store_true', help='Show which responses each parser recovered')
+    args = parser.parse_args()
+
+    corpus = load_corpus(args.corpus)
+    backend = 'orjson' if response_parser.orjson is not None else 'json'
+    print(f"Corpus: {len(corpus)} responses, {args.iterations} iterations, JSON backend: {backend}")
+
+    parsers = (('legacy', legacy_parse_response), ('current', response_parser.parse_response))
+    per_case = {}
+    for name, func in parsers:
+        micros, recovered, results = run(func, corpus, args.iterations)
+        per_case[name] = results
+        print(f"{name:>8}: {micros:8.2f} us/response, recovered {recovered}/{len(corpus)}")
+
+    if args.verbose:
+        for index, case in enumerate(corpus):
+            marks = ' '.join('ok  ' if response_parser.is_parsed(per_case[name][index]) else 'raw '
+                             for name, _ in parsers)
+            print(f"  {marks} {case['name']}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,229 @@
+"""End-to-end benchmark of the batch pipeline against the stub backend.
+
+Generates synthetic document images (several sizes and formats), runs
+gemini.py over each corpus with the stub backend in a separate process,
+and reports images per second, time to the first written row and peak
+memory (RSS) for every scenario. Nothing is sent over the network.
+
+Results are compared with the stored baseline; the run fails (exit code
+1) when a scenario is slower or uses more memory than the baseline by
+more than the tolerance.
+
+    python benchmarks/bench_pipeline.py [--scenario NAME ...] [--tolerance 0.25]
+    python benchmarks/bench_pipeline.py --update_baseline
+"""
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import argparse
+import platform
+import tempfile
+import subprocess
+import multiprocessing
+
+from PIL import Image, ImageDraw
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+BASELINE_PATH = os.path.join(BENCH_DIR, 'data', 'baseline.json')
+RESPONSES_PATH = os.path.join(BENCH_DIR, 'data', 'responses.jsonl')
+
+# Time to first row is small and noisy; differences below this are ignored
+FIRST_ROW_SLACK_SECONDS = 0.05
+
+# Each scenario is one gemini.py run over a generated corpus
+SCENARIOS = [
+    {'name': 'small-jpeg-xlsx', 'count': 200, 'size': (850, 1100), 'format': 'JPEG', 'output': 'xlsx',
+     'latency': 0.05, 'workers': 8},
+    {'name': 'large-png-preprocess', 'count': 24, 'size': (2480, 3508), 'format': 'PNG', 'output': 'jsonl',
+     'latency': 0.05, 'workers': 8, 'preprocess': True},
+    {'name': 'multipage-tiff', 'count': 20, 'pages': 5, 'size': (1240, 1754), 'format': 'TIFF', 'output': 'csv',
+     'latency': 0.05, 'workers': 8},
+    {'name': 'webp-shapes-errors', 'count': 200, 'size': (850, 1100), 'format': 'WEBP', 'output': 'jsonl',
+     'latency': 0.05, 'workers': 8, 'responses': RESPONSES_PATH, 'error_rate': 0.05},
+    {'name': 'packed-jpeg', 'count': 200, 'size': (600, 800), 'format': 'JPEG', 'output': 'jsonl',
+     'latency': 0.05, 'workers': 8, 'pack': 8},
+]
+
+EXTENSIONS = {'JPEG': '.jpg', 'PNG': '.png', 'TIFF': '.tif', 'WEBP': '.webp'}
+
+
+# Distinct pages drawn per corpus; images reuse them with a unique label, which is much faster than drawing each one
+PAGE_POOL_SIZE = 4
+
+
+def draw_page(size, rng):
+    """A white page with lines of random words, roughly like a scanned document."""
+    image = Image.new('RGB', size, 'white')
+    draw = ImageDraw.Draw(image)
+    width, height = size
+    line_height = max(12, height // 60)
+    words_per_line = max(1, width // 70)
+    for y in range(line_height * 3, height - line_height * 2, line_height * 2):
+        line = ' '.join(''.join(rng.choice('ABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789') for _ in range(rng.randint(2, 9)))
+                        for _ in range(words_per_line))
+        draw.text((width // 12, y), line, fill=(rng.randint(0, 60),) * 3)
+    return image
+
+
+def generate_corpus(directory, scenario, seed=0):
+    """Write the scenario's synthetic images into directory; every file has different content."""
+    rng = random.Random(seed)
+    os.makedirs(directory, exist_ok=True)
+    pool = [draw_page(scenario['size'], rng) for _ in range(PAGE_POOL_SIZE)]
+    extension = EXTENSIONS[scenario['format']]
+    for index in range(scenario['count']):
+        pages = []
+        for page in range(scenario.get('pages', 1)):
+            image = pool[(index + page) % len(pool)].copy()
+            ImageDraw.Draw(image).text((scenario['size'][0] // 12, 8), f"Document {index} page {page + 1}", fill='black')
+            pages.append(image)
+        path = os.path.join(directory, f"doc{index:05d}{extension}")
+        options = {'method': 0} if scenario['format'] == 'WEBP' else {}
+        if len(pages) > 1:
+            pages[0].save(path, format=scenario['format'], save_all=True, append_images=pages[1:], **options)
+        else:
+            pages[0].save(path, format=scenario['format'], **options)
+
+
+def wait_with_rusage(process):
+    """Wait for a child process; returns its peak RSS in MB (None where the platform cannot tell)."""
+    if not hasattr(os, 'wait4'):
+        process.wait()
+        return None
+    _, status, usage = os.wait4(process.pid, 0)
+    process.returncode = os.waitstatus_to_exitcode(status) if hasattr(os, 'waitstatus_to_exitcode') else status
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    divisor = 1024 * 1024 if sys.platform == 'darwin' else 1024
+    return usage.ru_maxrss / divisor
+
+
+def run_scenario(scenario, work_dir):
+    """Run gemini.py over the scenario's corpus and return its measurements."""
+    corpus_dir = os.path.join(work_dir, 'images')
+    # Generate in a separate process: on Linux a child's peak RSS starts at the parent's size,
+    # so the images drawn here must not stay in this process
+    generator = multiprocessing.Process(target=generate_corpus, args=(corpus_dir, scenario))
+    generator.start()
+    generator.join()
+    if generator.exitcode != 0:
+        raise RuntimeError(f"Generating the {scenario['name']} corpus failed")
+    output_path = os.path.join(work_dir, 'output.' + scenario['output'])
+    metrics_path = os.path.join(work_dir, 'metrics.json')
+
+    command = [sys.executable, os.path.join(REPO_DIR, 'gemini.py'),
+               '--photo_dir', corpus_dir, '--output_path', output_path, '--metrics_path', metrics_path,
+               '--backend', 'stub', '--no_cache', '--max_retries', '0',
+               '--stub_latency', str(scenario.get('latency', 0.0)),
+               '--stub_error_rate', str(scenario.get('error_rate', 0.0)),
+               '--workers', str(scenario.get('workers', 4)),
+               '--pack', str(scenario.get('pack', 1))]
+    if scenario.get('responses'):
+        command += ['--stub_responses', scenario['responses']]
+    if scenario.get('preprocess'):
+        command.append('--preprocess')
+
+    start = time.perf_counter()
+    process = subprocess.Popen(command, cwd=REPO_DIR, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+    output = process.stdout.read()
+    peak_rss_mb = wait_with_rusage(process)
+    wall = time.perf_counter() - start
+    if process.returncode != 0:
+        raise RuntimeError(f"{scenario['name']} failed:\n{output.decode('utf-8', 'replace')}")
+
+    with open(metrics_path, 'r', encoding='utf-8') as f:
+        report = json.load(f)
+    counters = report['counters']
+    return {
+        'images': counters.get('images', 0),
+        'errors': counters.get('errors', 0),
+        'images_per_second': round(report['images_per_second'], 2),
+        'time_to_first_row_seconds': round(report['time_to_first_row_seconds'] or 0.0, 3),
+        'process_seconds': round(wall, 3),
+        'peak_rss_mb': round(peak_rss_mb, 1) if peak_rss_mb is not None else None,
+    }
+
+
+def regressions(result, baseline, tolerance):
+    """Describe how result is worse than baseline by more than tolerance (a fraction)."""
+    found = []
+    if result['images_per_second'] < baseline['images_per_second'] * (1 - tolerance):
+        found.append(f"images/s {result['images_per_second']} < {baseline['images_per_second']}")
+    if (result['time_to_first_row_seconds'] > baseline['time_to_first_row_seconds'] * (1 + tolerance)
+            + FIRST_ROW_SLACK_SECONDS):
+        found.append(f"first row {result['time_to_first_row_seconds']}s > {baseline['time_to_first_row_seconds']}s")
+    if (result['peak_rss_mb'] is not None and baseline.get('peak_rss_mb') is not None
+            and result['peak_rss_mb'] > baseline['peak_rss_mb'] * (1 + tolerance)):
+        found.append(f"peak RSS {result['peak_rss_mb']} MB > {baseline['peak_rss_mb']} MB")
+    if result['images'] != baseline['images']:
+        found.append(f"images {result['images']} != {baseline['images']}")
+    return found
+
+
+def load_baseline(path):
+    if not os.path.exists(path):
+        return {}
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f).get('scenarios', {})
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the OCR pipeline end to end with the stub backend')
+    parser.add_argument('--scenario', action='append', help='Run only this scenario (repeatable)')
+    parser.add_argument('--list', action='store_true', help='List the scenarios and exit')
+    parser.add_argument('--baseline', default=BASELINE_PATH, help='Baseline results file')
+    parser.add_argument('--update_baseline', action='store_true', help='Store the results as the new baseline')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='Allowed regression as a fraction of the baseline')
+    parser.add_argument('--keep', action='store_true', help='Keep the generated corpora and outputs')
+    args = parser.parse_args()
+
+    if args.list:
+        for scenario in SCENARIOS:
+            print(scenario['name'])
+        return 0
+
+    scenarios = [scenario for scenario in SCENARIOS if not args.scenario or scenario['name'] in args.scenario]
+    unknown = set(args.scenario or ()) - {scenario['name'] for scenario in scenarios}
+    if unknown:
+        parser.error(f"unknown scenario: {', '.join(sorted(unknown))}")
+
+    baseline = load_baseline(args.baseline)
+    work_root = tempfile.mkdtemp(prefix='gemini_ocr_bench_')
+    results = {}
+    failed = False
+    print(f"{'scenario':<22} {'images':>6} {'errors':>6} {'images/s':>9} {'first row':>9} {'peak RSS':>9}")
+    try:
+        for scenario in scenarios:
+            result = run_scenario(scenario, os.path.join(work_root, scenario['name']))
+            results[scenario['name']] = result
+            rss = f"{result['peak_rss_mb']:.0f} MB" if result['peak_rss_mb'] is not None else 'n/a'
+            print(f"{scenario['name']:<22} {result['images']:>6} {result['errors']:>6} "
+                  f"{result['images_per_second']:>9.1f} {result['time_to_first_row_seconds']:>8.3f}s {rss:>9}")
+            if not args.update_baseline and scenario['name'] in baseline:
+                for problem in regressions(result, baseline[scenario['name']], args.tolerance):
+                    print(f"  REGRESSION: {problem}")
+                    failed = True
+    finally:
+        if args.keep:
+            print(f"Corpora and outputs kept in {work_root}")
+        else:
+            shutil.rmtree(work_root, ignore_errors=True)
+
+    if args.update_baseline:
+        stored = load_baseline(args.baseline)
+        stored.update(results)
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump({'python': platform.python_version(), 'platform': platform.platform(),
+                       'scenarios': stored}, f, indent=2)
+            f.write('\n')
+        print(f"Baseline saved to {args.baseline}")
+    elif not baseline:
+        print(f"No baseline at {args.baseline}; run with --update_baseline to create one")
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,86 @@
+"""Startup benchmark: module import time and CLI cold start.
+
+Imports gemini (and gemini_gui, when PyQt5 is installed) in a fresh
+interpreter with -X importtime, and reports the total import time and the
+packages that take the longest, with their own import time summed per
+top-level package. Also times `gemini.py --help` end to end.
+
+    python benchmarks/bench_startup.py [--runs 5] [--top 10] [--max_ms 500]
+
+With --max_ms the run fails (exit code 1) when importing gemini takes
+longer, so a heavy import slipping back into the hot path is caught.
+"""
+import os
+import sys
+import time
+import argparse
+import statistics
+import subprocess
+import importlib.util
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def import_times(module):
+    """Import module in a fresh interpreter; returns (total microseconds, {top-level package: self microseconds})."""
+    completed = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+                               cwd=REPO_DIR, capture_output=True, text=True)
+    if completed.returncode != 0:
+        raise RuntimeError(f"Importing {module} failed:\n{completed.stderr}")
+
+    total = None
+    packages = {}
+    for line in completed.stderr.splitlines():
+        # import time: self [us] | cumulative | imported package
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        name = name.strip()
+        package = name.split('.')[0]
+        packages[package] = packages.get(package, 0) + int(self_us)
+        if name == module:
+            total = int(cumulative_us)
+    return total, packages
+
+
+def command_time(command, runs):
+    """Median wall time in seconds of running command."""
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run(command, cwd=REPO_DIR, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True)
+        times.append(time.perf_counter() - start)
+    return statistics.median(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure import time and CLI cold start')
+    parser.add_argument('--runs', type=int, default=5, help='Runs per measurement (the median is reported)')
+    parser.add_argument('--top', type=int, default=10, help='Slowest packages to list per module')
+    parser.add_argument('--max_ms', type=float, help='Fail when importing gemini takes longer than this')
+    args = parser.parse_args()
+
+    modules = ['gemini']
+    if importlib.util.find_spec('PyQt5') is not None:
+        modules.append('gemini_gui')
+
+    failed = False
+    for module in modules:
+        runs = [import_times(module) for _ in range(args.runs)]
+        total_ms = statistics.median(total for total, _ in runs) / 1000
+        print(f"import {module}: {total_ms:.0f} ms")
+        # Slowest packages of the median run
+        _, packages = sorted(runs, key=lambda run: run[0])[len(runs) // 2]
+        for package, self_us in sorted(packages.items(), key=lambda item: -item[1])[:args.top]:
+            print(f"  {package:<28} {self_us / 1000:8.1f} ms")
+        if module == 'gemini' and args.max_ms is not None and total_ms > args.max_ms:
+            print(f"  SLOW: over the {args.max_ms:g} ms budget")
+            failed = True
+
+    help_time = command_time([sys.executable, os.path.join(REPO_DIR, 'gemini.py'), '--help'], args.runs)
+    print(f"gemini.py --help: {help_time * 1000:.0f} ms")
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,234 @@
+"""Accuracy versus latency of tiled processing for oversized images.
+
+Two synthetic documents, a tall receipt roll and a large drawing with
+small labels, are cut with every tile size and overlap given, the way
+ImageTiler cuts them, and the tile results are stitched with
+merge_results. For each setting the benchmark reports the fraction of
+text lines recovered exactly, the lines read twice that survived the
+merge, the number of requests, the input tokens and the latency of one
+image with the tiles sent in parallel.
+
+By default the model is simulated: every request image is scaled down to
+the service's input resolution, lines whose text ends up smaller than a
+readable size are misread, and lines cut by a tile edge are read partly
+or not at all. Request latency grows with the image size and with the
+text read. This is a model, not a measurement of the service, but it
+runs offline and exercises the real tiling and merging code. With
+--api_key the documents are rendered and sent to Gemini instead.
+
+    python benchmarks/bench_tiling.py [--tile_size 2048 ...] [--overlap 256 ...] [--workers 4]
+    python benchmarks/bench_tiling.py --api_key KEY [--model gemini-2.0-flash]
+"""
+import io
+import os
+import sys
+import math
+import time
+import random
+import argparse
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+from tiling import tile_boxes, tile_spans, merge_results, normalize, ImageTiler  # noqa: E402
+
+# Simulated service: long edge of the image the model sees, and the smallest text height it reads reliably
+MODEL_INPUT_EDGE = 3072
+READABLE_TEXT_PX = 10
+
+# Simulated request latency: fixed cost, per input megapixel and per output character
+BASE_SECONDS = 0.8
+SECONDS_PER_MEGAPIXEL = 0.15
+SECONDS_PER_CHAR = 0.002
+
+# Input tokens of an image: 258 per 768x768 crop the service cuts it into
+IMAGE_TOKENS = 258
+TOKEN_CROP = 768
+
+DEFAULT_TILE_SIZES = [0, 1024, 2048, 3072]  # 0 sends the image whole
+DEFAULT_OVERLAPS = [0, 128, 256]
+
+WORDS = ['TOTAL', 'ITEM', 'QTY', 'PRICE', 'TAX', 'VALVE', 'PUMP', 'DN50', 'PN16', 'STEEL', 'REV', 'NOTE']
+
+
+def receipt_layout(rng):
+    """A 1100 x 16000 px receipt roll with 14 px text."""
+    lines = []
+    for index, y in enumerate(range(60, 15900, 36)):
+        text = f"{index:04d} {rng.choice(WORDS)} {rng.choice(WORDS)} {rng.randint(1, 999)}.{rng.randint(0, 99):02d}"
+        lines.append((text, (40, y, 40 + len(text) * 14, y + 14)))
+    return (1100, 16000), lines
+
+
+def drawing_layout(rng):
+    """A 9000 x 6000 px drawing with short 12 px labels scattered over a grid."""
+    lines = []
+    for row in range(40):
+        for column in range(12):
+            if rng.random() < 0.5:
+                continue
+            text = f"{rng.choice(WORDS)}-{row:02d}{column:02d} {rng.randint(10, 99)}"
+            x = column * 740 + rng.randint(20, 200)
+            y = row * 148 + rng.randint(10, 100)
+            lines.append((text, (x, y, x + len(text) * 12, y + 12)))
+    return (9000, 6000), lines
+
+
+DOCUMENTS = {'receipt': receipt_layout, 'drawing': drawing_layout}
+
+
+def misread(text, rate, rng):
+    return ''.join(rng.choice('#?') if char != ' ' and rng.random() < rate else char for char in text)
+
+
+def simulate_read(lines, box, rng):
+    """Lines the simulated model reads from the part of the page inside box; returns (lines read, seconds)."""
+    left, top, right, bottom = box
+    width, height = right - left, bottom - top
+    scale = min(1.0, MODEL_INPUT_EDGE / max(width, height))
+    read = []
+    for text, (x0, y0, x1, y1) in lines:
+        if x1 <= left or x0 >= right or y1 <= top or y0 >= bottom:
+            continue
+        text_height = (y1 - y0) * scale
+        rate = 0.0 if text_height >= READABLE_TEXT_PX else min(1.0, (READABLE_TEXT_PX - text_height) / 4)
+        visible_height = (min(y1, bottom) - max(y0, top)) / (y1 - y0)
+        if visible_height < 1:
+            # Cut by the top or bottom edge: mostly unreadable
+            if visible_height < 0.6 or rng.random() < 0.5:
+                continue
+            rate = max(rate, 0.3)
+        if x0 < left or x1 > right:
+            # Cut by a side edge: only the visible characters
+            first = max(0, math.ceil((left - x0) / (x1 - x0) * len(text)))
+            last = min(len(text), int((right - x0) / (x1 - x0) * len(text)))
+            text = text[first:last]
+            if not text.strip():
+                continue
+        read.append(misread(text, rate, rng))
+    pixels = width * height * scale * scale
+    seconds = BASE_SECONDS + pixels / 1e6 * SECONDS_PER_MEGAPIXEL + sum(map(len, read)) * SECONDS_PER_CHAR
+    return read, seconds
+
+
+def image_tokens(width, height):
+    scale = min(1.0, MODEL_INPUT_EDGE / max(width, height))
+    return IMAGE_TOKENS * math.ceil(width * scale / TOKEN_CROP) * math.ceil(height * scale / TOKEN_CROP)
+
+
+def parallel_seconds(durations, workers):
+    """Wall time of running durations, in order, on workers threads."""
+    finish = [0.0] * max(1, workers)
+    for duration in durations:
+        slot = finish.index(min(finish))
+        finish[slot] += duration
+    return max(finish)
+
+
+def score(truth, merged_lines):
+    """(fraction of truth lines read exactly, lines left over after matching, i.e. duplicates and misreads)."""
+    remaining = {}
+    for text, _ in truth:
+        key = normalize(text)
+        remaining[key] = remaining.get(key, 0) + 1
+    found = 0
+    extra = 0
+    for line in merged_lines:
+        key = normalize(line)
+        if remaining.get(key):
+            remaining[key] -= 1
+            found += 1
+        else:
+            extra += 1
+    return found / len(truth), extra
+
+
+def run_simulated(size, lines, tile_size, overlap, workers, seed):
+    rng = random.Random(seed)
+    width, height = size
+    if tile_size and max(size) > tile_size:
+        boxes = tile_boxes(width, height, tile_size, overlap)
+        columns = len(tile_spans(width, tile_size, overlap))
+    else:
+        boxes = [(0, 0, width, height)]
+        columns = 1
+    results = []
+    durations = []
+    tokens = 0
+    for box in boxes:
+        read, seconds = simulate_read(lines, box, rng)
+        results.append({'lines': read})
+        durations.append(seconds)
+        tokens += image_tokens(box[2] - box[0], box[3] - box[1])
+    merged = merge_results(results, columns).get('lines', [])
+    accuracy, extra = score(lines, merged)
+    return {'requests': len(boxes), 'accuracy': accuracy, 'extra': extra, 'tokens': tokens,
+            'seconds': parallel_seconds(durations, workers)}
+
+
+def render(size, lines):
+    """Draw the layout as a PNG."""
+    from PIL import Image, ImageDraw, ImageFont
+    image = Image.new('L', size, 255)
+    draw = ImageDraw.Draw(image)
+    fonts = {}
+    for text, (x0, y0, x1, y1) in lines:
+        height = y1 - y0
+        if height not in fonts:
+            fonts[height] = ImageFont.load_default(size=height)
+        draw.text((x0, y0), text, fill=0, font=fonts[height])
+    output = io.BytesIO()
+    image.save(output, format='PNG')
+    return output.getvalue()
+
+
+def run_api(client_options, image_bytes, lines, tile_size, overlap, workers):
+    from ocr_client import OcrClient, GeminiBackend
+    from image_input import ImageJob
+    tiler = ImageTiler(tile_size, overlap, workers) if tile_size else None
+    client = OcrClient(GeminiBackend(*client_options), 'Transcribe every line of text exactly as written. '
+                       'Return {"lines": ["...", ...]} in reading order.', tiler=tiler)
+    start = time.perf_counter()
+    result = client.process_job(ImageJob('document.png', None, image_bytes))
+    seconds = time.perf_counter() - start
+    merged = result.get('lines', []) if isinstance(result, dict) else []
+    accuracy, extra = score(lines, [line for line in merged if isinstance(line, str)])
+    counters = client.metrics.report()['counters']
+    return {'requests': counters.get('requests', 0), 'accuracy': accuracy, 'extra': extra,
+            'tokens': counters.get('input_tokens', 0), 'seconds': seconds}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare tile sizes and overlaps for oversized images')
+    parser.add_argument('--document', action='append', choices=sorted(DOCUMENTS), help='Document to test (repeatable)')
+    parser.add_argument('--tile_size', type=int, action='append', help='Tile size to test, 0 for no tiling (repeatable)')
+    parser.add_argument('--overlap', type=int, action='append', help='Tile overlap to test (repeatable)')
+    parser.add_argument('--workers', type=int, default=4, help='Tiles of an image sent at once')
+    parser.add_argument('--seed', type=int, default=0, help='Seed of the synthetic documents and the simulated reader')
+    parser.add_argument('--api_key', help='Send the rendered documents to Gemini instead of simulating the model')
+    parser.add_argument('--model', default='gemini-2.0-flash', help='Gemini model name with --api_key')
+    args = parser.parse_args()
+
+    tile_sizes = args.tile_size or DEFAULT_TILE_SIZES
+    overlaps = args.overlap or DEFAULT_OVERLAPS
+    print(f"{'document':<9} {'tile':>5} {'overlap':>7} {'requests':>8} {'accuracy':>8} {'extra':>5} "
+          f"{'tokens':>7} {'seconds':>7}")
+    for name in args.document or sorted(DOCUMENTS):
+        size, lines = DOCUMENTS[name](random.Random(args.seed))
+        image_bytes = render(size, lines) if args.api_key else None
+        for tile_size in tile_sizes:
+            for overlap in (overlaps if tile_size else [0]):
+                if tile_size and overlap >= tile_size // 2:
+                    continue
+                if args.api_key:
+                    result = run_api((args.api_key, args.model), image_bytes, lines, tile_size, overlap, args.workers)
+                else:
+                    result = run_simulated(size, lines, tile_size, overlap, args.workers, args.seed)
+                print(f"{name:<9} {tile_size or 'whole':>5} {overlap:>7} {result['requests']:>8} "
+                      f"{result['accuracy']:>8.1%} {result['extra']:>5} {result['tokens']:>7} "
+                      f"{result['seconds']:>7.2f}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
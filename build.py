@@ -1,12 +1,29 @@
 import os
 import sys
 import shutil
+import argparse
 import subprocess
 from pathlib import Path
 
-def build_exe():
+# GUI에서 사용하지 않지만 의존 패키지를 통해 함께 포함되는 모듈 (실행 파일 크기와 시작 시간 감소)
+EXCLUDED_MODULES = [
+    "tkinter",
+    "IPython",       # google-generativeai가 있으면 사용하는 선택 의존성
+    "jedi",
+    "matplotlib",
+    "pandas",
+    "scipy",
+    "pytest",
+    "google.genai",  # 명령줄 일괄 작업(batch) 전용
+    "watchdog",      # 명령줄 폴더 감시(watch) 전용
+]
+
+def build_exe(onedir=False, excludes=EXCLUDED_MODULES):
     """
     PyInstaller를 사용하여 애플리케이션을 실행 파일로 빌드합니다.
+    
+    onedir이면 단일 실행 파일 대신 폴더로 빌드합니다. 실행할 때마다 임시 폴더에
+    압축을 풀지 않으므로 시작이 빠릅니다.
     """
     print("Gemini OCR 애플리케이션 빌드를 시작합니다...")
     
@@ -25,17 +42,19 @@ def build_exe():
         "pyinstaller",
         "--name=GeminiOCR",
         "--windowed",  # GUI 애플리케이션
-        "--onefile",   # 단일 실행 파일로 패키징
+        "--onedir" if onedir else "--onefile",  # 폴더 또는 단일 실행 파일로 패키징
         "--icon=NONE", # 아이콘 없음 (필요시 아이콘 파일 경로로 변경)
         "--add-data=README.md;.",  # 사용설명서 포함
-        "gemini_gui.py"  # 메인 스크립트
     ]
+    pyinstaller_cmd += [f"--exclude-module={module}" for module in excludes]
+    pyinstaller_cmd.append("gemini_gui.py")  # 메인 스크립트
     
     # PyInstaller 실행
     try:
         subprocess.run(pyinstaller_cmd, check=True)
         print("빌드가 성공적으로 완료되었습니다!")
-        print(f"실행 파일 위치: {os.path.abspath(os.path.join(dist_dir, 'GeminiOCR.exe'))}")
+        exe_dir = os.path.join(dist_dir, "GeminiOCR") if onedir else dist_dir
+        print(f"실행 파일 위치: {os.path.abspath(os.path.join(exe_dir, 'GeminiOCR.exe'))}")
     except subprocess.CalledProcessError as e:
         print(f"빌드 중 오류가 발생했습니다: {e}")
         return False
@@ -43,4 +62,11 @@ def build_exe():
     return True
 
 if __name__ == "__main__":
-    build_exe()
+    parser = argparse.ArgumentParser(description="Gemini OCR 실행 파일 빌드")
+    parser.add_argument("--onedir", action="store_true", help="단일 실행 파일 대신 폴더로 빌드 (시작이 빠름)")
+    parser.add_argument("--exclude_module", action="append", default=[], help="추가로 제외할 모듈 (여러 번 지정 가능)")
+    parser.add_argument("--no_default_excludes", action="store_true", help="기본 제외 모듈 목록을 사용하지 않음")
+    args = parser.parse_args()
+    
+    excludes = ([] if args.no_default_excludes else EXCLUDED_MODULES) + args.exclude_module
+    build_exe(args.onedir, excludes)
@@ -3,6 +3,8 @@ import json
 import configparser
 from pathlib import Path
 
+from key_pool import parse_key_pool, format_key_pool
+
 class Config:
     def __init__(self):
         self.config_dir = os.path.join(os.path.expanduser("~"), ".gemini_ocr")
@@ -22,12 +24,29 @@ class Config:
             self.config.read(self.config_file, encoding='utf-8')
         else:
             # 기본 설정 생성
-            self.config['API'] = {'api_key': ''}
+            self.config['API'] = {'api_key': '', 'api_keys': ''}
             self.config['SETTINGS'] = {
                 'model': 'gemini-2.0-flash',
+                'cascade': 'false',
+                'cascade_model': 'gemini-2.0-pro',
                 'last_photo_dir': '',
                 'last_output_path': '',
-                'last_prompt_file': ''
+                'last_prompt_file': '',
+                'last_schema_file': '',
+                'workers': '4',
+                'use_cache': 'true',
+                'preprocess': 'false',
+                'max_edge': '2048',
+                'jpeg_quality': '85',
+                'grayscale': 'false',
+                'tile': 'false',
+                'tile_size': '2048',
+                'tile_overlap': '256',
+                'prompt_cache': 'false',
+                'prompt_cache_ttl': '600',
+                'rpm': '0',
+                'tpm': '0',
+                'pack_size': '1'
             }
             self.save_config()
 
@@ -45,6 +64,15 @@ class Config:
         self.config['API']['api_key'] = api_key
         self.save_config()
 
+    def get_api_keys(self):
+        """API 키 풀을 가져옵니다. 키마다 분당 요청/토큰 제한이 있는 KeySpec 목록입니다. (비어 있으면 api_key 하나만 사용)"""
+        return parse_key_pool(self.config.get('API', 'api_keys', fallback=''))
+
+    def set_api_keys(self, keys):
+        """API 키 풀을 설정합니다. 한 줄에 키 하나와 선택적인 rpm=N tpm=N으로 저장됩니다."""
+        self.config['API']['api_keys'] = format_key_pool(keys)
+        self.save_config()
+
     def get_model(self):
         """모델 이름을 가져옵니다."""
         return self.config.get('SETTINGS', 'model', fallback='gemini-2.0-flash')
@@ -54,6 +82,24 @@ class Config:
         self.config['SETTINGS']['model'] = model
         self.save_config()
 
+    def get_cascade(self):
+        """결과가 올바르지 않을 때 상위 모델로 다시 요청할지 여부를 가져옵니다."""
+        return self.config.getboolean('SETTINGS', 'cascade', fallback=False)
+
+    def set_cascade(self, cascade):
+        """결과가 올바르지 않을 때 상위 모델로 다시 요청할지 여부를 설정합니다."""
+        self.config['SETTINGS']['cascade'] = 'true' if cascade else 'false'
+        self.save_config()
+
+    def get_cascade_model(self):
+        """다시 요청할 상위 모델 이름을 가져옵니다."""
+        return self.config.get('SETTINGS', 'cascade_model', fallback='gemini-2.0-pro')
+
+    def set_cascade_model(self, model):
+        """다시 요청할 상위 모델 이름을 설정합니다."""
+        self.config['SETTINGS']['cascade_model'] = model
+        self.save_config()
+
     def get_last_photo_dir(self):
         """마지막으로 사용한 사진 디렉토리를 가져옵니다."""
         return self.config.get('SETTINGS', 'last_photo_dir', fallback='')
@@ -80,3 +126,158 @@ class Config:
         """마지막으로 사용한 프롬프트 파일을 설정합니다."""
         self.config['SETTINGS']['last_prompt_file'] = path
         self.save_config()
+
+    def get_last_schema_file(self):
+        """마지막으로 사용한 출력 스키마 파일을 가져옵니다."""
+        return self.config.get('SETTINGS', 'last_schema_file', fallback='')
+
+    def set_last_schema_file(self, path):
+        """마지막으로 사용한 출력 스키마 파일을 설정합니다."""
+        self.config['SETTINGS']['last_schema_file'] = path
+        self.save_config()
+
+    def get_workers(self):
+        """동시에 처리할 이미지 수를 가져옵니다."""
+        return self.config.getint('SETTINGS', 'workers', fallback=4)
+
+    def set_workers(self, workers):
+        """동시에 처리할 이미지 수를 설정합니다."""
+        self.config['SETTINGS']['workers'] = str(workers)
+        self.save_config()
+
+    def get_cache_path(self):
+        """결과 캐시 데이터베이스 경로를 가져옵니다."""
+        return os.path.join(self.config_dir, "cache.sqlite")
+
+    def get_use_cache(self):
+        """결과 캐시 사용 여부를 가져옵니다."""
+        return self.config.getboolean('SETTINGS', 'use_cache', fallback=True)
+
+    def set_use_cache(self, use_cache):
+        """결과 캐시 사용 여부를 설정합니다."""
+        self.config['SETTINGS']['use_cache'] = 'true' if use_cache else 'false'
+        self.save_config()
+
+    def get_preprocess(self):
+        """업로드 전 이미지 축소 사용 여부를 가져옵니다."""
+        return self.config.getboolean('SETTINGS', 'preprocess', fallback=False)
+
+    def set_preprocess(self, preprocess):
+        """업로드 전 이미지 축소 사용 여부를 설정합니다."""
+        self.config['SETTINGS']['preprocess'] = 'true' if preprocess else 'false'
+        self.save_config()
+
+    def get_max_edge(self):
+        """축소 시 이미지 긴 변의 최대 픽셀 수를 가져옵니다."""
+        return self.config.getint('SETTINGS', 'max_edge', fallback=2048)
+
+    def set_max_edge(self, max_edge):
+        """축소 시 이미지 긴 변의 최대 픽셀 수를 설정합니다."""
+        self.config['SETTINGS']['max_edge'] = str(max_edge)
+        self.save_config()
+
+    def get_jpeg_quality(self):
+        """재인코딩 JPEG 품질을 가져옵니다."""
+        return self.config.getint('SETTINGS', 'jpeg_quality', fallback=85)
+
+    def set_jpeg_quality(self, quality):
+        """재인코딩 JPEG 품질을 설정합니다."""
+        self.config['SETTINGS']['jpeg_quality'] = str(quality)
+        self.save_config()
+
+    def get_grayscale(self):
+        """흑백 변환 여부를 가져옵니다."""
+        return self.config.getboolean('SETTINGS', 'grayscale', fallback=False)
+
+    def set_grayscale(self, grayscale):
+        """흑백 변환 여부를 설정합니다."""
+        self.config['SETTINGS']['grayscale'] = 'true' if grayscale else 'false'
+        self.save_config()
+
+    def get_tile(self):
+        """큰 이미지를 겹치는 타일로 나누어 처리할지 여부를 가져옵니다."""
+        return self.config.getboolean('SETTINGS', 'tile', fallback=False)
+
+    def set_tile(self, tile):
+        """큰 이미지를 겹치는 타일로 나누어 처리할지 여부를 설정합니다."""
+        self.config['SETTINGS']['tile'] = 'true' if tile else 'false'
+        self.save_config()
+
+    def get_tile_size(self):
+        """타일 한 변의 최대 픽셀 수를 가져옵니다."""
+        return self.config.getint('SETTINGS', 'tile_size', fallback=2048)
+
+    def set_tile_size(self, tile_size):
+        """타일 한 변의 최대 픽셀 수를 설정합니다."""
+        self.config['SETTINGS']['tile_size'] = str(tile_size)
+        self.save_config()
+
+    def get_tile_overlap(self):
+        """이웃한 타일이 겹치는 픽셀 수를 가져옵니다."""
+        return self.config.getint('SETTINGS', 'tile_overlap', fallback=256)
+
+    def set_tile_overlap(self, overlap):
+        """이웃한 타일이 겹치는 픽셀 수를 설정합니다."""
+        self.config['SETTINGS']['tile_overlap'] = str(overlap)
+        self.save_config()
+
+    def get_prompt_cache(self):
+        """프롬프트를 컨텍스트 캐시에 한 번 저장하고 모든 요청에서 참조할지 여부를 가져옵니다."""
+        return self.config.getboolean('SETTINGS', 'prompt_cache', fallback=False)
+
+    def set_prompt_cache(self, prompt_cache):
+        """프롬프트를 컨텍스트 캐시에 한 번 저장하고 모든 요청에서 참조할지 여부를 설정합니다."""
+        self.config['SETTINGS']['prompt_cache'] = 'true' if prompt_cache else 'false'
+        self.save_config()
+
+    def get_prompt_cache_ttl(self):
+        """캐시된 프롬프트를 사용하지 않아도 유지하는 시간(초)을 가져옵니다."""
+        return self.config.getint('SETTINGS', 'prompt_cache_ttl', fallback=600)
+
+    def set_prompt_cache_ttl(self, ttl):
+        """캐시된 프롬프트를 사용하지 않아도 유지하는 시간(초)을 설정합니다."""
+        self.config['SETTINGS']['prompt_cache_ttl'] = str(ttl)
+        self.save_config()
+
+    def get_rpm(self):
+        """분당 최대 요청 수를 가져옵니다. (0은 제한 없음)"""
+        return self.config.getint('SETTINGS', 'rpm', fallback=0)
+
+    def set_rpm(self, rpm):
+        """분당 최대 요청 수를 설정합니다."""
+        self.config['SETTINGS']['rpm'] = str(rpm)
+        self.save_config()
+
+    def get_tpm(self):
+        """분당 최대 입력 토큰 수를 가져옵니다. (0은 제한 없음)"""
+        return self.config.getint('SETTINGS', 'tpm', fallback=0)
+
+    def set_tpm(self, tpm):
+        """분당 최대 입력 토큰 수를 설정합니다."""
+        self.config['SETTINGS']['tpm'] = str(tpm)
+        self.save_config()
+
+    def get_pack_size(self):
+        """한 번의 요청에 함께 보낼 이미지 수를 가져옵니다. (1은 묶지 않음)"""
+        return self.config.getint('SETTINGS', 'pack_size', fallback=1)
+
+    def set_pack_size(self, pack_size):
+        """한 번의 요청에 함께 보낼 이미지 수를 설정합니다."""
+        self.config['SETTINGS']['pack_size'] = str(pack_size)
+        self.save_config()
+
+    def get_last_run_file(self):
+        """마지막 실행 정보 파일 경로를 가져옵니다."""
+        return os.path.join(self.config_dir, "last_run.json")
+
+    def save_last_run(self, run):
+        """이어하기를 위해 마지막 실행 정보(이미지 목록, 출력 경로, 모델, 프롬프트)를 저장합니다."""
+        with open(self.get_last_run_file(), 'w', encoding='utf-8') as f:
+            json.dump(run, f, ensure_ascii=False)
+
+    def load_last_run(self):
+        """마지막 실행 정보를 가져옵니다. 없으면 None을 반환합니다."""
+        if not os.path.exists(self.get_last_run_file()):
+            return None
+        with open(self.get_last_run_file(), 'r', encoding='utf-8') as f:
+            return json.load(f)
@@ -1,14 +1,33 @@
 import os
+import sys
+import time
+import signal
+import socket
 import argparse
-import pandas as pd
-from PIL import Image
-import io
-import base64
-import glob
+import itertools
+from datetime import datetime
 import json
-import requests
-from google.oauth2 import service_account
-import google.generativeai as genai
+
+from batch import iter_batch, BatchControl, DEFAULT_WORKERS
+from ocr_client import OcrClient, GeminiBackend, StubBackend, DEFAULT_PROMPT, build_prompt
+from response_parser import parse_response
+from result_cache import ResultCache, DEFAULT_MAX_BYTES
+from image_input import ImageJob, IMAGE_EXTENSIONS, expand_jobs, iter_jobs
+from scanner import FolderScanner
+from journal import Journal, default_journal_path, job_key
+from rate_limit import RequestScheduler, RetryPolicy, DEFAULT_MAX_RETRIES
+from key_pool import KeyPool, KeySpec, read_key_pool, parse_key_pool, format_key_pool
+from sinks import open_sink, JsonlSink
+from output_schema import OutputSchema
+from packing import DEFAULT_PACK_SIZE, DEFAULT_PACK_BYTES, pack_jobs
+from preprocess import ImagePreprocessor, DEFAULT_MAX_EDGE, DEFAULT_JPEG_QUALITY, format_bytes
+from tiling import ImageTiler, DEFAULT_TILE_SIZE, DEFAULT_TILE_OVERLAP
+from prompt_cache import PromptCache, DEFAULT_PROMPT_CACHE_TTL
+from config import Config
+from metrics import Metrics
+import batch_job
+import watcher
+import shard
 
 def read_prompt_file(prompt_file):
     """Read the prompt from the specified file."""
@@ -19,121 +38,737 @@ def read_prompt_file(prompt_file):
         print(f"Error reading prompt file: {e}")
         return None
 
+def read_stub_responses(responses_file):
+    """Read the response texts for the stub backend from a JSONL file of {"response": ...} records."""
+    with open(responses_file, 'r', encoding='utf-8') as f:
+        return [json.loads(line)['response'] for line in f if line.strip()]
+
+def create_client(api_key, model, custom_prompt, backend='gemini', stub_latency=0.0, stub_responses=None,
+                  stub_error_rate=0.0, api_keys=None, cascade=None, **options):
+    """Create the OCR client shared by every image of a run.
+
+    With api_keys (a list of KeySpec), requests are spread over a KeyPool
+    of those keys; the scheduler option then only sets the pool's retry
+    policy and concurrency, and each key gets its own rate limits.
+    With cascade (names of stronger models), unusable results of model are
+    sent again to each of them in turn.
+    With a prompt_cache option, every backend (one per model and key)
+    sends the shared prompt as cached content.
+    Extra keyword options (cache, preprocessor, scheduler, schema, tiler, prompt_cache) are passed on to OcrClient.
+    """
+    prompt_cache = options.get('prompt_cache')
+
+    def make_backend(key, model):
+        if backend == 'stub':
+            instance = StubBackend(latency=stub_latency, model=model, responses=stub_responses,
+                                   error_rate=stub_error_rate)
+        else:
+            instance = GeminiBackend(key, model)
+        return prompt_cache.wrap(instance) if prompt_cache is not None else instance
+
+    def make_tier(model):
+        if api_keys:
+            # Quotas are per model, so every model gets its own pool of the keys
+            return KeyPool(api_keys, lambda key: make_backend(key, model), scheduler.concurrency.maximum,
+                           scheduler.retry_policy)
+        return make_backend(api_key, model)
+
+    if api_keys:
+        scheduler = options.pop('scheduler', None) or RequestScheduler()
+    tiers = [make_tier(name) for name in [model] + list(cascade or [])]
+    return OcrClient(tiers[0], custom_prompt, cascade=tiers[1:], **options)
+
 def process_image(image_path, api_key, model, custom_prompt):
-    """Process a single image using Gemini API."""
+    """Process a single image using Gemini API.
+
+    Convenience wrapper for one-off calls; batches should create a client
+    once with create_client and reuse it.
+    """
+    return create_client(api_key, model, custom_prompt).process_job(ImageJob(image_path))
+
+def tag_result(result, job):
+    """Attach the source image file name (and page, for multi-page files) to a result row."""
+    if not isinstance(result, dict):
+        result = {'error': 'Unexpected result format'}
+    result['image_file'] = os.path.basename(job.path)
+    if job.page is not None:
+        result['page'] = job.page
+    return result
+
+def parse_date(text):
+    """argparse type for dates such as 2024-01-31 or 2024-01-31T12:00; returns a timestamp."""
     try:
-        # Configure the API
-        genai.configure(api_key=api_key)
-        
-        # Open and encode the image
-        with open(image_path, 'rb') as f:
-            image_bytes = f.read()
-        
-        # Get the model
-        model_instance = genai.GenerativeModel(model)
-        
-        # Create a prompt that includes OCR instructions and any custom prompt
-        prompt = f"""
-        Please perform OCR on this image. 
-        
-        {custom_prompt}
-        
-        Return the results in a structured JSON format that can be converted to Excel.
-        """
-        
-        # Generate content
-        response = model_instance.generate_content([prompt, {"mime_type": "image/jpeg", "data": image_bytes}])
-        
-        # Extract the response text
-        response_text = response.text
-        
-        # Try to parse the response as JSON
+        return datetime.fromisoformat(text).timestamp()
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid date: {text!r} (expected YYYY-MM-DD)")
+
+def add_scan_arguments(parser):
+    """Options selecting which files under --photo_dir are processed."""
+    parser.add_argument('--photo_dir', default='Photo', help='Directory containing photos')
+    parser.add_argument('--recursive', action='store_true', help='Also scan subdirectories of --photo_dir')
+    parser.add_argument('--include', action='append', default=[], help='Only process files matching this glob (repeatable)')
+    parser.add_argument('--exclude', action='append', default=[], help='Skip files and directories matching this glob (repeatable)')
+    parser.add_argument('--min_size', type=int, default=0, help='Skip files smaller than this many bytes')
+    parser.add_argument('--max_size', type=int, help='Skip files larger than this many bytes')
+    parser.add_argument('--modified_after', type=parse_date, help='Only process files modified on or after this date')
+    parser.add_argument('--modified_before', type=parse_date, help='Only process files modified before this date')
+    parser.add_argument('--dedup', action='store_true', help='Skip files whose content duplicates an earlier file')
+
+def create_scanner(args):
+    return FolderScanner(args.photo_dir, args.recursive, args.include, args.exclude, args.min_size, args.max_size,
+                         args.modified_after, args.modified_before, args.dedup)
+
+def iter_results(jobs, process, workers=DEFAULT_WORKERS, progress_callback=None, control=None):
+    """Process image jobs concurrently with process(job).
+
+    Yields (job, row) pairs in the same order as jobs. An optional
+    BatchControl pauses or cancels processing.
+    """
+    def run(job):
+        return job, tag_result(process(job), job)
+
+    for _, result in iter_batch(jobs, run, workers, progress_callback, control):
+        yield result
+
+def iter_rows(jobs, process, workers=DEFAULT_WORKERS, progress_callback=None, journal=None, resume=False,
+              process_pack=None, pack_size=1, pack_bytes=DEFAULT_PACK_BYTES, control=None):
+    """Process jobs with a checkpoint journal and yield the rows for all jobs in order.
+
+    Every completed job is recorded in the journal. With resume, jobs that
+    are already in the journal are not processed again; their rows are read
+    back from it, so the output covers the whole run.
+
+    With process_pack and a pack_size above 1, jobs are grouped into packs
+    of up to pack_size images and pack_bytes bytes, and each pack is
+    processed with one process_pack(jobs) call that returns a result per job.
+
+    An optional BatchControl pauses or cancels processing; after a cancel
+    only the rows of the jobs that were started are yielded, and the rest
+    can be processed later with resume.
+    """
+    done = journal.load() if journal is not None and resume else {}
+    if done:
+        print(f"Resuming: {len(done)} images already processed.")
+
+    # Progress is reported in images, also when several images share a request
+    try:
+        total = len(jobs)
+    except TypeError:
+        total = None
+    report = (lambda completed, _: progress_callback(completed, total)) if progress_callback else None
+
+    def is_done(job):
+        return job_key(job) in done
+
+    def run(group):
+        rows = [journal.read(done[job_key(job)]) if is_done(job) else None for job in group]
+        new = [index for index, row in enumerate(rows) if row is None]
+        if len(new) > 1:
+            results = process_pack([group[index] for index in new])
+        else:
+            results = [process(group[index]) for index in new]
+        for index, result in zip(new, results):
+            rows[index] = tag_result(result, group[index])
+        return [(job, row, index in new) for index, (job, row) in enumerate(zip(group, rows))]
+
+    if process_pack is not None and pack_size > 1:
+        groups = pack_jobs(jobs, pack_size, pack_bytes, skip=is_done)
+    else:
+        groups = ([job] for job in jobs)
+
+    if journal is not None:
+        journal.open(resume)
+    try:
+        for _, results in iter_batch(groups, run, workers, report, control, weight=len):
+            for job, row, is_new in results:
+                if is_new and journal is not None:
+                    journal.write(job, row)
+                yield row
+    finally:
+        if journal is not None:
+            journal.close()
+
+def write_rows(rows, output_path, columns=None, metrics=None):
+    """Stream rows into the output file and return the number of rows written.
+
+    The time spent writing each row is recorded in metrics, if given.
+    """
+    metrics = metrics or Metrics()
+    sink = open_sink(output_path, columns)
+    try:
+        for row in rows:
+            with metrics.span('write'):
+                sink.write(row)
+            metrics.row_written()
+    finally:
+        sink.close()
+    return sink.rows
+
+def load_output_schema(parser, schema_file):
+    """Load the output schema given on the command line, exiting with a usage error if it is invalid."""
+    if not schema_file:
+        return None
+    try:
+        return OutputSchema.from_file(schema_file)
+    except (OSError, ValueError) as e:
+        parser.error(f"Couldn't load schema file {schema_file}: {e}")
+
+def batch_submit(args, parser):
+    """Build the request manifest from the images and submit it as one batch job."""
+    custom_prompt = read_prompt_file(args.prompt_file) or DEFAULT_PROMPT
+    schema = load_output_schema(parser, args.schema_file)
+
+    scanner = create_scanner(args)
+    jobs = expand_jobs(scanner)
+    print(scanner.summary())
+    if not jobs:
+        print(f"No image files found in directory: {args.photo_dir}")
+        return
+
+    preprocessor = None
+    if args.preprocess:
+        preprocessor = ImagePreprocessor(args.max_edge, args.jpeg_quality, args.grayscale)
+
+    manifest_path = batch_job.default_manifest_path(args.output_path)
+    errors = batch_job.build_manifest(jobs, manifest_path, build_prompt(custom_prompt), preprocessor,
+                                      schema.generation_config() if schema else None)
+    print(f"Wrote {len(jobs) - len(errors)} requests to {manifest_path}")
+
+    transport = open_batch_transport(args)
+    name = transport.submit(manifest_path, args.model, os.path.basename(args.output_path))
+    batch_job.save_record(args.batch_file or batch_job.default_record_path(args.output_path), {
+        'name': name,
+        'transport': args.transport,
+        'model': args.model,
+        'schema': schema.schema if schema else None,
+        'jobs': [[job.path, job.page] for job in jobs],
+        'errors': errors,
+    })
+    print(f"Submitted batch job {name}")
+
+def batch_status(args, parser):
+    """Print the state of the submitted batch job."""
+    record = batch_job.load_record(args.batch_file or batch_job.default_record_path(args.output_path))
+    state = open_batch_transport(args, record['transport']).status(record['name'])
+    print(f"{record['name']}: {state}")
+
+def batch_collect(args, parser):
+    """Wait for the batch job if asked to, then write its results like a normal run."""
+    record = batch_job.load_record(args.batch_file or batch_job.default_record_path(args.output_path))
+    transport = open_batch_transport(args, record['transport'])
+    state = transport.status(record['name'])
+    while args.wait and state not in batch_job.FINISHED_STATES:
+        print(f"{record['name']}: {state}, checking again in {args.poll_interval} seconds")
+        time.sleep(args.poll_interval)
+        state = transport.status(record['name'])
+    if state not in batch_job.COLLECTABLE_STATES:
+        print(f"{record['name']}: {state}, no results to collect")
+        return
+
+    responses = {}
+    for entry in transport.results(record['name']):
         try:
-            # Find JSON in the response (sometimes the model wraps JSON in markdown code blocks)
-            import re
-            json_match = re.search(r'```json\n(.*?)\n```', response_text, re.DOTALL)
-            if json_match:
-                json_str = json_match.group(1)
+            responses[entry['key']] = batch_job.response_text(entry)
+        except ValueError as e:
+            responses[entry['key']] = e
+
+    schema = OutputSchema(record['schema']) if record['schema'] else None
+
+    def rows():
+        for path, page in record['jobs']:
+            job = ImageJob(path, page)
+            key = job_key(job)
+            response = responses.get(key)
+            if key in record['errors']:
+                result = {'error': record['errors'][key]}
+            elif response is None:
+                result = {'error': 'No result in the batch output'}
+            elif isinstance(response, Exception):
+                result = {'error': str(response)}
             else:
-                json_str = response_text
-            
-            data = json.loads(json_str)
-            return data
-        except json.JSONDecodeError:
-            # If the response is not valid JSON, just return the raw text
-            return {"raw_text": response_text}
-            
-    except Exception as e:
-        print(f"Error processing image {image_path}: {e}")
-        return {"error": str(e)}
+                result = parse_response(response)
+                if schema is not None:
+                    result = schema.to_row(result)
+            yield tag_result(result, job)
 
-def main():
-    # Set up argument parser
-    parser = argparse.ArgumentParser(description='Process images using Google Gemini API and convert to Excel')
-    parser.add_argument('--api_key', required=True, help='Google API Key')
+    row_count = write_rows(rows(), args.output_path, schema.row_columns if schema else None)
+    print(f"Results saved to {args.output_path} ({row_count} rows)")
+
+def open_batch_transport(args, name=None):
+    root = os.path.join(Config().config_dir, 'batches')
+    return batch_job.open_transport(name or args.transport, args.api_key, root, args.local_delay)
+
+def batch_main(argv):
+    """gemini.py batch submit|status|collect: run a job through the asynchronous batch API."""
+    parser = argparse.ArgumentParser(prog='gemini.py batch',
+                                     description='Process images as an asynchronous batch job (cheaper, not interactive)')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    submit = commands.add_parser('submit', help='Build the request manifest and submit it as a batch job')
+    add_scan_arguments(submit)
+    submit.add_argument('--model', default='gemini-2.0-flash', help='Gemini model name')
+    submit.add_argument('--prompt_file', default='prompt.txt', help='File containing custom prompt')
+    submit.add_argument('--schema_file', help='JSON Schema file for structured output with fixed columns')
+    submit.add_argument('--transport', choices=['gemini', 'local'], default='gemini', help='Batch service (local is a file-based mock)')
+    submit.add_argument('--preprocess', action='store_true', help='Downscale and re-encode images as JPEG before upload')
+    submit.add_argument('--max_edge', type=int, default=DEFAULT_MAX_EDGE, help='Maximum long edge in pixels when preprocessing')
+    submit.add_argument('--jpeg_quality', type=int, default=DEFAULT_JPEG_QUALITY, help='JPEG quality (1-95) when preprocessing')
+    submit.add_argument('--grayscale', action='store_true', help='Convert images to grayscale when preprocessing')
+    submit.set_defaults(func=batch_submit)
+
+    status = commands.add_parser('status', help='Show the state of the submitted batch job')
+    status.set_defaults(func=batch_status)
+
+    collect = commands.add_parser('collect', help='Write the results of a finished batch job to the output file')
+    collect.add_argument('--wait', action='store_true', help='Poll until the job has finished')
+    collect.add_argument('--poll_interval', type=float, default=batch_job.DEFAULT_POLL_INTERVAL, help='Seconds between status checks')
+    collect.set_defaults(func=batch_collect)
+
+    for command in (submit, status, collect):
+        command.add_argument('--api_key', help='Google API Key')
+        command.add_argument('--output_path', default='output.xlsx', help='Output file path (.xlsx, .csv, .jsonl or .parquet)')
+        command.add_argument('--batch_file', help='Batch record file (default: <output_path>.batch.json)')
+        command.add_argument('--local_delay', type=float, default=0.0, help='Seconds the local mock keeps a job pending')
+
+    args = parser.parse_args(argv)
+    if getattr(args, 'transport', None) == 'gemini' and not args.api_key:
+        parser.error('--api_key is required for the gemini transport')
+    args.func(args, parser)
+
+def shard_init(args, parser):
+    """Add the scanned images to the shared work queue (run once, or again to add new images)."""
+    queue = shard.WorkQueue(args.queue_path or shard.default_queue_path(args.output_path))
+    scanner = create_scanner(args)
+    added = queue.add(iter_jobs(scanner))
+    print(scanner.summary())
+    print(f"Added {added} images to {queue.path}")
+    print(queue.summary())
+    queue.close()
+
+def shard_work(args, parser):
+    """Claim images from the shared work queue and process them until none are left."""
+    worker = args.worker_id or f"{socket.gethostname()}-{os.getpid()}"
+    queue = shard.WorkQueue(args.queue_path or shard.default_queue_path(args.output_path),
+                            args.lease_seconds, args.max_attempts)
+    output_path = os.path.abspath(shard.worker_output_path(args.output_path, worker))
+    queue.register(worker, output_path)
+    client = client_from_args(args, parser)
+
+    # Results go to a per-worker file in the journal format; merge combines them
+    journal = Journal(output_path)
+    journal.open(resume=True)
+    heartbeat = shard.Heartbeat(queue, worker, args.lease_seconds / 3)
+    heartbeat.start()
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    print(f"Worker {worker} processing {queue.path}, writing to {output_path}")
+
+    processed = 0
+    try:
+        while True:
+            claimed = queue.claim(worker, args.claim_size)
+            if not claimed:
+                if queue.is_finished():
+                    break
+                # Other workers hold the remaining images; their leases may still expire
+                print(f"{queue.summary()}; checking again in {args.idle_interval:g} seconds")
+                time.sleep(args.idle_interval)
+                continue
+            jobs = [job for _, job in claimed]
+            for (item_id, _), (job, row) in zip(claimed, iter_results(jobs, client.process_job, args.workers)):
+                with client.metrics.span('write'):
+                    journal.write(job, row)
+                client.metrics.row_written()
+                # A failed image goes back to the queue until it has used up its attempts
+                if 'error' in row:
+                    queue.fail(item_id)
+                else:
+                    queue.complete(item_id)
+                processed += 1
+            print(f"Processed {processed} images")
+    except KeyboardInterrupt:
+        print("Stopping")
+    finally:
+        heartbeat.stop()
+        # Hand back unfinished images right away instead of waiting for their leases to expire
+        queue.release(worker)
+        journal.close()
+        print(queue.summary())
+        queue.close()
+        print_client_summary(client, args.metrics_path)
+
+def shard_status(args, parser):
+    """Print the queue progress and the workers that have joined."""
+    queue = shard.WorkQueue(args.queue_path or shard.default_queue_path(args.output_path))
+    print(queue.summary())
+    now = time.time()
+    for worker, output_path, last_seen in queue.workers():
+        print(f"  {worker}: last seen {now - last_seen:.0f}s ago, results in {output_path}")
+    queue.close()
+
+def shard_merge(args, parser):
+    """Combine the results of every worker into one output file, in queue order."""
+    queue = shard.WorkQueue(args.queue_path or shard.default_queue_path(args.output_path))
+    print(queue.summary())
+    if not queue.is_finished() and not args.partial:
+        print("Images are still pending or being processed; wait for the workers or use --partial")
+        queue.close()
+        return
+    schema = load_output_schema(parser, args.schema_file)
+
+    # Index the rows of every worker by job; an image processed twice (after a lease expired or
+    # an error) is taken once, preferring a result over the error of an image that failed
+    journals = []
+    found = {}
+    failed = {}
+    for worker, output_path, _ in queue.workers():
+        if not os.path.exists(output_path):
+            print(f"Warning: results of worker {worker} not found at {output_path}")
+            continue
+        journal = Journal(output_path)
+        journals.append(journal)
+        for key, offset in journal.load().items():
+            found.setdefault(key, (journal, offset))
+        for key, offset in journal.load(include_errors=True).items():
+            failed.setdefault(key, (journal, offset))
+
+    def rows():
+        for job, state in queue.items():
+            key = job_key(job)
+            entry = found.get(key) or failed.get(key)
+            if entry is not None:
+                journal, offset = entry
+                yield journal.read(offset)
+            elif state == shard.FAILED:
+                yield tag_result({'error': f'Not processed: workers stopped {queue.max_attempts} times on this image'}, job)
+            else:
+                yield tag_result({'error': 'Not processed yet'}, job)
+
+    try:
+        row_count = write_rows(rows(), args.output_path, schema.row_columns if schema else None)
+    finally:
+        for journal in journals:
+            journal.close()
+        queue.close()
+    print(f"Results saved to {args.output_path} ({row_count} rows)")
+
+def shard_main(argv):
+    """gemini.py shard init|work|status|merge: share one run between several processes or hosts."""
+    parser = argparse.ArgumentParser(prog='gemini.py shard',
+                                     description='Process images with several workers sharing a work queue on a shared folder')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    init = commands.add_parser('init', help='Add the images of a folder to the work queue')
+    add_scan_arguments(init)
+    init.set_defaults(func=shard_init)
+
+    work = commands.add_parser('work', help='Process images from the work queue until it is empty')
+    add_client_arguments(work)
+    work.add_argument('--worker_id', help='Name of this worker (default: <host name>-<process id>)')
+    work.add_argument('--claim_size', type=int, default=32, help='Images claimed from the queue at a time')
+    work.add_argument('--lease_seconds', type=float, default=shard.DEFAULT_LEASE_SECONDS, help='Seconds without a heartbeat before claimed images go to another worker')
+    work.add_argument('--max_attempts', type=int, default=shard.DEFAULT_MAX_ATTEMPTS, help='Expired leases after which an image is given up on')
+    work.add_argument('--idle_interval', type=float, default=shard.DEFAULT_IDLE_INTERVAL, help='Seconds to wait while other workers hold the remaining images')
+    work.set_defaults(func=shard_work)
+
+    status = commands.add_parser('status', help='Show the queue progress and the workers')
+    status.set_defaults(func=shard_status)
+
+    merge = commands.add_parser('merge', help='Write the results of all workers to the output file')
+    merge.add_argument('--schema_file', help='JSON Schema file the workers used, for fixed columns')
+    merge.add_argument('--partial', action='store_true', help='Merge even if images are still pending')
+    merge.set_defaults(func=shard_merge)
+
+    for command in (init, work, status, merge):
+        command.add_argument('--output_path', default='output.xlsx', help='Output file path (.xlsx, .csv, .jsonl or .parquet)')
+        command.add_argument('--queue_path', help='Shared work queue database (default: <output_path>.shard.sqlite)')
+
+    args = parser.parse_args(argv)
+    args.func(args, parser)
+
+def add_client_arguments(parser):
+    """Options for the model, prompt, API limits, cache and preprocessing shared by every processing command."""
+    parser.add_argument('--api_key', help='Google API Key')
+    parser.add_argument('--api_keys_file', help='File with one API key per line, optionally followed by rpm=N tpm=N; requests are spread over the keys')
     parser.add_argument('--model', default='gemini-2.0-flash', help='Gemini model name')
-    parser.add_argument('--photo_dir', default='Photo', help='Directory containing photos')
-    parser.add_argument('--output_path', default='output.xlsx', help='Output Excel file path')
+    parser.add_argument('--cascade', action='append', metavar='MODEL', help='Stronger model to send an image to again when the previous model\'s result does not parse, fails the schema or is empty (repeatable, in order)')
     parser.add_argument('--prompt_file', default='prompt.txt', help='File containing custom prompt')
-    
-    args = parser.parse_args()
+    parser.add_argument('--schema_file', help='JSON Schema file for structured output with fixed columns')
+    parser.add_argument('--backend', choices=['gemini', 'stub'], default='gemini', help='Model backend (stub answers locally, for tests and benchmarks)')
+    parser.add_argument('--stub_latency', type=float, default=0.0, help='Simulated latency in seconds for the stub backend')
+    parser.add_argument('--stub_responses', help='JSONL file of {"response": ...} records the stub backend answers with in turn')
+    parser.add_argument('--stub_error_rate', type=float, default=0.0, help='Fraction of stub backend requests that fail with a transient error')
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS, help='Number of images processed concurrently')
+    parser.add_argument('--rpm', type=int, default=0, help='Maximum requests per minute (0 for unlimited)')
+    parser.add_argument('--tpm', type=int, default=0, help='Maximum input tokens per minute (0 for unlimited)')
+    parser.add_argument('--max_retries', type=int, default=DEFAULT_MAX_RETRIES, help='Retries for rate-limited and transient API errors')
+    parser.add_argument('--no_cache', '--no-cache', action='store_true', help='Do not read or write the result cache')
+    parser.add_argument('--refresh', action='store_true', help='Ignore cached results but store the new ones')
+    parser.add_argument('--cache_path', help='Result cache database (default: ~/.gemini_ocr/cache.sqlite)')
+    parser.add_argument('--cache_size_mb', type=int, default=DEFAULT_MAX_BYTES // (1024 * 1024), help='Maximum result cache size in MB')
+    parser.add_argument('--preprocess', action='store_true', help='Downscale and re-encode images as JPEG before upload')
+    parser.add_argument('--max_edge', type=int, default=DEFAULT_MAX_EDGE, help='Maximum long edge in pixels when preprocessing')
+    parser.add_argument('--jpeg_quality', type=int, default=DEFAULT_JPEG_QUALITY, help='JPEG quality (1-95) when preprocessing')
+    parser.add_argument('--grayscale', action='store_true', help='Convert images to grayscale when preprocessing')
+    parser.add_argument('--tile', action='store_true', help='Send images larger than the tile size as overlapping tiles and merge the results')
+    parser.add_argument('--tile_size', type=int, default=DEFAULT_TILE_SIZE, help='Largest tile edge in pixels when tiling')
+    parser.add_argument('--tile_overlap', type=int, default=DEFAULT_TILE_OVERLAP, help='Overlap between neighbouring tiles in pixels')
+    parser.add_argument('--prompt_cache', action='store_true', help='Store the prompt as cached content once and refer to it from every image request, instead of sending it each time')
+    parser.add_argument('--prompt_cache_ttl', type=int, default=DEFAULT_PROMPT_CACHE_TTL, help='Seconds the cached prompt is kept without use; it is extended while the run uses it')
+    parser.add_argument('--metrics_path', help='Write per-stage timings and counters here at the end (JSON, or Prometheus text for .prom)')
+
+def client_from_args(args, parser):
+    """Create the OCR client with the prompt, schema, cache, preprocessing and rate limits given on the command line."""
+    if args.backend == 'gemini' and not args.api_key and not args.api_keys_file:
+        parser.error('--api_key or --api_keys_file is required for the gemini backend')
+
+    # Keys without their own limits get --rpm and --tpm
+    api_keys = None
+    if args.api_keys_file:
+        try:
+            api_keys = read_key_pool(args.api_keys_file, args.rpm, args.tpm)
+        except (OSError, ValueError) as e:
+            parser.error(f"Cannot read the API keys file: {e}")
+        if args.api_key:
+            api_keys.insert(0, KeySpec(args.api_key, args.rpm, args.tpm))
+        if not api_keys:
+            parser.error(f"No API keys in {args.api_keys_file}")
     
     # Read the custom prompt
     custom_prompt = read_prompt_file(args.prompt_file)
     if not custom_prompt:
         print("Warning: Couldn't read custom prompt. Using default OCR instructions.")
-        custom_prompt = "Extract all text from the image and organize it into structured data."
+        custom_prompt = DEFAULT_PROMPT
+    
+    # Load the output schema for structured output
+    schema = load_output_schema(parser, args.schema_file)
+
+    cache = None
+    if not args.no_cache:
+        cache = ResultCache(args.cache_path or Config().get_cache_path(), args.cache_size_mb * 1024 * 1024,
+                            refresh=args.refresh)
+
+    preprocessor = None
+    if args.preprocess:
+        preprocessor = ImagePreprocessor(args.max_edge, args.jpeg_quality, args.grayscale)
+
+    tiler = None
+    if args.tile:
+        try:
+            tiler = ImageTiler(args.tile_size, args.tile_overlap)
+        except ValueError as e:
+            parser.error(str(e))
+
+    prompt_cache = None
+    if args.prompt_cache:
+        try:
+            prompt_cache = PromptCache(build_prompt(custom_prompt), args.prompt_cache_ttl)
+        except ValueError as e:
+            parser.error(str(e))
+
+    scheduler = RequestScheduler(args.rpm, args.tpm, args.workers, RetryPolicy(args.max_retries))
+
+    stub_responses = read_stub_responses(args.stub_responses) if args.stub_responses else None
+
+    return create_client(args.api_key, args.model, custom_prompt, args.backend, args.stub_latency,
+                         stub_responses, args.stub_error_rate, api_keys, args.cascade,
+                         cache=cache, preprocessor=preprocessor, scheduler=scheduler, schema=schema, tiler=tiler,
+                         prompt_cache=prompt_cache)
+
+def rate_limit_summary(client):
+    """Retry summary of the client's scheduler, or of its key pools (one per cascade tier) with the usage of every key."""
+    if isinstance(client.backend, KeyPool):
+        return '\n'.join(tier.summary() for tier in client.tiers)
+    return client.scheduler.summary()
+
+def print_client_summary(client, metrics_path=None):
+    """Print the cache, preprocessing, tiling, packing, cascade, prompt cache, rate limiting and timing statistics of a run.
+
+    The result cache is closed, the cached prompts are deleted and the
+    full timing report is written to metrics_path, if given.
+    """
+    client.metrics.finish()
+    if client.cache is not None:
+        print(client.cache.summary())
+        client.cache.close()
+    if client.preprocessor is not None:
+        print(client.preprocessor.summary())
+    if client.tiler is not None:
+        print(client.tiler.summary())
+    if client.pack_requests:
+        print(client.pack_summary())
+    if len(client.tiers) > 1:
+        print(client.cascade_summary())
+    if client.prompt_cache is not None:
+        client.prompt_cache.close()
+        print(client.prompt_cache.summary())
+    print(rate_limit_summary(client))
+    print(client.metrics.summary())
+    if metrics_path:
+        client.metrics.write(metrics_path)
+        print(f"Timing report saved to {metrics_path}")
+
+def watch_main(argv):
+    """gemini.py watch: keep processing files as they appear in a folder."""
+    parser = argparse.ArgumentParser(prog='gemini.py watch',
+                                     description='Watch a folder and append the results of new or changed images to a JSONL file')
+    add_scan_arguments(parser)
+    parser.add_argument('--output_path', default='output.jsonl', help='Output file (.jsonl); rows are appended')
+    add_client_arguments(parser)
+    parser.add_argument('--state_path', help='Database of processed files (default: <output_path>.watch.sqlite)')
+    parser.add_argument('--poll_interval', type=float, default=watcher.DEFAULT_POLL_INTERVAL, help='Seconds between folder scans without file system events')
+    parser.add_argument('--settle', type=float, default=watcher.DEFAULT_SETTLE, help='Seconds a file must stay unchanged before it is processed')
+    parser.add_argument('--rescan_interval', type=float, default=watcher.DEFAULT_RESCAN_INTERVAL, help='Seconds between full rescans when file system events are used')
+    parser.add_argument('--polling', action='store_true', help='Scan periodically even if file system events are available')
+    args = parser.parse_args(argv)
+    if not args.output_path.lower().endswith('.jsonl'):
+        parser.error('watch mode appends to a .jsonl output file')
+    if args.dedup:
+        parser.error('--dedup is not supported in watch mode')
+    
+    client = client_from_args(args, parser)
+    schema = client.schema
+    state = watcher.WatchState(args.state_path or watcher.default_state_path(args.output_path))
+    folder_watcher = watcher.FolderWatcher(create_scanner(args), state, args.poll_interval, args.settle,
+                                           args.rescan_interval, use_events=not args.polling)
+    sink = JsonlSink(args.output_path, schema.row_columns if schema else None, append=True)
+
+    def process_files(files):
+        """Process settled files and record each one once all its rows are written without an error.
+
+        A file with a failed row is left unrecorded, so it is processed again on a later scan.
+        """
+        current = None
+        failed = False
+        for job, row in iter_results(iter_jobs(files, args.workers), client.process_job, args.workers):
+            if job.path != current:
+                if current is not None and not failed:
+                    state.mark_processed(current, *files[current])
+                current = job.path
+                failed = False
+            failed = failed or 'error' in row
+            with client.metrics.span('write'):
+                sink.write(row)
+            client.metrics.row_written()
+        if current is not None and not failed:
+            state.mark_processed(current, *files[current])
+
+    # Stop cleanly when a service manager terminates the process
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    folder_watcher.start()
+    print(f"Watching {args.photo_dir} ({folder_watcher.mode}), appending to {args.output_path}. Press Ctrl+C to stop.")
+    try:
+        while True:
+            ready = folder_watcher.poll()
+            if ready:
+                process_files({path: (size, mtime) for path, size, mtime in ready})
+                print(f"Processed {len(ready)} files ({sink.rows} rows written since start)")
+            folder_watcher.wait()
+    except KeyboardInterrupt:
+        print("Stopped watching.")
+    finally:
+        folder_watcher.stop()
+        sink.close()
+        state.close()
+        print_client_summary(client, args.metrics_path)
+
+def serve_main(argv):
+    """gemini.py serve: expose the OCR pipeline as a local HTTP service."""
+    # asyncio and the server are only imported for this command
+    import asyncio
+    import server
+
+    parser = argparse.ArgumentParser(prog='gemini.py serve',
+                                     description='Serve OCR over HTTP with a shared client, rate limiter and job queue')
+    parser.add_argument('--host', default=server.DEFAULT_HOST, help='Address to listen on')
+    parser.add_argument('--port', type=int, default=server.DEFAULT_PORT, help='Port to listen on (0 picks a free port)')
+    parser.add_argument('--max_upload_mb', type=float, default=server.DEFAULT_MAX_UPLOAD_BYTES / (1024 * 1024), help='Largest accepted image in MB')
+    parser.add_argument('--max_results', type=int, default=server.DEFAULT_MAX_RESULTS, help='Finished jobs kept for fetching by id')
+    parser.add_argument('--max_queue', type=int, default=server.DEFAULT_MAX_QUEUED, help='Jobs allowed to wait for a worker before new images are refused with 503 (0: no limit)')
+    add_client_arguments(parser)
+    args = parser.parse_args(argv)
+
+    client = client_from_args(args, parser)
+    service = server.OcrService(lambda job: tag_result(client.process_job(job), job), args.workers, args.max_results, args.max_queue)
+
+    def stats():
+        stats = {'rate_limit': rate_limit_summary(client)}
+        if isinstance(client.backend, KeyPool):
+            stats['keys'] = {tier.model: tier.usage() for tier in client.tiers}
+        if client.cache is not None:
+            stats['cache'] = client.cache.summary()
+        return stats
+
+    http_server = server.OcrServer(service, int(args.max_upload_mb * 1024 * 1024), stats, client.metrics)
+    def report_ready(host, port):
+        print(f"Serving OCR on http://{host}:{port} (workers: {args.workers}). Press Ctrl+C to stop.")
+
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    try:
+        asyncio.run(http_server.serve(args.host, args.port, report_ready))
+    except KeyboardInterrupt:
+        print("Stopped serving.")
+    finally:
+        print_client_summary(client, args.metrics_path)
+
+def main():
+    if sys.argv[1:2] == ['serve']:
+        serve_main(sys.argv[2:])
+        return
+    if sys.argv[1:2] == ['batch']:
+        batch_main(sys.argv[2:])
+        return
+    if sys.argv[1:2] == ['watch']:
+        watch_main(sys.argv[2:])
+        return
+    if sys.argv[1:2] == ['shard']:
+        shard_main(sys.argv[2:])
+        return
+
+    # Set up argument parser
+    parser = argparse.ArgumentParser(description='Process images using Google Gemini API and convert to Excel')
+    add_scan_arguments(parser)
+    parser.add_argument('--output_path', default='output.xlsx', help='Output file path (.xlsx, .csv, .jsonl or .parquet)')
+    add_client_arguments(parser)
+    parser.add_argument('--pack', type=int, default=1, help=f'Images sent together in one request (1 disables packing; try {DEFAULT_PACK_SIZE} for small images)')
+    parser.add_argument('--pack_mb', type=float, default=DEFAULT_PACK_BYTES / (1024 * 1024), help='Maximum image megabytes in one packed request')
+    parser.add_argument('--resume', action='store_true', help='Skip images already recorded in the journal of a previous run')
+    parser.add_argument('--journal_path', help='Checkpoint journal file (default: <output_path>.journal.jsonl)')
     
-    # Get list of image files
-    image_extensions = ['*.jpg', '*.jpeg', '*.png', '*.bmp', '*.gif']
-    image_files = []
-    for ext in image_extensions:
-        image_files.extend(glob.glob(os.path.join(args.photo_dir, ext)))
+    args = parser.parse_args()
     
-    if not image_files:
+    # Scan for image files lazily, so processing starts while large folders are still being scanned.
+    # Multi-page files (TIFF, GIF, PDF) are split into one job per page.
+    scanner = create_scanner(args)
+    jobs = iter_jobs(scanner, args.workers)
+    first_job = next(jobs, None)
+    if first_job is None:
         print(f"No image files found in directory: {args.photo_dir}")
         return
+    jobs = itertools.chain([first_job], jobs)
     
-    print(f"Found {len(image_files)} image files.")
-    
-    # Process each image
-    all_results = []
-    for image_path in image_files:
-        print(f"Processing {image_path}...")
-        result = process_image(image_path, args.api_key, args.model, custom_prompt)
-        
-        # Add the image file name to the result
-        if isinstance(result, dict):
-            result['image_file'] = os.path.basename(image_path)
-            all_results.append(result)
+    # Process the images concurrently
+    def report_progress(completed, total):
+        if total is None:
+            print(f"Processed {completed} images")
         else:
-            all_results.append({
-                'image_file': os.path.basename(image_path),
-                'error': 'Unexpected result format'
-            })
+            print(f"Processed {completed}/{total} images")
+
+    client = client_from_args(args, parser)
+    schema = client.schema
+    journal = Journal(args.journal_path or default_journal_path(args.output_path))
+    rows = iter_rows(jobs, client.process_job, args.workers, report_progress, journal, args.resume,
+                     client.process_pack, args.pack, int(args.pack_mb * 1024 * 1024))
     
-    # Convert results to DataFrame
+    # Stream the results into the output file as they arrive
     try:
-        # Handle case where results have different schemas
-        if all_results:
-            df = pd.json_normalize(all_results)
-            
-            # Create the output directory if it doesn't exist
-            output_dir = os.path.dirname(args.output_path)
-            if output_dir and not os.path.exists(output_dir):
-                os.makedirs(output_dir)
-            
-            # Save to Excel
-            df.to_excel(args.output_path, index=False)
-            print(f"Results saved to {args.output_path}")
-        else:
-            print("No results to save.")
+        row_count = write_rows(rows, args.output_path, schema.row_columns if schema else None, client.metrics)
+        print(f"Results saved to {args.output_path} ({row_count} rows)")
     except Exception as e:
-        print(f"Error saving results to Excel: {e}")
-        # Save raw results as JSON as a fallback
-        with open('results.json', 'w') as f:
-            json.dump(all_results, f, indent=2)
-        print("Results saved as results.json instead.")
+        print(f"Error saving results to {args.output_path}: {e}")
+        print(f"Completed results are kept in {journal.path}")
+    
+    print(scanner.summary())
+    print_client_summary(client, args.metrics_path)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
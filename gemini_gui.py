@@ -1,80 +1,418 @@
 import os
 import sys
 import json
-import glob
+import time
 import threading
+from collections import OrderedDict
 from PyQt5.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout, QHBoxLayout, 
                             QLabel, QLineEdit, QPushButton, QTextEdit, QFileDialog, 
                             QTabWidget, QComboBox, QMessageBox, QProgressBar, QGroupBox,
-                            QRadioButton, QButtonGroup, QListWidget, QListWidgetItem, QCheckBox)
-from PyQt5.QtCore import Qt, QThread, pyqtSignal, QSize
-from PyQt5.QtGui import QIcon, QPixmap, QFont
+                            QRadioButton, QButtonGroup, QListWidget, QListWidgetItem, QCheckBox,
+                            QSpinBox, QTableView, QHeaderView, QListView,
+                            QAbstractItemView)
+from PyQt5.QtCore import (Qt, QThread, pyqtSignal, QSize, QObject, QRunnable, QThreadPool,
+                          QAbstractListModel, QAbstractTableModel, QModelIndex, QTimer)
+from PyQt5.QtGui import QIcon, QPixmap, QFont, QImageReader
 
 from config import Config
 import gemini
 
+def format_duration(seconds):
+    """초 단위 시간을 '1:02:03' 또는 '2:03' 형식으로 변환합니다."""
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    if hours:
+        return f"{hours}:{minutes:02d}:{seconds:02d}"
+    return f"{minutes}:{seconds:02d}"
+
+
 class WorkerThread(QThread):
     """백그라운드에서 OCR 처리를 수행하는 스레드"""
     progress_signal = pyqtSignal(int, int)  # 현재 처리 중인 이미지 번호, 총 이미지 수
-    result_signal = pyqtSignal(list)  # 처리 결과
+    result_signal = pyqtSignal(dict)  # 이미지 한 장의 처리 결과
     error_signal = pyqtSignal(str)  # 오류 메시지
     complete_signal = pyqtSignal(str)  # 완료 메시지
 
-    def __init__(self, api_key, model, image_paths, output_path, custom_prompt):
+    def __init__(self, api_key, model, image_paths, output_path, custom_prompt, workers=gemini.DEFAULT_WORKERS,
+                 cache_path=None, preprocessor=None, scheduler=None, resume=False, schema=None, pack_size=1,
+                 api_keys=None, tiler=None, cascade=None, prompt_cache=None):
         super().__init__()
         self.api_key = api_key
+        self.api_keys = api_keys
         self.model = model
         self.image_paths = image_paths
         self.output_path = output_path
         self.custom_prompt = custom_prompt
-        self.results = []
+        self.workers = workers
+        self.cache_path = cache_path
+        self.preprocessor = preprocessor
+        self.tiler = tiler
+        self.cascade = cascade
+        self.prompt_cache = prompt_cache
+        self.scheduler = scheduler
+        self.resume = resume
+        self.schema = schema
+        self.pack_size = pack_size
+        # 일시정지와 취소는 처리 중인 요청이 끝난 뒤 적용됨
+        self.control = gemini.BatchControl()
 
     def run(self):
         try:
-            total_images = len(self.image_paths)
+            # 캐시 경로가 지정된 경우 이전에 처리한 이미지는 API를 다시 호출하지 않음
+            cache = gemini.ResultCache(self.cache_path) if self.cache_path else None
             
-            for i, image_path in enumerate(self.image_paths):
-                # 진행 상황 업데이트
-                self.progress_signal.emit(i + 1, total_images)
-                
-                # 이미지 처리
-                result = gemini.process_image(image_path, self.api_key, self.model, self.custom_prompt)
-                
-                # 결과에 이미지 파일 이름 추가
-                if isinstance(result, dict):
-                    result['image_file'] = os.path.basename(image_path)
-                    self.results.append(result)
-                else:
-                    self.results.append({
-                        'image_file': os.path.basename(image_path),
-                        'error': 'Unexpected result format'
-                    })
+            # 이미지를 동시에 처리하고, 한 장이 끝날 때마다 진행 상황을 업데이트
+            # 처리된 결과는 저널에 바로 기록되어, 중단되더라도 이어서 처리할 수 있음
+            client = gemini.create_client(self.api_key, self.model, self.custom_prompt, cache=cache,
+                                          preprocessor=self.preprocessor, scheduler=self.scheduler,
+                                          schema=self.schema, api_keys=self.api_keys, tiler=self.tiler,
+                                          cascade=self.cascade, prompt_cache=self.prompt_cache)
+            jobs = gemini.expand_jobs(self.image_paths, self.workers)
+            journal = gemini.Journal(gemini.default_journal_path(self.output_path))
+            rows = gemini.iter_rows(jobs, client.process_job, self.workers,
+                                    self.progress_signal.emit, journal, self.resume,
+                                    client.process_pack, self.pack_size, control=self.control)
             
-            # 결과를 DataFrame으로 변환하고 Excel로 저장
-            import pandas as pd
-            df = pd.json_normalize(self.results)
+            # 결과를 모아두지 않고 도착하는 대로 출력 파일에 기록
+            # 스키마를 사용하면 스키마의 필드가 고정된 열이 됨
+            sink = gemini.open_sink(self.output_path, self.schema.row_columns if self.schema else None)
+            try:
+                for row in rows:
+                    with client.metrics.span('write'):
+                        sink.write(row)
+                    client.metrics.row_written()
+                    self.result_signal.emit(row)
+            finally:
+                sink.close()
+            client.metrics.finish()
             
-            # 출력 디렉토리가 없으면 생성
-            output_dir = os.path.dirname(self.output_path)
-            if output_dir and not os.path.exists(output_dir):
-                os.makedirs(output_dir)
+            if self.control.cancelled:
+                # 취소된 경우에도 그때까지 처리된 결과는 출력 파일과 저널에 남음
+                message = (f"처리가 취소되었습니다. 그때까지 처리된 결과가 {self.output_path}에 저장되었습니다.\n"
+                           "'이전 작업 이어하기'로 남은 이미지를 처리할 수 있습니다.")
+            else:
+                message = f"처리가 완료되었습니다. 결과가 {self.output_path}에 저장되었습니다."
+            if cache is not None:
+                message += f"\n캐시 적중: {cache.hits}개, 신규 처리: {cache.misses}개"
+                cache.close()
+            if self.preprocessor is not None:
+                saved = self.preprocessor.bytes_in - self.preprocessor.bytes_out
+                message += f"\n이미지 축소로 절약한 전송량: {gemini.format_bytes(saved)}"
+            if self.prompt_cache is not None:
+                # 작업이 끝나면 캐시된 프롬프트를 삭제하여 보관 비용이 들지 않게 함
+                self.prompt_cache.close()
+                counters = self.prompt_cache.counters
+                message += (f"\n프롬프트 캐시: 요청 {counters['hits']}회에 캐시된 프롬프트 사용, "
+                            f"{counters['inline']}회는 프롬프트를 함께 전송")
+            if self.tiler is not None and self.tiler.images:
+                message += f"\n타일 분할: 이미지 {self.tiler.images}장을 {self.tiler.tiles}개 타일로 나누어 처리"
+            # 키 풀을 사용하면 재시도는 풀(모델마다 하나)에서 처리되고, 키별 사용량을 함께 표시
+            pools = client.tiers if isinstance(client.backend, gemini.KeyPool) else []
+            retriers = pools or ([self.scheduler] if self.scheduler is not None else [])
+            retries = sum(retrier.retries for retrier in retriers)
+            if retries:
+                message += f"\n재시도: {retries}회 (할당량 초과 {sum(retrier.throttled for retrier in retriers)}회)"
+            for pool in pools:
+                message += f"\nAPI 키별 사용량 ({pool.model}):"
+                for usage in pool.usage():
+                    message += (f"\n  {usage['key']}: 요청 {usage['requests']}회, "
+                                f"토큰 입력 {usage['input_tokens']} / 출력 {usage['output_tokens']}")
+                    if usage['throttled'] or usage['rejected']:
+                        message += f", 할당량 초과 {usage['throttled']}회, 키 거부 {usage['rejected']}회"
+                    if usage['benchings']:
+                        message += f", 일시 제외 {usage['benchings']}회"
+            if len(client.tiers) > 1:
+                # 모델 단계별로 처리를 마친 이미지 수와 응답 시간
+                report = client.metrics.report()
+                message += "\n모델 단계별 결과:"
+                for tier, backend in enumerate(client.tiers, 1):
+                    message += (f"\n  {backend.model}: 완료 {report['counters'].get(f'tier{tier}_finished', 0)}장, "
+                                f"상위 모델로 재요청 {report['counters'].get(f'tier{tier}_escalated', 0)}장")
+                    latency = report['stages'].get(f'tier{tier}')
+                    if latency:
+                        message += f" (p50 {latency['p50_seconds']:.2f}초, p95 {latency['p95_seconds']:.2f}초)"
+            if client.pack_requests:
+                message += f"\n묶음 요청: {client.pack_requests}회 (개별 요청으로 다시 처리 {client.pack_fallbacks}회)"
             
-            # Excel로 저장
-            df.to_excel(self.output_path, index=False)
+            # 처리 속도와 API 응답 시간 요약
+            report = client.metrics.report()
+            message += f"\n처리 속도: 초당 {report['images_per_second']:.2f}장 (총 {report['wall_seconds']:.1f}초)"
+            api = report['stages'].get('api')
+            if api and api['count']:
+                message += (f"\nAPI 응답 시간: p50 {api['p50_seconds']:.2f}초, "
+                            f"p95 {api['p95_seconds']:.2f}초, p99 {api['p99_seconds']:.2f}초")
+            counters = report['counters']
+            if counters.get('input_tokens') or counters.get('output_tokens'):
+                message += f"\n토큰: 입력 {counters.get('input_tokens', 0)}, 출력 {counters.get('output_tokens', 0)}"
+                if counters.get('cached_tokens'):
+                    message += f" (입력 중 캐시 {counters['cached_tokens']})"
             
-            # 결과 신호 발생
-            self.result_signal.emit(self.results)
-            self.complete_signal.emit(f"처리가 완료되었습니다. 결과가 {self.output_path}에 저장되었습니다.")
+            self.complete_signal.emit(message)
             
         except Exception as e:
+            if self.prompt_cache is not None:
+                self.prompt_cache.close()
             self.error_signal.emit(f"오류 발생: {str(e)}")
 
 
+# 목록에 표시하는 썸네일 크기와 메모리에 유지하는 썸네일 수
+THUMBNAIL_SIZE = 48
+THUMBNAIL_CACHE_SIZE = 2000
+
+# 폴더 검색 결과를 목록에 한 번에 추가하는 단위
+SCAN_CHUNK_SIZE = 2000
+
+# 결과 표에 모아 둔 행을 추가하는 간격(밀리초)과 표에 유지하는 최대 행 수
+# (전체 결과는 출력 파일에 저장되므로, 표에는 최근 결과만 남김)
+RESULT_FLUSH_MS = 200
+RESULT_TABLE_MAX_ROWS = 10000
+
+
+class ScanThread(QThread):
+    """폴더를 백그라운드에서 검색하여 찾은 이미지 경로를 묶음 단위로 전달하는 스레드"""
+    paths_signal = pyqtSignal(list)  # 찾은 이미지 경로 묶음
+    done_signal = pyqtSignal(int)  # 찾은 이미지 수
+
+    def __init__(self, folder, recursive):
+        super().__init__()
+        self.folder = folder
+        self.recursive = recursive
+        self.stopped = False
+
+    def stop(self):
+        """검색을 중단합니다. 중단되면 완료 신호를 보내지 않습니다."""
+        self.stopped = True
+
+    def run(self):
+        found = 0
+        chunk = []
+        for path in gemini.FolderScanner(self.folder, recursive=self.recursive):
+            if self.stopped:
+                return
+            chunk.append(path)
+            if len(chunk) >= SCAN_CHUNK_SIZE:
+                self.paths_signal.emit(chunk)
+                found += len(chunk)
+                chunk = []
+        if chunk:
+            self.paths_signal.emit(chunk)
+            found += len(chunk)
+        self.done_signal.emit(found)
+
+
+class ThumbnailSignals(QObject):
+    loaded = pyqtSignal(str, object)  # 이미지 경로, 축소된 QImage (읽을 수 없으면 None)
+
+
+class ThumbnailTask(QRunnable):
+    """이미지 한 장을 썸네일 크기로 축소하여 읽는 작업"""
+
+    def __init__(self, path, signals):
+        super().__init__()
+        self.path = path
+        self.signals = signals
+
+    def run(self):
+        reader = QImageReader(self.path)
+        reader.setAutoTransform(True)
+        size = reader.size()
+        if size.isValid():
+            # 원본 전체를 디코딩하지 않고 축소된 크기로 바로 읽음
+            reader.setScaledSize(size.scaled(THUMBNAIL_SIZE, THUMBNAIL_SIZE, Qt.KeepAspectRatio))
+        image = reader.read()
+        self.signals.loaded.emit(self.path, None if image.isNull() else image)
+
+
+class ImageListModel(QAbstractListModel):
+    """선택된 이미지 목록 모델.
+
+    경로는 추가된 순서의 리스트와 경로 -> 행 번호 사전에 함께 보관하여,
+    중복 확인과 행 찾기가 목록 크기와 관계없이 빠릅니다. 썸네일은 화면에
+    보이는 행에 대해서만 백그라운드 스레드 풀에서 읽고, 최근에 사용한
+    썸네일만 LRU 캐시에 유지합니다.
+    """
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.paths = []
+        self.rows = {}  # 경로 -> 행 번호
+        self.thumbnails = OrderedDict()  # 경로 -> QPixmap (없으면 None), 최근에 사용한 순서
+        self.loading = set()
+        self.load_order = 0
+        self.pool = QThreadPool()
+        self.pool.setMaxThreadCount(2)
+        self.signals = ThumbnailSignals()
+        self.signals.loaded.connect(self.thumbnail_loaded)
+        self.placeholder = QPixmap(THUMBNAIL_SIZE, THUMBNAIL_SIZE)
+        self.placeholder.fill(Qt.transparent)
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.paths)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        path = self.paths[index.row()]
+        if role == Qt.DisplayRole:
+            return os.path.basename(path)
+        if role == Qt.ToolTipRole:
+            return path
+        if role == Qt.DecorationRole:
+            return self.thumbnail(path)
+        return None
+
+    def add_paths(self, paths):
+        """목록에 없는 경로만 끝에 한 번에 추가하고, 추가된 수를 반환합니다."""
+        new = [path for path in dict.fromkeys(paths) if path not in self.rows]
+        if not new:
+            return 0
+        first = len(self.paths)
+        self.beginInsertRows(QModelIndex(), first, first + len(new) - 1)
+        self.paths.extend(new)
+        for row, path in enumerate(new, first):
+            self.rows[path] = row
+        self.endInsertRows()
+        return len(new)
+
+    def remove_rows(self, rows):
+        """지정한 행들을 한 번에 제거합니다."""
+        rows = sorted(set(rows))
+        if not rows:
+            return
+        if rows[-1] - rows[0] + 1 == len(rows):
+            # 연속된 행은 해당 구간만 제거
+            self.beginRemoveRows(QModelIndex(), rows[0], rows[-1])
+            del self.paths[rows[0]:rows[-1] + 1]
+            self.endRemoveRows()
+        else:
+            removed = set(rows)
+            self.beginResetModel()
+            self.paths = [path for row, path in enumerate(self.paths) if row not in removed]
+            self.endResetModel()
+        self.rows = {path: row for row, path in enumerate(self.paths)}
+
+    def set_paths(self, paths):
+        self.beginResetModel()
+        self.paths = list(dict.fromkeys(paths))
+        self.rows = {path: row for row, path in enumerate(self.paths)}
+        self.endResetModel()
+
+    def clear(self):
+        self.set_paths([])
+
+    def thumbnail(self, path):
+        """캐시된 썸네일을 반환하고, 없으면 백그라운드에서 읽기 시작합니다."""
+        if path in self.thumbnails:
+            self.thumbnails.move_to_end(path)
+            return self.thumbnails[path] or self.placeholder
+        if path not in self.loading:
+            self.loading.add(path)
+            # 가장 최근에 요청한 (현재 화면에 보이는) 썸네일부터 읽음
+            self.load_order += 1
+            self.pool.start(ThumbnailTask(path, self.signals), self.load_order)
+        return self.placeholder
+
+    def thumbnail_loaded(self, path, image):
+        self.loading.discard(path)
+        self.thumbnails[path] = QPixmap.fromImage(image) if image is not None else None
+        while len(self.thumbnails) > THUMBNAIL_CACHE_SIZE:
+            self.thumbnails.popitem(last=False)
+        row = self.rows.get(path)
+        if row is not None:
+            index = self.index(row)
+            self.dataChanged.emit(index, index, [Qt.DecorationRole])
+
+
+class ResultTableModel(QAbstractTableModel):
+    """처리 결과 표 모델.
+
+    결과는 도착할 때마다 버퍼에 모아 두었다가 flush()에서 한 번에 추가하므로,
+    결과가 많아도 UI 스레드가 행마다 표를 갱신하지 않습니다. 처음 보는 필드는
+    새 열로 추가되고(이미지 파일 이름이 첫 번째 열), 표에는 최근
+    RESULT_TABLE_MAX_ROWS개의 행만 유지합니다.
+    """
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.columns = []
+        self.rows = []
+        self.pending = []
+        self.first_number = 1  # 표의 첫 행이 전체 결과 중 몇 번째인지
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.rows)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.columns)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid() or role != Qt.DisplayRole:
+            return None
+        value = self.rows[index.row()].get(self.columns[index.column()])
+        if value is None:
+            return None
+        if isinstance(value, (dict, list)):
+            return json.dumps(value, ensure_ascii=False)
+        return str(value)
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role != Qt.DisplayRole:
+            return None
+        if orientation == Qt.Horizontal:
+            return self.columns[section]
+        return str(self.first_number + section)
+
+    def add_row(self, row):
+        """결과 한 행을 버퍼에 추가합니다. flush()를 호출해야 표에 나타납니다."""
+        self.pending.append(row)
+
+    def flush(self):
+        """버퍼에 모아 둔 행을 한 번에 표에 추가하고, 오래된 행을 제거합니다."""
+        if not self.pending:
+            return
+        rows, self.pending = self.pending, []
+        new_columns = []
+        for row in rows:
+            for key in sorted(row, key=lambda key: key != 'image_file'):
+                if key not in self.columns and key not in new_columns:
+                    new_columns.append(key)
+        if new_columns:
+            first = len(self.columns)
+            self.beginInsertColumns(QModelIndex(), first, first + len(new_columns) - 1)
+            self.columns.extend(new_columns)
+            self.endInsertColumns()
+        
+        first = len(self.rows)
+        self.beginInsertRows(QModelIndex(), first, first + len(rows) - 1)
+        self.rows.extend(rows)
+        self.endInsertRows()
+        
+        excess = len(self.rows) - RESULT_TABLE_MAX_ROWS
+        if excess > 0:
+            self.beginRemoveRows(QModelIndex(), 0, excess - 1)
+            del self.rows[:excess]
+            self.first_number += excess
+            self.endRemoveRows()
+
+    def clear(self):
+        self.beginResetModel()
+        self.columns = []
+        self.rows = []
+        self.pending = []
+        self.first_number = 1
+        self.endResetModel()
+
+
 class GeminiOCRApp(QMainWindow):
     def __init__(self):
         super().__init__()
         self.config = Config()
-        self.image_paths = []
+        self.image_model = ImageListModel(self)
+        self.result_model = ResultTableModel(self)
+        self.result_timer = QTimer(self)
+        self.result_timer.setSingleShot(True)
+        self.result_timer.setInterval(RESULT_FLUSH_MS)
+        self.result_timer.timeout.connect(self.flush_results)
         self.init_ui()
         
     def init_ui(self):
@@ -138,6 +476,19 @@ class GeminiOCRApp(QMainWindow):
         self.model_combo.setCurrentText(self.config.get_model())
         model_layout.addWidget(self.model_combo)
         
+        # 모델 캐스케이드: 결과가 JSON이 아니거나 스키마에 맞지 않거나 비어 있으면 상위 모델로 다시 요청
+        self.cascade_check = QCheckBox("실패 시 상위 모델로 재요청:")
+        self.cascade_check.setChecked(self.config.get_cascade())
+        self.cascade_check.toggled.connect(self.config.set_cascade)
+        model_layout.addWidget(self.cascade_check)
+        
+        self.cascade_model_combo = QComboBox()
+        self.cascade_model_combo.setEditable(True)
+        self.cascade_model_combo.addItems(["gemini-2.0-pro", "gemini-1.5-pro", "gemini-2.0-flash", "gemini-1.5-flash"])
+        self.cascade_model_combo.setCurrentText(self.config.get_cascade_model())
+        self.cascade_model_combo.currentTextChanged.connect(self.config.set_cascade_model)
+        model_layout.addWidget(self.cascade_model_combo)
+        
         main_tab_layout.addWidget(model_group)
         
         # 이미지 선택 그룹
@@ -154,6 +505,10 @@ class GeminiOCRApp(QMainWindow):
         image_select_layout.addWidget(self.image_select_radio)
         image_select_layout.addWidget(self.folder_select_radio)
         
+        # 폴더 선택 시 하위 폴더까지 검색
+        self.recursive_check = QCheckBox("하위 폴더 포함")
+        image_select_layout.addWidget(self.recursive_check)
+        
         image_layout.addLayout(image_select_layout)
         
         file_select_layout = QHBoxLayout()
@@ -167,10 +522,17 @@ class GeminiOCRApp(QMainWindow):
         
         image_layout.addLayout(file_select_layout)
         
-        # 선택된 이미지 목록
-        self.image_list = QListWidget()
-        image_layout.addWidget(QLabel("선택된 이미지:"))
+        # 선택된 이미지 목록 (행 높이를 고정하여 이미지가 많아도 빠르게 표시)
+        self.image_list = QListView()
+        self.image_list.setModel(self.image_model)
+        self.image_list.setUniformItemSizes(True)
+        self.image_list.setIconSize(QSize(THUMBNAIL_SIZE, THUMBNAIL_SIZE))
+        self.image_list.setSelectionMode(QAbstractItemView.ExtendedSelection)
+        self.image_count_label = QLabel("선택된 이미지:")
+        image_layout.addWidget(self.image_count_label)
         image_layout.addWidget(self.image_list)
+        for signal in (self.image_model.rowsInserted, self.image_model.rowsRemoved, self.image_model.modelReset):
+            signal.connect(self.update_image_count)
         
         # 이미지 목록 관리 버튼
         image_btn_layout = QHBoxLayout()
@@ -244,6 +606,27 @@ class GeminiOCRApp(QMainWindow):
         
         main_tab_layout.addWidget(prompt_group)
         
+        # 출력 스키마 그룹 (구조화된 출력)
+        schema_group = QGroupBox("출력 스키마")
+        schema_layout = QVBoxLayout()
+        schema_group.setLayout(schema_layout)
+        
+        schema_option_layout = QHBoxLayout()
+        self.use_schema_check = QCheckBox("JSON 스키마로 구조화된 출력 사용")
+        self.use_schema_check.toggled.connect(self.toggle_schema_input)
+        schema_option_layout.addWidget(self.use_schema_check)
+        self.schema_file_btn = QPushButton("파일에서 불러오기")
+        self.schema_file_btn.clicked.connect(self.browse_schema_file)
+        schema_option_layout.addWidget(self.schema_file_btn)
+        schema_layout.addLayout(schema_option_layout)
+        
+        self.schema_text_edit = QTextEdit()
+        self.schema_text_edit.setPlaceholderText('{"type": "object", "properties": {"title": {"type": "string"}}}')
+        schema_layout.addWidget(self.schema_text_edit)
+        self.toggle_schema_input()
+        
+        main_tab_layout.addWidget(schema_group)
+        
         # 진행 상황 표시
         progress_layout = QHBoxLayout()
         self.progress_bar = QProgressBar()
@@ -252,13 +635,53 @@ class GeminiOCRApp(QMainWindow):
         progress_layout.addWidget(QLabel("진행 상황:"))
         progress_layout.addWidget(self.progress_bar)
         
+        # 처리량과 남은 시간
+        self.progress_label = QLabel("")
+        progress_layout.addWidget(self.progress_label)
+        
         main_tab_layout.addLayout(progress_layout)
         
+        # 결과 표 (처리가 끝난 이미지의 행이 짧은 간격으로 모아서 추가됨)
+        results_group = QGroupBox("처리 결과")
+        results_layout = QVBoxLayout()
+        results_group.setLayout(results_layout)
+        
+        self.results_table = QTableView()
+        self.results_table.setModel(self.result_model)
+        self.results_table.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        self.results_table.horizontalHeader().setSectionResizeMode(QHeaderView.Interactive)
+        self.results_table.horizontalHeader().setStretchLastSection(True)
+        results_layout.addWidget(self.results_table)
+        
+        main_tab_layout.addWidget(results_group)
+        
         # 실행 버튼
+        run_layout = QHBoxLayout()
         self.run_btn = QPushButton("OCR 처리 시작")
         self.run_btn.setMinimumHeight(40)
         self.run_btn.clicked.connect(self.run_ocr)
-        main_tab_layout.addWidget(self.run_btn)
+        run_layout.addWidget(self.run_btn)
+        
+        # 이어하기 버튼 (중단된 마지막 작업을 처리된 이미지는 건너뛰고 계속)
+        self.resume_btn = QPushButton("이전 작업 이어하기")
+        self.resume_btn.setMinimumHeight(40)
+        self.resume_btn.clicked.connect(self.resume_last_run)
+        run_layout.addWidget(self.resume_btn)
+        
+        # 일시정지/계속 및 취소 버튼 (처리 중에만 사용 가능)
+        self.pause_btn = QPushButton("일시정지")
+        self.pause_btn.setMinimumHeight(40)
+        self.pause_btn.setEnabled(False)
+        self.pause_btn.clicked.connect(self.toggle_pause)
+        run_layout.addWidget(self.pause_btn)
+        
+        self.cancel_btn = QPushButton("취소")
+        self.cancel_btn.setMinimumHeight(40)
+        self.cancel_btn.setEnabled(False)
+        self.cancel_btn.clicked.connect(self.cancel_worker)
+        run_layout.addWidget(self.cancel_btn)
+        
+        main_tab_layout.addLayout(run_layout)
         
         # ===== 설정 탭 내용 =====
         # API 키 관리
@@ -284,6 +707,19 @@ class GeminiOCRApp(QMainWindow):
         self.show_api_key_check.toggled.connect(self.toggle_api_key_visibility)
         settings_api_layout.addWidget(self.show_api_key_check)
         
+        # API 키 풀: 여러 키에 요청을 나누어 보내 할당량을 늘림
+        settings_api_layout.addWidget(QLabel("추가 API 키 (한 줄에 하나씩, 키마다 rpm=N tpm=N으로 제한 지정 가능):"))
+        self.api_keys_edit = QTextEdit()
+        self.api_keys_edit.setAcceptRichText(False)
+        self.api_keys_edit.setMaximumHeight(80)
+        self.api_keys_edit.setPlainText(gemini.format_key_pool(self.config.get_api_keys()))
+        self.api_keys_edit.setPlaceholderText("AIza... rpm=15 tpm=1000000")
+        settings_api_layout.addWidget(self.api_keys_edit)
+        
+        self.save_api_keys_btn = QPushButton("추가 API 키 저장")
+        self.save_api_keys_btn.clicked.connect(self.save_api_keys)
+        settings_api_layout.addWidget(self.save_api_keys_btn)
+        
         settings_tab_layout.addWidget(settings_api_group)
         
         # 기본 모델 설정
@@ -308,7 +744,127 @@ class GeminiOCRApp(QMainWindow):
         other_settings_layout = QVBoxLayout()
         other_settings_group.setLayout(other_settings_layout)
         
-        # 여기에 추가 설정 옵션을 넣을 수 있습니다
+        # 동시 처리 수 설정
+        workers_layout = QHBoxLayout()
+        workers_layout.addWidget(QLabel("동시 처리 이미지 수:"))
+        self.workers_spin = QSpinBox()
+        self.workers_spin.setRange(1, 32)
+        self.workers_spin.setValue(self.config.get_workers())
+        workers_layout.addWidget(self.workers_spin)
+        
+        self.settings_save_workers_btn = QPushButton("저장")
+        self.settings_save_workers_btn.clicked.connect(self.save_settings_workers)
+        workers_layout.addWidget(self.settings_save_workers_btn)
+        
+        other_settings_layout.addLayout(workers_layout)
+        
+        # 결과 캐시 사용 설정
+        self.use_cache_check = QCheckBox("결과 캐시 사용 (이미 처리한 이미지는 API를 다시 호출하지 않음)")
+        self.use_cache_check.setChecked(self.config.get_use_cache())
+        self.use_cache_check.toggled.connect(self.config.set_use_cache)
+        other_settings_layout.addWidget(self.use_cache_check)
+        
+        # 업로드 전 이미지 축소 설정
+        self.preprocess_check = QCheckBox("업로드 전 이미지 축소 및 JPEG 재인코딩")
+        self.preprocess_check.setChecked(self.config.get_preprocess())
+        self.preprocess_check.toggled.connect(self.config.set_preprocess)
+        other_settings_layout.addWidget(self.preprocess_check)
+        
+        preprocess_layout = QHBoxLayout()
+        preprocess_layout.addWidget(QLabel("긴 변 최대 픽셀:"))
+        self.max_edge_spin = QSpinBox()
+        self.max_edge_spin.setRange(256, 8192)
+        self.max_edge_spin.setSingleStep(256)
+        self.max_edge_spin.setValue(self.config.get_max_edge())
+        self.max_edge_spin.valueChanged.connect(self.config.set_max_edge)
+        preprocess_layout.addWidget(self.max_edge_spin)
+        
+        preprocess_layout.addWidget(QLabel("JPEG 품질:"))
+        self.jpeg_quality_spin = QSpinBox()
+        self.jpeg_quality_spin.setRange(30, 95)
+        self.jpeg_quality_spin.setValue(self.config.get_jpeg_quality())
+        self.jpeg_quality_spin.valueChanged.connect(self.config.set_jpeg_quality)
+        preprocess_layout.addWidget(self.jpeg_quality_spin)
+        
+        self.grayscale_check = QCheckBox("흑백 변환")
+        self.grayscale_check.setChecked(self.config.get_grayscale())
+        self.grayscale_check.toggled.connect(self.config.set_grayscale)
+        preprocess_layout.addWidget(self.grayscale_check)
+        
+        other_settings_layout.addLayout(preprocess_layout)
+        
+        # 타일 분할: 아주 긴 영수증이나 큰 도면을 겹치는 조각으로 나누어 원본 해상도로 처리
+        self.tile_check = QCheckBox("큰 이미지를 겹치는 타일로 나누어 처리")
+        self.tile_check.setChecked(self.config.get_tile())
+        self.tile_check.toggled.connect(self.config.set_tile)
+        other_settings_layout.addWidget(self.tile_check)
+        
+        tile_layout = QHBoxLayout()
+        tile_layout.addWidget(QLabel("타일 크기(픽셀):"))
+        self.tile_size_spin = QSpinBox()
+        self.tile_size_spin.setRange(512, 8192)
+        self.tile_size_spin.setSingleStep(256)
+        self.tile_size_spin.setValue(self.config.get_tile_size())
+        self.tile_size_spin.valueChanged.connect(self.config.set_tile_size)
+        tile_layout.addWidget(self.tile_size_spin)
+        
+        tile_layout.addWidget(QLabel("겹침(픽셀):"))
+        self.tile_overlap_spin = QSpinBox()
+        self.tile_overlap_spin.setRange(0, 2048)
+        self.tile_overlap_spin.setSingleStep(64)
+        self.tile_overlap_spin.setValue(self.config.get_tile_overlap())
+        self.tile_overlap_spin.valueChanged.connect(self.config.set_tile_overlap)
+        tile_layout.addWidget(self.tile_overlap_spin)
+        
+        other_settings_layout.addLayout(tile_layout)
+        
+        # 프롬프트 캐시: 긴 프롬프트를 서비스에 한 번 저장하고 이미지마다 다시 보내지 않음
+        prompt_cache_layout = QHBoxLayout()
+        self.prompt_cache_check = QCheckBox("프롬프트를 캐시에 저장하여 재사용")
+        self.prompt_cache_check.setChecked(self.config.get_prompt_cache())
+        self.prompt_cache_check.toggled.connect(self.config.set_prompt_cache)
+        prompt_cache_layout.addWidget(self.prompt_cache_check)
+        
+        prompt_cache_layout.addWidget(QLabel("유지 시간(초):"))
+        self.prompt_cache_ttl_spin = QSpinBox()
+        self.prompt_cache_ttl_spin.setRange(60, 86400)
+        self.prompt_cache_ttl_spin.setSingleStep(60)
+        self.prompt_cache_ttl_spin.setValue(self.config.get_prompt_cache_ttl())
+        self.prompt_cache_ttl_spin.valueChanged.connect(self.config.set_prompt_cache_ttl)
+        prompt_cache_layout.addWidget(self.prompt_cache_ttl_spin)
+        
+        other_settings_layout.addLayout(prompt_cache_layout)
+        
+        # API 호출 속도 제한 설정 (할당량 초과 시 자동으로 재시도하고 동시 처리 수를 줄임)
+        rate_layout = QHBoxLayout()
+        rate_layout.addWidget(QLabel("분당 최대 요청 수 (0: 제한 없음):"))
+        self.rpm_spin = QSpinBox()
+        self.rpm_spin.setRange(0, 100000)
+        self.rpm_spin.setValue(self.config.get_rpm())
+        self.rpm_spin.valueChanged.connect(self.config.set_rpm)
+        rate_layout.addWidget(self.rpm_spin)
+        
+        rate_layout.addWidget(QLabel("분당 최대 토큰 수 (0: 제한 없음):"))
+        self.tpm_spin = QSpinBox()
+        self.tpm_spin.setRange(0, 100000000)
+        self.tpm_spin.setSingleStep(10000)
+        self.tpm_spin.setValue(self.config.get_tpm())
+        self.tpm_spin.valueChanged.connect(self.config.set_tpm)
+        rate_layout.addWidget(self.tpm_spin)
+        
+        other_settings_layout.addLayout(rate_layout)
+        
+        # 작은 이미지 여러 장을 한 번의 요청으로 묶어 보내기 (요청 수 절감)
+        pack_layout = QHBoxLayout()
+        pack_layout.addWidget(QLabel("요청당 이미지 수 (1: 묶지 않음):"))
+        self.pack_size_spin = QSpinBox()
+        self.pack_size_spin.setRange(1, 32)
+        self.pack_size_spin.setValue(self.config.get_pack_size())
+        self.pack_size_spin.valueChanged.connect(self.config.set_pack_size)
+        pack_layout.addWidget(self.pack_size_spin)
+        pack_layout.addStretch()
+        
+        other_settings_layout.addLayout(pack_layout)
         
         settings_tab_layout.addWidget(other_settings_group)
         settings_tab_layout.addStretch()
@@ -345,7 +901,7 @@ class GeminiOCRApp(QMainWindow):
         
         <h3>7. 문제 해결</h3>
         <p>- API 키가 올바르지 않은 경우: API 키를 다시 확인하고 올바르게 입력했는지 확인하세요.</p>
-        <p>- 이미지 처리 오류: 지원되는 이미지 형식(JPG, JPEG, PNG, BMP, GIF)인지 확인하세요.</p>
+        <p>- 이미지 처리 오류: 지원되는 이미지 형식(JPG, JPEG, PNG, WEBP, HEIC, BMP, GIF, TIFF, PDF)인지 확인하세요.</p>
         <p>- 결과가 예상과 다른 경우: 프롬프트를 더 구체적으로 작성하여 Gemini API에게 명확한 지시를 제공하세요.</p>
         """
         
@@ -391,6 +947,16 @@ class GeminiOCRApp(QMainWindow):
         self.api_key_input.setText(api_key)
         QMessageBox.information(self, "정보", "API 키가 저장되었습니다.")
     
+    def save_api_keys(self):
+        """설정 탭에서 추가 API 키 목록을 저장합니다."""
+        try:
+            keys = gemini.parse_key_pool(self.api_keys_edit.toPlainText())
+        except ValueError as e:
+            QMessageBox.warning(self, "경고", f"API 키 목록이 올바르지 않습니다: {str(e)}")
+            return
+        self.config.set_api_keys(keys)
+        QMessageBox.information(self, "정보", f"추가 API 키 {len(keys)}개가 저장되었습니다.")
+    
     def save_settings_model(self):
         """설정 탭에서 모델 설정을 저장합니다."""
         model = self.settings_model_combo.currentText()
@@ -398,6 +964,11 @@ class GeminiOCRApp(QMainWindow):
         self.model_combo.setCurrentText(model)
         QMessageBox.information(self, "정보", "기본 모델 설정이 저장되었습니다.")
     
+    def save_settings_workers(self):
+        """설정 탭에서 동시 처리 수를 저장합니다."""
+        self.config.set_workers(self.workers_spin.value())
+        QMessageBox.information(self, "정보", "동시 처리 수 설정이 저장되었습니다.")
+    
     def browse_files(self):
         """이미지 파일 또는 폴더를 선택합니다."""
         if self.image_select_radio.isChecked():
@@ -405,18 +976,15 @@ class GeminiOCRApp(QMainWindow):
             files, _ = QFileDialog.getOpenFileNames(
                 self, "이미지 파일 선택", 
                 self.config.get_last_photo_dir(),
-                "이미지 파일 (*.jpg *.jpeg *.png *.bmp *.gif)"
+                "이미지 파일 (" + " ".join("*" + ext for ext in gemini.IMAGE_EXTENSIONS) + ")"
             )
             
             if files:
                 # 마지막 디렉토리 저장
                 self.config.set_last_photo_dir(os.path.dirname(files[0]))
                 
-                # 이미지 목록에 추가
-                for file_path in files:
-                    if file_path not in self.image_paths:
-                        self.image_paths.append(file_path)
-                        self.image_list.addItem(os.path.basename(file_path))
+                # 이미지 목록에 추가 (이미 있는 파일은 건너뜀)
+                self.image_model.add_paths(files)
                 
                 # 파일 경로 표시
                 if len(files) == 1:
@@ -434,50 +1002,38 @@ class GeminiOCRApp(QMainWindow):
                 self.config.set_last_photo_dir(folder)
                 self.file_path_input.setText(folder)
                 
-                # 폴더 내 이미지 파일 찾기
-                image_extensions = ['*.jpg', '*.jpeg', '*.png', '*.bmp', '*.gif']
-                image_files = []
-                for ext in image_extensions:
-                    image_files.extend(glob.glob(os.path.join(folder, ext)))
-                
-                # 이미지 목록에 추가
-                for file_path in image_files:
-                    if file_path not in self.image_paths:
-                        self.image_paths.append(file_path)
-                        self.image_list.addItem(os.path.basename(file_path))
-                
-                if not image_files:
-                    QMessageBox.warning(self, "경고", "선택한 폴더에 이미지 파일이 없습니다.")
+                # 폴더 내 이미지 파일을 백그라운드에서 찾아 찾는 대로 목록에 추가 (확장자 대소문자 구분 없음)
+                self.browse_btn.setEnabled(False)
+                self.scan_thread = ScanThread(folder, self.recursive_check.isChecked())
+                self.scan_thread.paths_signal.connect(self.image_model.add_paths)
+                self.scan_thread.done_signal.connect(self.scan_finished)
+                self.scan_thread.start()
+    
+    def scan_finished(self, found):
+        """폴더 검색이 끝나면 호출됩니다."""
+        self.browse_btn.setEnabled(True)
+        if not found:
+            QMessageBox.warning(self, "경고", "선택한 폴더에 이미지 파일이 없습니다.")
+    
+    def update_image_count(self):
+        self.image_count_label.setText(f"선택된 이미지: {self.image_model.rowCount()}개")
     
     def clear_images(self):
         """이미지 목록을 모두 지웁니다."""
-        self.image_paths = []
-        self.image_list.clear()
+        self.image_model.clear()
         self.file_path_input.clear()
     
     def remove_selected_image(self):
         """선택한 이미지를 목록에서 제거합니다."""
-        selected_items = self.image_list.selectedItems()
-        if not selected_items:
-            return
-        
-        for item in selected_items:
-            file_name = item.text()
-            # 파일 이름으로 전체 경로 찾기
-            for path in self.image_paths[:]:
-                if os.path.basename(path) == file_name:
-                    self.image_paths.remove(path)
-                    break
-            
-            # 목록에서 항목 제거
-            self.image_list.takeItem(self.image_list.row(item))
+        rows = [index.row() for index in self.image_list.selectionModel().selectedRows()]
+        self.image_model.remove_rows(rows)
     
     def browse_output_path(self):
         """출력 파일 경로를 선택합니다."""
         file_path, _ = QFileDialog.getSaveFileName(
             self, "출력 파일 저장", 
             self.config.get_last_output_path() or "output.xlsx",
-            "Excel 파일 (*.xlsx);;모든 파일 (*.*)"
+            "Excel 파일 (*.xlsx);;CSV 파일 (*.csv);;JSON Lines 파일 (*.jsonl);;Parquet 파일 (*.parquet);;모든 파일 (*.*)"
         )
         
         if file_path:
@@ -496,6 +1052,34 @@ class GeminiOCRApp(QMainWindow):
             self.prompt_file_input.setText(file_path)
             self.config.set_last_prompt_file(file_path)
     
+    def toggle_schema_input(self):
+        """스키마 사용 여부에 따라 스키마 입력을 활성화합니다."""
+        enabled = self.use_schema_check.isChecked()
+        self.schema_text_edit.setEnabled(enabled)
+        self.schema_file_btn.setEnabled(enabled)
+    
+    def browse_schema_file(self):
+        """출력 스키마 파일을 선택해 편집기에 불러옵니다."""
+        file_path, _ = QFileDialog.getOpenFileName(
+            self, "스키마 파일 선택", 
+            self.config.get_last_schema_file(),
+            "JSON 파일 (*.json);;모든 파일 (*.*)"
+        )
+        
+        if file_path:
+            try:
+                with open(file_path, 'r', encoding='utf-8') as f:
+                    self.schema_text_edit.setPlainText(f.read())
+                self.config.set_last_schema_file(file_path)
+            except Exception as e:
+                QMessageBox.warning(self, "경고", f"스키마 파일을 읽는 중 오류가 발생했습니다: {str(e)}")
+    
+    def get_schema(self):
+        """스키마 편집기의 내용을 불러옵니다. 사용하지 않으면 None을 반환합니다."""
+        if not self.use_schema_check.isChecked():
+            return None
+        return gemini.OutputSchema(json.loads(self.schema_text_edit.toPlainText()))
+    
     def get_prompt(self):
         """현재 설정에 따라 프롬프트를 가져옵니다."""
         if self.prompt_text_radio.isChecked():
@@ -514,14 +1098,14 @@ class GeminiOCRApp(QMainWindow):
     
     def run_ocr(self):
         """OCR 처리를 시작합니다."""
-        # API 키 확인
+        # API 키 확인 (추가 API 키만 사용할 수도 있음)
         api_key = self.api_key_input.text().strip()
-        if not api_key:
+        if not api_key and not self.config.get_api_keys():
             QMessageBox.warning(self, "경고", "API 키를 입력하세요.")
             return
         
         # 이미지 파일 확인
-        if not self.image_paths:
+        if not self.image_model.paths:
             QMessageBox.warning(self, "경고", "처리할 이미지 파일을 선택하세요.")
             return
         
@@ -537,16 +1121,92 @@ class GeminiOCRApp(QMainWindow):
         # 프롬프트 가져오기
         custom_prompt = self.get_prompt()
         
+        # 출력 스키마 확인
+        try:
+            schema = self.get_schema()
+        except ValueError as e:
+            QMessageBox.warning(self, "경고", f"출력 스키마가 올바르지 않습니다: {str(e)}")
+            return
+        
         # 설정 저장
         self.config.set_api_key(api_key)
         self.config.set_model(model)
         self.config.set_last_output_path(output_path)
         
-        # 진행 표시줄 초기화
+        # 이어하기를 위해 실행 정보 저장
+        self.config.save_last_run({
+            'image_paths': self.image_model.paths,
+            'output_path': output_path,
+            'model': model,
+            'custom_prompt': custom_prompt,
+            'schema': schema.schema if schema else None
+        })
+        
+        self.start_worker(api_key, model, output_path, custom_prompt, schema=schema)
+    
+    def resume_last_run(self):
+        """중단된 마지막 작업을 이어서 처리합니다."""
+        api_key = self.api_key_input.text().strip()
+        if not api_key and not self.config.get_api_keys():
+            QMessageBox.warning(self, "경고", "API 키를 입력하세요.")
+            return
+        
+        last_run = self.config.load_last_run()
+        if not last_run:
+            QMessageBox.warning(self, "경고", "이어서 처리할 이전 작업이 없습니다.")
+            return
+        
+        # 마지막 작업의 이미지 목록과 설정 복원
+        self.image_model.set_paths(last_run['image_paths'])
+        self.output_path_input.setText(last_run['output_path'])
+        self.model_combo.setCurrentText(last_run['model'])
+        
+        schema = gemini.OutputSchema(last_run['schema']) if last_run.get('schema') else None
+        self.start_worker(api_key, last_run['model'], last_run['output_path'], last_run['custom_prompt'],
+                          resume=True, schema=schema)
+    
+    def start_worker(self, api_key, model, output_path, custom_prompt, resume=False, schema=None):
+        """현재 설정으로 워커 스레드를 생성하고 시작합니다."""
+        # 진행 표시줄과 결과 표 초기화
         self.progress_bar.setValue(0)
+        self.progress_label.setText("")
+        self.result_timer.stop()
+        self.result_model.clear()
+        self.started_at = time.monotonic()
+        self.paused_at = None
+        self.paused_seconds = 0.0
         
         # 워커 스레드 생성 및 시작
-        self.worker = WorkerThread(api_key, model, self.image_paths, output_path, custom_prompt)
+        cache_path = self.config.get_cache_path() if self.use_cache_check.isChecked() else None
+        preprocessor = None
+        if self.preprocess_check.isChecked():
+            preprocessor = gemini.ImagePreprocessor(self.max_edge_spin.value(), self.jpeg_quality_spin.value(),
+                                                    self.grayscale_check.isChecked())
+        tiler = None
+        if self.tile_check.isChecked():
+            try:
+                tiler = gemini.ImageTiler(self.tile_size_spin.value(), self.tile_overlap_spin.value())
+            except ValueError:
+                QMessageBox.warning(self, "경고", "타일 겹침은 타일 크기의 절반보다 작아야 합니다.")
+                return
+        cascade = None
+        if self.cascade_check.isChecked() and self.cascade_model_combo.currentText().strip():
+            cascade = [self.cascade_model_combo.currentText().strip()]
+        prompt_cache = None
+        if self.prompt_cache_check.isChecked():
+            prompt_cache = gemini.PromptCache(gemini.build_prompt(custom_prompt), self.prompt_cache_ttl_spin.value())
+        scheduler = gemini.RequestScheduler(self.rpm_spin.value(), self.tpm_spin.value(), self.workers_spin.value())
+        # 추가 API 키가 있으면 기본 키와 함께 키 풀로 사용하고, 제한을 지정하지 않은 키는 위의 제한을 따름
+        api_keys = None
+        pool = self.config.get_api_keys()
+        if pool:
+            rpm, tpm = self.rpm_spin.value(), self.tpm_spin.value()
+            api_keys = [gemini.KeySpec(api_key, rpm, tpm)] if api_key else []
+            api_keys += [gemini.KeySpec(key.api_key, key.rpm or rpm, key.tpm or tpm) for key in pool]
+        # 처리 중에 목록을 바꿔도 영향이 없도록 현재 목록을 복사하여 전달
+        self.worker = WorkerThread(api_key, model, list(self.image_model.paths), output_path, custom_prompt,
+                                   self.workers_spin.value(), cache_path, preprocessor, scheduler, resume, schema,
+                                   self.pack_size_spin.value(), api_keys, tiler, cascade, prompt_cache)
         self.worker.progress_signal.connect(self.update_progress)
         self.worker.result_signal.connect(self.process_results)
         self.worker.error_signal.connect(self.show_error)
@@ -555,31 +1215,100 @@ class GeminiOCRApp(QMainWindow):
         # UI 비활성화
         self.run_btn.setEnabled(False)
         self.run_btn.setText("처리 중...")
+        self.resume_btn.setEnabled(False)
+        self.pause_btn.setEnabled(True)
+        self.pause_btn.setText("일시정지")
+        self.cancel_btn.setEnabled(True)
+        self.cancel_btn.setText("취소")
         
         # 스레드 시작
         self.worker.start()
     
+    def toggle_pause(self):
+        """처리를 일시정지하거나 다시 계속합니다."""
+        if self.paused_at is None:
+            self.worker.control.pause()
+            self.paused_at = time.monotonic()
+            self.pause_btn.setText("계속")
+            self.progress_label.setText(self.progress_label.text() + " (일시정지됨)")
+        else:
+            self.worker.control.resume()
+            self.paused_seconds += time.monotonic() - self.paused_at
+            self.paused_at = None
+            self.pause_btn.setText("일시정지")
+            self.progress_label.setText(self.progress_label.text().replace(" (일시정지됨)", ""))
+    
+    def cancel_worker(self):
+        """처리 중인 요청이 끝나면 작업을 멈추고 그때까지의 결과를 저장합니다."""
+        self.worker.control.cancel()
+        self.pause_btn.setEnabled(False)
+        self.cancel_btn.setEnabled(False)
+        self.cancel_btn.setText("취소 중...")
+    
     def update_progress(self, current, total):
-        """진행 상황을 업데이트합니다."""
-        progress = int((current / total) * 100)
+        """진행 상황과 처리량, 남은 예상 시간을 업데이트합니다."""
+        progress = int((current / total) * 100) if total else 0
         self.progress_bar.setValue(progress)
+        
+        # 일시정지된 시간은 처리량 계산에서 제외
+        elapsed = time.monotonic() - self.started_at - self.paused_seconds
+        rate = current / elapsed if elapsed > 0 else 0.0
+        text = f"{current}/{total}장, 초당 {rate:.2f}장"
+        if rate > 0 and total:
+            text += f", 남은 시간 약 {format_duration((total - current) / rate)}"
+        if self.paused_at is not None:
+            text += " (일시정지됨)"
+        self.progress_label.setText(text)
+    
+    def process_results(self, row):
+        """이미지 한 장의 처리 결과를 모아 두고, 잠시 뒤 결과 표에 한 번에 추가합니다."""
+        self.result_model.add_row(row)
+        if not self.result_timer.isActive():
+            self.result_timer.start()
+    
+    def flush_results(self):
+        """모아 둔 결과를 결과 표에 추가합니다. 표가 맨 아래에 있을 때만 새 행으로 스크롤합니다."""
+        scroll_bar = self.results_table.verticalScrollBar()
+        at_bottom = scroll_bar.value() >= scroll_bar.maximum()
+        self.result_model.flush()
+        if at_bottom:
+            self.results_table.scrollToBottom()
     
-    def process_results(self, results):
-        """처리 결과를 처리합니다."""
-        # 여기에서 결과를 처리하는 추가 로직을 구현할 수 있습니다
-        pass
+    def reset_run_buttons(self):
+        self.run_btn.setEnabled(True)
+        self.run_btn.setText("OCR 처리 시작")
+        self.resume_btn.setEnabled(True)
+        self.pause_btn.setEnabled(False)
+        self.pause_btn.setText("일시정지")
+        self.cancel_btn.setEnabled(False)
+        self.cancel_btn.setText("취소")
     
     def show_error(self, error_message):
         """오류 메시지를 표시합니다."""
+        self.flush_results()
         QMessageBox.critical(self, "오류", error_message)
-        self.run_btn.setEnabled(True)
-        self.run_btn.setText("OCR 처리 시작")
+        self.reset_run_buttons()
     
     def show_completion(self, message):
         """완료 메시지를 표시합니다."""
+        self.flush_results()
         QMessageBox.information(self, "완료", message)
-        self.run_btn.setEnabled(True)
-        self.run_btn.setText("OCR 처리 시작")
+        self.reset_run_buttons()
+    
+    def closeEvent(self, event):
+        """창을 닫으면 처리 작업과 폴더 검색을 중단하고, 백그라운드 스레드가 모두 끝날 때까지 기다립니다."""
+        worker = getattr(self, 'worker', None)
+        if worker is not None and worker.isRunning():
+            worker.control.cancel()
+            worker.wait()
+        scan_thread = getattr(self, 'scan_thread', None)
+        if scan_thread is not None and scan_thread.isRunning():
+            scan_thread.stop()
+            scan_thread.wait()
+        # 아직 시작하지 않은 썸네일 작업은 버리고, 읽는 중인 작업만 기다림
+        self.image_model.pool.clear()
+        self.image_model.pool.waitForDone()
+        event.accept()
 
 
 def main():
@@ -0,0 +1,162 @@
+import io
+from collections import namedtuple
+
+from batch import iter_batch, DEFAULT_WORKERS
+
+try:
+    import pypdfium2 as pdfium
+except ImportError:
+    pdfium = None
+
+# File extensions picked up when scanning a folder
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.gif', '.tif', '.tiff', '.webp', '.heic', '.heif', '.pdf')
+
+# Formats the Gemini API accepts as inline data; everything else is converted to PNG
+ACCEPTED_MIME_TYPES = {'image/jpeg', 'image/png', 'image/webp', 'image/heic', 'image/heif', 'application/pdf'}
+
+# Formats that can hold several pages or frames
+MULTI_PAGE_MIME_TYPES = {'image/tiff', 'image/gif', 'application/pdf'}
+
+PDF_RENDER_SCALE = 200 / 72  # render PDF pages at 200 dpi
+
+SIGNATURES = (
+    (b'\xff\xd8\xff', 'image/jpeg'),
+    (b'\x89PNG\r\n\x1a\n', 'image/png'),
+    (b'GIF87a', 'image/gif'),
+    (b'GIF89a', 'image/gif'),
+    (b'BM', 'image/bmp'),
+    (b'II*\x00', 'image/tiff'),
+    (b'MM\x00*', 'image/tiff'),
+    (b'%PDF-', 'application/pdf'),
+)
+
+# A unit of work: one file, or one page of a multi-page file (page is 1-based).
+# data holds the file bytes when they did not come from disk.
+ImageJob = namedtuple('ImageJob', ['path', 'page', 'data'], defaults=(None, None))
+
+
+def sniff_mime_type(header):
+    """Detect the real format from the first bytes of a file."""
+    for signature, mime_type in SIGNATURES:
+        if header.startswith(signature):
+            return mime_type
+    if header[:4] == b'RIFF' and header[8:12] == b'WEBP':
+        return 'image/webp'
+    if header[4:8] == b'ftyp':
+        brand = header[8:12]
+        if brand in (b'heic', b'heix', b'heim', b'heis'):
+            return 'image/heic'
+        if brand in (b'mif1', b'msf1', b'heif'):
+            return 'image/heif'
+    return None
+
+
+def read_header(path, size=32):
+    with open(path, 'rb') as f:
+        return f.read(size)
+
+
+def count_pages(path):
+    """Return the number of pages or frames in a file (1 for single-page formats)."""
+    mime_type = sniff_mime_type(read_header(path))
+    if mime_type not in MULTI_PAGE_MIME_TYPES:
+        return 1
+    if mime_type == 'application/pdf':
+        # Without a renderer the PDF is sent to the API as a whole
+        if pdfium is None:
+            return 1
+        pdf = pdfium.PdfDocument(path)
+        try:
+            return len(pdf)
+        finally:
+            pdf.close()
+    from PIL import Image
+    with Image.open(path) as image:
+        return getattr(image, 'n_frames', 1)
+
+
+def expand_image(path):
+    """Split a file into jobs, one per page for multi-page files."""
+    try:
+        pages = count_pages(path)
+    except Exception as e:
+        # Leave the error to be reported when the job is processed
+        print(f"Error reading {path}: {e}")
+        pages = 1
+    if pages <= 1:
+        return [ImageJob(path)]
+    return [ImageJob(path, page) for page in range(1, pages + 1)]
+
+
+def iter_jobs(image_paths, workers=DEFAULT_WORKERS):
+    """Lazily expand image paths into jobs, reading page counts on a worker pool.
+
+    image_paths may be any iterable (such as a folder scanner); paths are
+    consumed only as far as needed, so processing can start before all of
+    them are known. Jobs come in the order of image_paths, pages in page order.
+    """
+    for _, path_jobs in iter_batch(image_paths, expand_image, workers):
+        yield from path_jobs
+
+
+def expand_jobs(image_paths, workers=DEFAULT_WORKERS):
+    """Expand image paths into a list of jobs; see iter_jobs."""
+    return list(iter_jobs(image_paths, workers))
+
+
+def read_job(job):
+    """Return the source bytes of a job."""
+    if job.data is not None:
+        return job.data
+    with open(job.path, 'rb') as f:
+        return f.read()
+
+
+def convert_image(image_bytes, page=None):
+    """Extract a page of an image and encode it as PNG."""
+    from PIL import Image
+    with Image.open(io.BytesIO(image_bytes)) as image:
+        if page is not None:
+            image.seek(page - 1)
+        if image.mode not in ('1', 'L', 'LA', 'P', 'RGB', 'RGBA'):
+            image = image.convert('RGB')
+        output = io.BytesIO()
+        image.save(output, format='PNG')
+        return output.getvalue()
+
+
+def render_pdf_page(pdf_bytes, page):
+    """Render a PDF page to PNG."""
+    pdf = pdfium.PdfDocument(pdf_bytes)
+    try:
+        bitmap = pdf[page - 1].render(scale=PDF_RENDER_SCALE)
+        output = io.BytesIO()
+        bitmap.to_pil().save(output, format='PNG')
+        return output.getvalue()
+    finally:
+        pdf.close()
+
+
+def prepare_upload(image_bytes, page=None):
+    """Return (bytes, mime_type) in a format the API accepts.
+
+    Supported files are passed through untouched; other formats and single
+    pages of multi-page files are converted to PNG.
+    """
+    mime_type = sniff_mime_type(image_bytes[:32])
+    if mime_type is None:
+        raise ValueError("Unsupported or unrecognized image format")
+    if mime_type == 'application/pdf':
+        if page is None:
+            return image_bytes, mime_type
+        return render_pdf_page(image_bytes, page), 'image/png'
+    if mime_type in ACCEPTED_MIME_TYPES and page is None:
+        return image_bytes, mime_type
+    return convert_image(image_bytes, page), 'image/png'
+
+
+def job_label(job):
+    """Human-readable name of a job for log messages."""
+    if job.page is None:
+        return job.path
+    return f"{job.path} (page {job.page})"
@@ -0,0 +1,88 @@
+import os
+import json
+import threading
+
+
+def default_journal_path(output_path):
+    """Journal file kept next to the output file."""
+    return output_path + '.journal.jsonl'
+
+
+def job_key(job):
+    """Identify a job across runs by its absolute path and page."""
+    return f"{os.path.abspath(job.path)}#{job.page or ''}"
+
+
+class Journal:
+    """Append-only JSONL checkpoint of completed jobs.
+
+    Every completed image is written as one line and flushed immediately,
+    so after a crash the completed results can be loaded back and only the
+    remaining images need to be processed.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.file = None
+        self.reader = None
+        self.lock = threading.Lock()
+
+    def load(self, include_errors=False):
+        """Return {job_key: offset} for every job recorded in the journal without an error.
+
+        With include_errors, jobs recorded with an error row are included
+        too; a job recorded more than once maps to its last entry. Only the
+        offsets are kept in memory; rows are read back with read().
+        """
+        offsets = {}
+        if not os.path.exists(self.path):
+            return offsets
+        with open(self.path, 'rb') as f:
+            offset = f.tell()
+            for line in iter(f.readline, b''):
+                try:
+                    entry = json.loads(line)
+                    # Failed jobs are not done; they are processed again on resume
+                    if include_errors or 'error' not in entry['row']:
+                        offsets[entry['key']] = offset
+                except (json.JSONDecodeError, UnicodeDecodeError, KeyError):
+                    # The last line may be cut short by a crash
+                    pass
+                offset = f.tell()
+        return offsets
+
+    def read(self, offset):
+        """Read back the row recorded at offset."""
+        with self.lock:
+            if self.reader is None:
+                self.reader = open(self.path, 'rb')
+            self.reader.seek(offset)
+            return json.loads(self.reader.readline())['row']
+
+    def open(self, resume=False):
+        """Open the journal for writing, keeping existing entries when resuming."""
+        output_dir = os.path.dirname(self.path)
+        if output_dir and not os.path.exists(output_dir):
+            os.makedirs(output_dir)
+        self.file = open(self.path, 'a' if resume else 'w', encoding='utf-8')
+        if resume and self.file.tell() > 0:
+            # Terminate a line left incomplete by a crash before appending
+            with open(self.path, 'rb') as f:
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) != b'\n':
+                    self.file.write('\n')
+
+    def write(self, job, row):
+        """Record a completed job."""
+        line = json.dumps({'key': job_key(job), 'row': row}, ensure_ascii=False)
+        with self.lock:
+            self.file.write(line + '\n')
+            self.file.flush()
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+        if self.reader is not None:
+            self.reader.close()
+            self.reader = None
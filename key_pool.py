@@ -0,0 +1,260 @@
+import time
+import threading
+from collections import namedtuple
+
+from rate_limit import RequestScheduler, RetryPolicy, classify_error, estimate_tokens
+
+# A key that hit its quota sits out this long (doubling while it keeps hitting it),
+# unless the server says when to retry
+DEFAULT_BENCH_SECONDS = 30
+MAX_BENCH_SECONDS = 600
+
+# A key rejected as invalid or unauthorized sits out much longer; it rarely recovers during a run
+AUTH_BENCH_SECONDS = 600
+
+# Error class names and messages of rejected keys, matched by name like rate_limit does
+AUTH_ERRORS = {'PermissionDenied', 'Unauthenticated', 'Unauthorized', 'Forbidden'}
+AUTH_MESSAGES = ('API_KEY_INVALID', 'API key not valid', 'API key expired')
+
+KeySpec = namedtuple('KeySpec', ['api_key', 'rpm', 'tpm'], defaults=(0, 0))
+
+
+def parse_key_line(line, rpm=0, tpm=0):
+    """Parse "KEY [rpm=N] [tpm=N]" into a KeySpec; limits not given default to rpm and tpm."""
+    api_key, *options = line.split()
+    limits = {'rpm': rpm, 'tpm': tpm}
+    for option in options:
+        name, _, value = option.partition('=')
+        if name not in limits or not value.isdigit():
+            raise ValueError(f"Invalid key option {option!r} (expected rpm=N or tpm=N)")
+        limits[name] = int(value)
+    return KeySpec(api_key, limits['rpm'], limits['tpm'])
+
+
+def parse_key_pool(text, rpm=0, tpm=0):
+    """Parse one key per line, skipping blank lines and # comments."""
+    keys = []
+    for line in text.splitlines():
+        line = line.split('#', 1)[0].strip()
+        if line:
+            keys.append(parse_key_line(line, rpm, tpm))
+    return keys
+
+
+def format_key_pool(keys):
+    """Inverse of parse_key_pool."""
+    lines = []
+    for key in keys:
+        line = key.api_key
+        if key.rpm:
+            line += f" rpm={key.rpm}"
+        if key.tpm:
+            line += f" tpm={key.tpm}"
+        lines.append(line)
+    return '\n'.join(lines)
+
+
+def read_key_pool(path, rpm=0, tpm=0):
+    with open(path, 'r', encoding='utf-8') as f:
+        return parse_key_pool(f.read(), rpm, tpm)
+
+
+def mask_key(api_key):
+    """Show only the ends of a key, for reports."""
+    if len(api_key) <= 10:
+        return '***'
+    return f"{api_key[:4]}...{api_key[-4:]}"
+
+
+def is_auth_error(error):
+    """True when error means the API key itself was rejected."""
+    if type(error).__name__ in AUTH_ERRORS or getattr(error, 'code', None) in (401, 403):
+        return True
+    message = str(error)
+    return any(text in message for text in AUTH_MESSAGES)
+
+
+class KeyPoolExhausted(Exception):
+    """Every key of the pool was rejected."""
+
+
+class PooledKey:
+    """One key of a pool with its backend, its own rate limits and its usage."""
+
+    def __init__(self, index, spec, backend, max_concurrency):
+        self.label = f"key {index} ({mask_key(spec.api_key)})"
+        self.spec = spec
+        self.backend = backend
+        # Retries are left to the pool, which moves them to another key
+        self.scheduler = RequestScheduler(spec.rpm, spec.tpm, max_concurrency, RetryPolicy(0))
+        self.active = 0
+        self.last_used = 0
+        self.benched_until = 0.0
+        self.bench_reason = None
+        self.strikes = 0
+        self.benchings = 0
+        self.requests = 0
+        self.throttled = 0
+        self.rejected = 0
+        self.failed = 0
+        self.input_tokens = 0
+        self.output_tokens = 0
+
+    def usage(self):
+        return {
+            'key': self.label,
+            'rpm': self.spec.rpm,
+            'tpm': self.spec.tpm,
+            'requests': self.requests,
+            'throttled': self.throttled,
+            'rejected': self.rejected,
+            'failed': self.failed,
+            'input_tokens': self.input_tokens,
+            'output_tokens': self.output_tokens,
+            'benchings': self.benchings,
+        }
+
+
+class KeyPool:
+    """Backend that spreads requests over several API keys.
+
+    Each key has its own backend (built by make_backend(api_key)) and its
+    own request scheduler with the key's rpm / tpm limits. A request goes
+    to the key that can send it soonest, preferring the least busy and
+    then the least recently used key. A key that answers with a quota
+    error is benched until the server's retry hint, or for a backoff that
+    doubles while it keeps failing; a key that is rejected as invalid or
+    unauthorized is benched for much longer. The request is then retried
+    on another key right away. Transient errors are retried with the
+    retry_policy's backoff. When every key is benched, requests wait for
+    the first one to come back; when every key has been rejected they fail
+    with KeyPoolExhausted.
+
+    Used in place of a single backend, without a scheduler on the
+    OcrClient. Safe to use from multiple worker threads.
+    """
+
+    def __init__(self, keys, make_backend, max_concurrency=8, retry_policy=None):
+        if not keys:
+            raise ValueError("The key pool needs at least one API key")
+        self.keys = [PooledKey(index, spec, make_backend(spec.api_key), max_concurrency)
+                     for index, spec in enumerate(keys, 1)]
+        self.model = self.keys[0].backend.model
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.retries = 0
+        self.throttled = 0
+        self.uses = 0
+        self.condition = threading.Condition()
+
+    def generate(self, contents, generation_config=None):
+        return self.generate_with_usage(contents, generation_config)[0]
+
+    def generate_with_usage(self, contents, generation_config=None):
+        """Send contents with one of the keys; returns (response text, token usage)."""
+        text = ''.join(part for part in contents if isinstance(part, str))
+        tokens = estimate_tokens(text, sum(1 for part in contents if isinstance(part, dict)))
+        attempt = 0
+        while True:
+            key = self.acquire(tokens)
+            delay = 0.0
+            try:
+                result = key.scheduler.call(lambda: key.backend.generate_with_usage(contents, generation_config),
+                                            tokens)
+            except Exception as e:
+                kind, retry_after = classify_error(e)
+                if is_auth_error(e):
+                    kind = 'rejected'
+                self.record_error(key, kind, retry_after)
+                if kind is None or attempt >= self.retry_policy.max_retries:
+                    raise
+                with self.condition:
+                    self.retries += 1
+                    if kind == 'throttled':
+                        self.throttled += 1
+                # Quota and key errors bench the key and move on to another one at once
+                if kind == 'transient':
+                    delay = self.retry_policy.delay(attempt, retry_after)
+                attempt += 1
+            else:
+                self.record_success(key, result[1])
+                return result
+            finally:
+                self.release(key)
+            time.sleep(delay)
+
+    def acquire(self, tokens):
+        """Pick the key for the next request, waiting while every key is benched."""
+        with self.condition:
+            while True:
+                now = time.monotonic()
+                ready = [key for key in self.keys if key.benched_until <= now]
+                if ready:
+                    key = min(ready, key=lambda key: (key.scheduler.wait_time(tokens), key.active, key.last_used))
+                    key.active += 1
+                    self.uses += 1
+                    key.last_used = self.uses
+                    return key
+                if all(key.bench_reason == 'rejected' for key in self.keys):
+                    raise KeyPoolExhausted("Every API key in the pool was rejected; check the keys")
+                self.condition.wait(min(key.benched_until for key in self.keys) - now)
+
+    def release(self, key):
+        with self.condition:
+            key.active -= 1
+
+    def record_success(self, key, usage):
+        with self.condition:
+            key.requests += 1
+            key.strikes = 0
+            key.bench_reason = None
+            key.input_tokens += usage.get('input_tokens', 0)
+            key.output_tokens += usage.get('output_tokens', 0)
+
+    def record_error(self, key, kind, retry_after=None):
+        """Count an error and bench the key for quota and key errors."""
+        with self.condition:
+            if kind == 'throttled':
+                key.throttled += 1
+            elif kind == 'rejected':
+                key.rejected += 1
+            else:
+                key.failed += 1
+            if kind not in ('throttled', 'rejected'):
+                return
+            now = time.monotonic()
+            # Requests already in flight on a benched key do not bench it again
+            if key.benched_until > now and key.bench_reason == kind:
+                return
+            key.strikes += 1
+            if kind == 'rejected':
+                seconds = AUTH_BENCH_SECONDS
+            elif retry_after is not None:
+                seconds = retry_after
+            else:
+                seconds = min(MAX_BENCH_SECONDS, DEFAULT_BENCH_SECONDS * 2 ** (key.strikes - 1))
+            key.benched_until = now + seconds
+            key.bench_reason = kind
+            key.benchings += 1
+            self.condition.notify_all()
+
+    def usage(self):
+        """Per-key usage as a list of dicts."""
+        with self.condition:
+            return [key.usage() for key in self.keys]
+
+    def summary(self):
+        """Return the retry summary and one usage line per key for the end of a run."""
+        now = time.monotonic()
+        lines = [f"Key pool for {self.model}: {len(self.keys)} keys, {self.retries} retries ({self.throttled} throttled)"]
+        for key, usage in zip(self.keys, self.usage()):
+            line = (f"  {usage['key']}: {usage['requests']} requests, "
+                    f"tokens {usage['input_tokens']} in / {usage['output_tokens']} out")
+            errors = [f"{usage[kind]} {kind}" for kind in ('throttled', 'rejected', 'failed') if usage[kind]]
+            if errors:
+                line += ', ' + ', '.join(errors)
+            if usage['benchings']:
+                line += f", benched {usage['benchings']}x"
+                if key.benched_until > now:
+                    line += f" (benched for another {key.benched_until - now:.0f}s)"
+            lines.append(line)
+        return '\n'.join(lines)
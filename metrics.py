@@ -0,0 +1,176 @@
+import json
+import math
+import time
+import random
+import threading
+from array import array
+from contextlib import contextmanager
+
+# Per-image stages, in pipeline order
+STAGES = ('read', 'cache', 'preprocess', 'rate_limit', 'api', 'parse', 'write')
+
+PERCENTILES = (50, 95, 99)
+
+# Timings kept per stage for the percentiles; beyond this a uniform random sample is kept,
+# so long-running services (watch, serve) don't grow without bound
+SAMPLE_SIZE = 10000
+
+
+def percentile(sorted_values, p):
+    """Percentile p (0-100) of already sorted values, interpolating between ranks."""
+    if not sorted_values:
+        return 0.0
+    rank = (len(sorted_values) - 1) * p / 100
+    low = math.floor(rank)
+    high = math.ceil(rank)
+    return sorted_values[low] + (sorted_values[high] - sorted_values[low]) * (rank - low)
+
+
+class StageTimings:
+    """Count, total and maximum of a stage's timings, with a sample of them for percentiles.
+
+    The first SAMPLE_SIZE timings are all kept; after that each new timing
+    replaces a random one with the probability that keeps the sample
+    uniform over the whole run (reservoir sampling). Not thread-safe on
+    its own; Metrics guards it with its lock.
+    """
+
+    def __init__(self, size=SAMPLE_SIZE):
+        self.size = size
+        self.sample = array('d')
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.random = random.Random(0)
+
+    def add(self, seconds):
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+        if len(self.sample) < self.size:
+            self.sample.append(seconds)
+        else:
+            index = self.random.randrange(self.count)
+            if index < self.size:
+                self.sample[index] = seconds
+
+
+class Metrics:
+    """Thread-safe timings and counters for one run.
+
+    span(stage) times a block of work; add(counter, amount) counts images,
+    requests, bytes and tokens. report() summarizes the stage latencies
+    (p50/p95/p99, from a bounded sample of each stage's timings) and
+    throughput; it can be written as JSON or in the Prometheus text format.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.timings = {}  # stage -> StageTimings
+        self.counters = {}
+        self.started = time.perf_counter()
+        self.finished = None
+        self.first_row = None
+
+    @contextmanager
+    def span(self, stage):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(stage, time.perf_counter() - start)
+
+    def record(self, stage, seconds):
+        with self.lock:
+            if stage not in self.timings:
+                self.timings[stage] = StageTimings()
+            self.timings[stage].add(seconds)
+
+    def add(self, counter, amount=1):
+        with self.lock:
+            self.counters[counter] = self.counters.get(counter, 0) + amount
+
+    def row_written(self):
+        """Note that a result row reached the output (for time to first row)."""
+        if self.first_row is None:
+            self.first_row = time.perf_counter()
+
+    def finish(self):
+        self.finished = time.perf_counter()
+
+    @property
+    def elapsed(self):
+        return (self.finished or time.perf_counter()) - self.started
+
+    def stage_report(self, stage):
+        with self.lock:
+            timings = self.timings.get(stage) or StageTimings(0)
+            values = sorted(timings.sample)
+            count, total, maximum = timings.count, timings.total, timings.max
+        report = {
+            'count': count,
+            'total_seconds': total,
+            'mean_seconds': total / count if count else 0.0,
+            'max_seconds': maximum,
+        }
+        for p in PERCENTILES:
+            report[f'p{p}_seconds'] = percentile(values, p)
+        return report
+
+    def report(self):
+        """Summary of the run as a JSON-serializable dict."""
+        elapsed = self.elapsed
+        with self.lock:
+            counters = dict(self.counters)
+            stages = [stage for stage in STAGES if stage in self.timings]
+            stages += sorted(stage for stage in self.timings if stage not in STAGES)
+        images = counters.get('images', 0)
+        return {
+            'wall_seconds': elapsed,
+            'images_per_second': images / elapsed if elapsed > 0 else 0.0,
+            'time_to_first_row_seconds': self.first_row - self.started if self.first_row is not None else None,
+            'counters': counters,
+            'stages': {stage: self.stage_report(stage) for stage in stages},
+        }
+
+    def to_json(self):
+        return json.dumps(self.report(), indent=2)
+
+    def to_prometheus(self, prefix='gemini_ocr'):
+        """Report in the Prometheus text exposition format."""
+        report = self.report()
+        lines = [
+            f"# TYPE {prefix}_stage_seconds summary",
+        ]
+        for stage, stats in report['stages'].items():
+            for p in PERCENTILES:
+                lines.append(f'{prefix}_stage_seconds{{stage="{stage}",quantile="{p / 100:g}"}} {stats[f"p{p}_seconds"]:.6f}')
+            lines.append(f'{prefix}_stage_seconds_sum{{stage="{stage}"}} {stats["total_seconds"]:.6f}')
+            lines.append(f'{prefix}_stage_seconds_count{{stage="{stage}"}} {stats["count"]}')
+        for counter, value in sorted(report['counters'].items()):
+            lines.append(f"# TYPE {prefix}_{counter}_total counter")
+            lines.append(f"{prefix}_{counter}_total {value}")
+        lines.append(f"# TYPE {prefix}_wall_seconds gauge")
+        lines.append(f"{prefix}_wall_seconds {report['wall_seconds']:.6f}")
+        return '\n'.join(lines) + '\n'
+
+    def write(self, path):
+        """Write the report; .prom files get the Prometheus format, anything else JSON."""
+        content = self.to_prometheus() if path.endswith('.prom') else self.to_json()
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(content)
+
+    def summary(self):
+        report = self.report()
+        counters = report['counters']
+        summary = (f"Timing: {counters.get('images', 0)} images in {report['wall_seconds']:.1f}s "
+                   f"({report['images_per_second']:.2f}/s)")
+        api = report['stages'].get('api')
+        if api and api['count']:
+            summary += (f", API p50 {api['p50_seconds']:.2f}s p95 {api['p95_seconds']:.2f}s "
+                        f"p99 {api['p99_seconds']:.2f}s")
+        if counters.get('input_tokens') or counters.get('output_tokens'):
+            summary += f", tokens {counters.get('input_tokens', 0)} in / {counters.get('output_tokens', 0)} out"
+            if counters.get('cached_tokens'):
+                summary += f" ({counters['cached_tokens']} of them cached)"
+        return summary
@@ -0,0 +1,584 @@
+import json
+import time
+import random
+import threading
+
+from result_cache import make_cache_key
+from response_parser import parse_response, is_parsed
+from rate_limit import estimate_tokens, CHARS_PER_TOKEN
+from metrics import Metrics
+from batch import iter_batch
+from tiling import merge_results
+from image_input import ImageJob, read_job, prepare_upload, job_label
+from packing import pack_ids, pack_response_schema, split_packed_response
+
+# Why a cascade tier's result is not accepted, in the order they are checked
+ESCALATION_REASONS = ('error', 'unparsed', 'schema', 'empty')
+
+# Formats the preprocessor cannot decode are uploaded as they are
+PREPROCESS_SKIP_MIME_TYPES = {'application/pdf', 'image/heic', 'image/heif'}
+
+DEFAULT_PROMPT = "Extract all text from the image and organize it into structured data."
+
+PROMPT_TEMPLATE = """
+        Please perform OCR on this image.
+
+        {custom_prompt}
+
+        Return the results in a structured JSON format that can be converted to Excel.
+        """
+
+
+PACK_PROMPT_TEMPLATE = """
+        Please perform OCR on each of the following {count} images. Each image is preceded by its id.
+
+        {custom_prompt}
+
+        Return a single JSON object with one key per image id ({ids}). The value for each id is the structured JSON result for that image only.
+        """
+
+
+TILE_PROMPT_TEMPLATE = """
+        Please perform OCR on this image. It is part {index} of {count} of a larger image that was cut into overlapping tiles in reading order; transcribe all text visible in this part, including text cut off at its edges.
+
+        {custom_prompt}
+
+        Return the results in a structured JSON format that can be converted to Excel.
+        """
+
+
+def build_prompt(custom_prompt):
+    """Create a prompt that includes OCR instructions and any custom prompt."""
+    return PROMPT_TEMPLATE.format(custom_prompt=custom_prompt or DEFAULT_PROMPT)
+
+
+def build_pack_prompt(custom_prompt, ids):
+    """Create the prompt for a request carrying several images labelled with ids."""
+    return PACK_PROMPT_TEMPLATE.format(count=len(ids), ids=', '.join(ids), custom_prompt=custom_prompt or DEFAULT_PROMPT)
+
+
+def build_tile_prompt(custom_prompt, index, count):
+    """Create the prompt for tile index (from 1) of count tiles of one image."""
+    return TILE_PROMPT_TEMPLATE.format(index=index, count=count, custom_prompt=custom_prompt or DEFAULT_PROMPT)
+
+
+class GeminiBackend:
+    """Backend that sends requests to the Gemini API.
+
+    The API is configured and the model instance is created once, so every
+    request of a run reuses the same client and its connections. A prompt
+    can be stored as cached content and referred to by later requests
+    (see prompt_cache).
+    """
+
+    def __init__(self, api_key, model):
+        # Imported here because the SDK takes about a second to import, which
+        # every other command (--help, the stub backend, batch) would pay for
+        import google.generativeai as genai
+        from google.generativeai import client as genai_client
+        genai.configure(api_key=api_key)
+        self.model = model
+        self.model_instance = genai.GenerativeModel(model)
+        # configure() is global; bind this key's client to the model so backends
+        # with different keys (a key pool) can be used side by side
+        self.model_instance._client = genai_client.get_default_generative_client()
+        self.cache_client = genai_client.get_default_cache_client()
+        self.cached_models = {}  # cached content name -> model instance that refers to it
+
+    def generate(self, contents, generation_config=None):
+        """Send contents to the model and return the response text."""
+        return self.generate_with_usage(contents, generation_config)[0]
+
+    def generate_with_usage(self, contents, generation_config=None, cached_prompt=None):
+        """Send contents to the model, after the cached content named cached_prompt if given; returns (response text, token usage)."""
+        model_instance = self.cached_models[cached_prompt] if cached_prompt else self.model_instance
+        response = model_instance.generate_content(contents, generation_config=generation_config)
+        usage = response.usage_metadata
+        token_usage = {'input_tokens': usage.prompt_token_count or 0,
+                       'output_tokens': usage.candidates_token_count or 0}
+        if usage.cached_content_token_count:
+            token_usage['cached_tokens'] = usage.cached_content_token_count
+        return response.text, token_usage
+
+    def create_cached_prompt(self, prompt, ttl):
+        """Store prompt as cached content of this model for ttl seconds; returns the entry's name."""
+        import datetime
+        import google.generativeai as genai
+        from google.generativeai import protos
+        cached_content = protos.CachedContent(model=self.model_instance.model_name,
+                                              contents=[protos.Content(role='user', parts=[protos.Part(text=prompt)])],
+                                              ttl=datetime.timedelta(seconds=ttl))
+        name = self.cache_client.create_cached_content(
+            protos.CreateCachedContentRequest(cached_content=cached_content)).name
+        # Like GenerativeModel.from_cached_content, without looking the entry up again with the global client
+        model_instance = genai.GenerativeModel(self.model)
+        model_instance._client = self.model_instance._client
+        model_instance._cached_content = name
+        self.cached_models[name] = model_instance
+        return name
+
+    def refresh_cached_prompt(self, name, ttl):
+        """Let the cached content expire ttl seconds from now."""
+        import datetime
+        from google.generativeai import protos
+        from google.protobuf import field_mask_pb2
+        self.cache_client.update_cached_content(protos.UpdateCachedContentRequest(
+            cached_content=protos.CachedContent(name=name, ttl=datetime.timedelta(seconds=ttl)),
+            update_mask=field_mask_pb2.FieldMask(paths=['ttl'])))
+
+    def delete_cached_prompt(self, name):
+        from google.generativeai import protos
+        self.cached_models.pop(name, None)
+        self.cache_client.delete_cached_content(protos.DeleteCachedContentRequest(name=name))
+
+
+class StubServiceUnavailable(Exception):
+    """Simulated transient API error raised by StubBackend; retried like a real 503."""
+    code = 503
+
+
+class StubInvalidArgument(Exception):
+    """Simulated rejected request raised by StubBackend, like a real 400."""
+    code = 400
+
+
+class StubNotFound(Exception):
+    """Simulated missing resource raised by StubBackend, like a real 404."""
+    code = 404
+
+
+class StubBackend:
+    """Local backend that returns a canned response without any network access.
+
+    Used for tests and benchmarks; latency simulates the API round-trip.
+    With responses, requests are answered with each response text in turn,
+    to exercise the parser with different response shapes. A fraction
+    error_rate of the requests fails with a transient error; the failures
+    are drawn from a generator seeded with seed, so runs are reproducible.
+    Packed requests get the canned response once for every image. Cached
+    prompts are kept in memory until they expire; prompts estimated below
+    cache_min_tokens are refused, like the service refuses small ones.
+    """
+
+    def __init__(self, response_text='{"text": "stub"}', latency=0.0, model='stub', responses=None,
+                 error_rate=0.0, seed=0, cache_min_tokens=0):
+        self.response_text = response_text
+        self.latency = latency
+        self.model = model
+        self.responses = list(responses) if responses else [response_text]
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        self.requests = 0
+        self.cache_min_tokens = cache_min_tokens
+        self.cached_prompts = {}  # name -> (prompt, expiry time)
+        self.cached_prompts_created = 0
+        self.lock = threading.Lock()
+
+    def generate(self, contents, generation_config=None):
+        """Return the canned response after the configured latency."""
+        return self.generate_with_usage(contents, generation_config)[0]
+
+    def generate_with_usage(self, contents, generation_config=None, cached_prompt=None):
+        """Return the canned response and an estimated token usage, counting a cached prompt as cached tokens."""
+        cached_tokens = estimate_tokens(self.cached_prompt(cached_prompt), 0) if cached_prompt else 0
+        text = self.respond(contents)
+        prompt = ''.join(part for part in contents if isinstance(part, str))
+        image_count = sum(1 for part in contents if isinstance(part, dict))
+        usage = {'input_tokens': estimate_tokens(prompt, image_count) + cached_tokens,
+                 'output_tokens': len(text) // CHARS_PER_TOKEN}
+        if cached_tokens:
+            usage['cached_tokens'] = cached_tokens
+        return text, usage
+
+    def cached_prompt(self, name):
+        """The prompt of a cached entry that has not expired."""
+        with self.lock:
+            prompt, expires = self.cached_prompts.get(name, (None, 0.0))
+        if prompt is None or expires <= time.monotonic():
+            raise StubNotFound(f"404 CachedContent not found (or permission denied): {name}")
+        return prompt
+
+    def create_cached_prompt(self, prompt, ttl):
+        """Keep prompt for ttl seconds; returns the entry's name."""
+        tokens = estimate_tokens(prompt, 0)
+        if tokens < self.cache_min_tokens:
+            raise StubInvalidArgument(f"400 Cached content is too small. total_token_count={tokens}, "
+                                      f"min_total_token_count={self.cache_min_tokens}")
+        with self.lock:
+            self.cached_prompts_created += 1
+            name = f"cachedContents/stub-{self.cached_prompts_created}"
+            self.cached_prompts[name] = (prompt, time.monotonic() + ttl)
+        return name
+
+    def refresh_cached_prompt(self, name, ttl):
+        prompt = self.cached_prompt(name)
+        with self.lock:
+            self.cached_prompts[name] = (prompt, time.monotonic() + ttl)
+
+    def delete_cached_prompt(self, name):
+        with self.lock:
+            self.cached_prompts.pop(name, None)
+
+    def respond(self, contents):
+        with self.lock:
+            response_text = self.responses[self.requests % len(self.responses)]
+            self.requests += 1
+            failed = self.error_rate and self.random.random() < self.error_rate
+        if self.latency:
+            time.sleep(self.latency)
+        if failed:
+            raise StubServiceUnavailable('503 Simulated service unavailable')
+        # Packed requests label each image with "<id>:"; answer with one copy per image
+        ids = [part[:-1] for part in contents[1:] if isinstance(part, str) and part.endswith(':')]
+        if ids:
+            try:
+                result = json.loads(response_text)
+            except ValueError:
+                return response_text
+            return json.dumps({image_id: result for image_id in ids})
+        return response_text
+
+
+def is_empty(value):
+    """True for a result without any text: nothing but empty strings, lists, objects and nulls."""
+    if isinstance(value, dict):
+        return all(is_empty(item) for item in value.values())
+    if isinstance(value, list):
+        return all(is_empty(item) for item in value)
+    if isinstance(value, str):
+        return not value.strip()
+    return value is None
+
+
+def escalation_reason(result):
+    """Why a parsed result is unusable (one of ESCALATION_REASONS), or None when it is fine."""
+    if isinstance(result, dict) and 'error' in result:
+        return 'error'
+    if not is_parsed(result):
+        return 'unparsed'
+    if isinstance(result, dict) and result.get('schema_errors'):
+        return 'schema'
+    if is_empty(result):
+        return 'empty'
+    return None
+
+
+class OcrClient:
+    """Long-lived OCR client shared by every image of a run.
+
+    Wraps a backend (Gemini or a local stub) together with the prompt built
+    from the user's custom prompt. Responses are looked up in and stored to
+    the optional result cache, images are passed through the optional
+    preprocessor before upload, and API calls go through the optional
+    request scheduler for rate limiting and retries. With an output schema
+    the model is asked for JSON matching the schema and every result is
+    returned as a row with the schema's columns. process_pack sends several
+    images in one request. With a tiler, oversized images are sent as
+    overlapping tiles in parallel and their results merged into one. The
+    backend may be a KeyPool, which spreads the requests over several API
+    keys with their own limits and retries, in place of the scheduler.
+    prompt_cache is the PromptCache whose backends send the prompt as
+    cached content, if any; it is kept here for its summary.
+
+    With cascade, a list of backends for stronger models, a request whose
+    result fails to parse, fails the schema check, comes back empty or
+    fails altogether is sent again to the next model; the last model's
+    answer is kept whatever it is. The cache then stores the accepted
+    answer for the whole cascade. Timings of every stage, request and
+    cascade tier, byte and token counts are recorded in metrics. Safe to
+    use from multiple worker threads.
+    """
+
+    def __init__(self, backend, custom_prompt=None, cache=None, preprocessor=None, scheduler=None, schema=None,
+                 metrics=None, tiler=None, cascade=None, prompt_cache=None):
+        self.backend = backend
+        self.tiers = [backend] + list(cascade or [])
+        self.custom_prompt = custom_prompt
+        self.prompt = build_prompt(custom_prompt)
+        self.cache = cache
+        self.preprocessor = preprocessor
+        self.scheduler = scheduler
+        self.schema = schema
+        self.tiler = tiler
+        self.prompt_cache = prompt_cache
+        self.generation_config = schema.generation_config() if schema is not None else None
+        self.metrics = metrics if metrics is not None else Metrics()
+        self.pack_requests = 0
+        self.pack_fallbacks = 0
+        self.lock = threading.Lock()
+
+    @property
+    def model(self):
+        """Model name, or the models of a cascade joined by '>' (which keeps cache entries of a cascade apart)."""
+        return '>'.join(tier.model for tier in self.tiers)
+
+    def generate(self, contents, generation_config=None, backend=None):
+        """Send a request to the backend (by default the first tier) through the scheduler, if any, and return the response text."""
+        generation_config = generation_config or self.generation_config
+        backend = backend or self.backend
+
+        api_seconds = []
+
+        def send():
+            # Only the request itself counts as 'api'; waiting for the scheduler is timed separately
+            start = time.perf_counter()
+            try:
+                return backend.generate_with_usage(contents, generation_config)
+            finally:
+                api_seconds.append(time.perf_counter() - start)
+                self.metrics.record('api', api_seconds[-1])
+
+        if self.scheduler is None:
+            response_text, usage = send()
+        else:
+            text = ''.join(part for part in contents if isinstance(part, str))
+            image_count = sum(1 for part in contents if isinstance(part, dict))
+            start = time.perf_counter()
+            try:
+                response_text, usage = self.scheduler.call(send, estimate_tokens(text, image_count))
+            finally:
+                # Rate limit slots, concurrency slots and backoff between retries
+                self.metrics.record('rate_limit', max(0.0, time.perf_counter() - start - sum(api_seconds)))
+        self.metrics.add('requests')
+        self.metrics.add('bytes_uploaded', sum(len(part['data']) for part in contents if isinstance(part, dict)))
+        for counter, tokens in usage.items():
+            self.metrics.add(counter, tokens)
+        return response_text
+
+    def parse(self, response_text):
+        """Parse a response, shaping it into the schema's columns when a schema is set."""
+        with self.metrics.span('parse'):
+            result = parse_response(response_text)
+            if self.schema is not None:
+                result = self.schema.to_row(result)
+        return result
+
+    def parse_tile(self, response_text):
+        """Parse the response for one tile; the schema applies to the merged result only."""
+        with self.metrics.span('parse'):
+            return parse_response(response_text)
+
+    def read(self, job):
+        """Read a job's image bytes, counting them."""
+        with self.metrics.span('read'):
+            image_bytes = read_job(job)
+        self.metrics.add('images')
+        self.metrics.add('bytes_read', len(image_bytes))
+        return image_bytes
+
+    def cached_response(self, cache_key):
+        """Look up a cached response; None on a miss or without a cache."""
+        if cache_key is None:
+            return None
+        with self.metrics.span('cache'):
+            response_text = self.cache.get(cache_key)
+        if response_text is not None:
+            self.metrics.add('cache_hits')
+        return response_text
+
+    def process_image(self, image_path):
+        """Process a single image file and return the parsed result."""
+        return self.process_job(ImageJob(image_path))
+
+    def cache_key(self, job, image_bytes):
+        """Result cache key for a job, or None without a cache."""
+        if self.cache is None:
+            return None
+        variant = self.preprocessor.cache_tag if self.preprocessor else ''
+        if self.schema is not None:
+            variant += ';' + self.schema.cache_tag
+        if self.tiler is not None:
+            variant += ';' + self.tiler.cache_tag
+        if job.page is not None:
+            variant += f";page={job.page}"
+        return make_cache_key(image_bytes, self.model, self.prompt, variant)
+
+    def prepare(self, job, image_bytes):
+        """Convert to a format the API accepts, then tile and shrink if configured.
+
+        Returns ([(bytes, mime_type)], tiles per row): the tiles of an
+        oversized image, otherwise just the image.
+        """
+        with self.metrics.span('preprocess'):
+            upload_bytes, mime_type = prepare_upload(image_bytes, job.page)
+            if mime_type in PREPROCESS_SKIP_MIME_TYPES:
+                return [(upload_bytes, mime_type)], 1
+            tiled = self.tiler.split(upload_bytes) if self.tiler is not None else None
+            uploads, columns = tiled or ([(upload_bytes, mime_type)], 1)
+            if self.preprocessor is not None:
+                uploads = [self.preprocessor.process(upload, mime) for upload, mime in uploads]
+        return uploads, columns
+
+    def ask(self, contents, parse, first_tier=0):
+        """Send contents up the cascade from first_tier until parse(response) gives a usable result.
+
+        Returns (response text, parsed result). Without a cascade this is one request.
+        """
+        last = len(self.tiers) - 1
+        for tier in range(first_tier, last + 1):
+            start = time.perf_counter()
+            try:
+                response_text = self.generate(contents, backend=self.tiers[tier])
+                result = parse(response_text)
+            except Exception:
+                if tier == last:
+                    raise
+                reason = 'error'
+            else:
+                reason = escalation_reason(result) if tier < last else None
+            if last:
+                self.metrics.record(f'tier{tier + 1}', time.perf_counter() - start)
+                self.count_tier(tier, reason)
+            if reason is None:
+                return response_text, result
+
+    def count_tier(self, tier, reason):
+        """Count a result of a cascade tier: finished there, or escalated for reason."""
+        if reason is None:
+            self.metrics.add(f'tier{tier + 1}_finished')
+        else:
+            self.metrics.add(f'tier{tier + 1}_escalated')
+            self.metrics.add(f'escalated_{reason}')
+
+    def request(self, cache_key, upload_bytes, mime_type, first_tier=0):
+        """Send one image, store the response in the cache and return the parsed result."""
+        contents = [self.prompt, {"mime_type": mime_type, "data": upload_bytes}]
+        response_text, result = self.ask(contents, self.parse, first_tier)
+        if cache_key is not None:
+            self.cache.put(cache_key, response_text)
+        return result
+
+    def request_tiles(self, cache_key, tiles, columns):
+        """Send the tiles of an image in parallel and return their merged result, cached like one response."""
+        def send(item):
+            index, (upload_bytes, mime_type) = item
+            prompt = build_tile_prompt(self.custom_prompt, index + 1, len(tiles))
+            return self.ask([prompt, {"mime_type": mime_type, "data": upload_bytes}], self.parse_tile)[1]
+
+        results = [result for _, result in iter_batch(list(enumerate(tiles)), send, self.tiler.workers)]
+        self.metrics.add('tiles', len(tiles))
+        response_text = json.dumps(merge_results(results, columns), ensure_ascii=False)
+        if cache_key is not None:
+            self.cache.put(cache_key, response_text)
+        return self.parse(response_text)
+
+    def process_job(self, job):
+        """Process a single image or page and return the parsed result."""
+        try:
+            image_bytes = self.read(job)
+            cache_key = self.cache_key(job, image_bytes)
+            response_text = self.cached_response(cache_key)
+            if response_text is not None:
+                return self.parse(response_text)
+
+            uploads, columns = self.prepare(job, image_bytes)
+            if len(uploads) > 1:
+                return self.request_tiles(cache_key, uploads, columns)
+            return self.request(cache_key, *uploads[0])
+
+        except Exception as e:
+            print(f"Error processing image {job_label(job)}: {e}")
+            self.metrics.add('errors')
+            return {"error": str(e)}
+
+    def process_pack(self, jobs):
+        """Process several images with one request and return one result per job.
+
+        Cached images are answered from the cache. The others are sent
+        together, each preceded by an id, and the answer is split back by id.
+        Each image's part of the answer is cached on its own, as if it had
+        been sent alone. When the answer can't be split, every image is sent
+        again in a request of its own.
+        """
+        results = [None] * len(jobs)
+        pending = []  # (index, cache_key, upload_bytes, mime_type)
+        for index, job in enumerate(jobs):
+            try:
+                image_bytes = self.read(job)
+                cache_key = self.cache_key(job, image_bytes)
+                response_text = self.cached_response(cache_key)
+                if response_text is not None:
+                    results[index] = self.parse(response_text)
+                    continue
+                uploads, columns = self.prepare(job, image_bytes)
+                if len(uploads) > 1:
+                    # Tiled images are too large to share a request
+                    results[index] = self.request_tiles(cache_key, uploads, columns)
+                else:
+                    pending.append((index, cache_key) + uploads[0])
+            except Exception as e:
+                print(f"Error processing image {job_label(job)}: {e}")
+                results[index] = {"error": str(e)}
+                self.metrics.add('errors')
+
+        split = None
+        if len(pending) > 1:
+            ids = pack_ids(len(pending))
+            contents = [build_pack_prompt(self.custom_prompt, ids)]
+            for image_id, (_, _, upload_bytes, mime_type) in zip(ids, pending):
+                contents.append(f"{image_id}:")
+                contents.append({"mime_type": mime_type, "data": upload_bytes})
+            generation_config = {"response_mime_type": "application/json"}
+            if self.schema is not None:
+                generation_config["response_schema"] = pack_response_schema(ids, self.schema.response_schema)
+            try:
+                split = split_packed_response(parse_response(self.generate(contents, generation_config)), ids)
+            except Exception as e:
+                print(f"Error processing packed request of {len(pending)} images: {e}")
+            with self.lock:
+                self.pack_requests += 1
+                if split is None:
+                    self.pack_fallbacks += 1
+
+        if split is not None:
+            for image_id, (index, cache_key, upload_bytes, mime_type) in zip(ids, pending):
+                response_text = json.dumps(split[image_id], ensure_ascii=False)
+                result = self.parse(response_text)
+                if len(self.tiers) > 1:
+                    # The packed request went to the first tier; unusable answers move up the cascade one by one
+                    reason = escalation_reason(result)
+                    self.count_tier(0, reason)
+                    if reason is not None:
+                        try:
+                            results[index] = self.request(cache_key, upload_bytes, mime_type, first_tier=1)
+                        except Exception as e:
+                            print(f"Error processing image {job_label(jobs[index])}: {e}")
+                            results[index] = {"error": str(e)}
+                            self.metrics.add('errors')
+                        continue
+                if cache_key is not None:
+                    self.cache.put(cache_key, response_text)
+                results[index] = result
+        else:
+            # Fall back to one request per image
+            for index, cache_key, upload_bytes, mime_type in pending:
+                try:
+                    results[index] = self.request(cache_key, upload_bytes, mime_type)
+                except Exception as e:
+                    print(f"Error processing image {job_label(jobs[index])}: {e}")
+                    results[index] = {"error": str(e)}
+                    self.metrics.add('errors')
+        return results
+
+    def pack_summary(self):
+        return f"Packing: {self.pack_requests} packed requests, {self.pack_fallbacks} split back into single requests"
+
+    def cascade_summary(self):
+        """Return a one-line summary of where results finished in the cascade, with each tier's latency."""
+        report = self.metrics.report()
+        counters = report['counters']
+        tiers = []
+        for tier, backend in enumerate(self.tiers, 1):
+            summary = f"{backend.model} {counters.get(f'tier{tier}_finished', 0)} finished"
+            if counters.get(f'tier{tier}_escalated'):
+                summary += f", {counters[f'tier{tier}_escalated']} escalated"
+            latency = report['stages'].get(f'tier{tier}')
+            if latency:
+                summary += f" (p50 {latency['p50_seconds']:.2f}s p95 {latency['p95_seconds']:.2f}s)"
+            tiers.append(summary)
+        summary = "Cascade: " + '; '.join(tiers)
+        reasons = [f"{counters[f'escalated_{reason}']} {reason}" for reason in ESCALATION_REASONS
+                   if counters.get(f'escalated_{reason}')]
+        if reasons:
+            summary += f"; escalated for {', '.join(reasons)}"
+        return summary
@@ -0,0 +1,149 @@
+import json
+import hashlib
+
+# Schema keywords understood by the Gemini response_schema; others are dropped
+RESPONSE_SCHEMA_KEYS = {'type', 'format', 'description', 'nullable', 'enum', 'items', 'properties', 'required'}
+
+# Columns added to every row besides the schema fields
+ROW_META_COLUMNS = ['image_file', 'page', 'error', 'raw_text', 'schema_errors']
+
+JSON_TYPES = {
+    'object': dict,
+    'array': list,
+    'string': str,
+    'integer': int,
+    'number': (int, float),
+    'boolean': bool,
+}
+
+
+def load_schema(path):
+    """Read a JSON Schema from a file."""
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def check_schema(schema, path='$'):
+    """Raise ValueError unless schema and every property and item schema in it is a JSON object."""
+    if not isinstance(schema, dict):
+        raise ValueError(f"The output schema {path} must be a JSON object")
+    properties = schema.get('properties', {})
+    if not isinstance(properties, dict):
+        raise ValueError(f"The properties of the output schema {path} must be a JSON object")
+    for name, prop in properties.items():
+        check_schema(prop, f"{path}.{name}")
+    if 'items' in schema:
+        check_schema(schema['items'], f"{path}[]")
+
+
+def _schema_type(schema):
+    """Return (type, nullable) of a schema, accepting ["string", "null"] style types."""
+    schema_type = schema.get('type')
+    nullable = bool(schema.get('nullable'))
+    if isinstance(schema_type, list):
+        types = [t for t in schema_type if t != 'null']
+        nullable = nullable or len(types) != len(schema_type)
+        schema_type = types[0] if types else None
+    return schema_type, nullable
+
+
+def to_response_schema(schema):
+    """Convert a JSON Schema to the subset accepted as the model's response schema."""
+    converted = {key: value for key, value in schema.items() if key in RESPONSE_SCHEMA_KEYS}
+    schema_type, nullable = _schema_type(schema)
+    if schema_type:
+        converted['type'] = schema_type
+    if nullable:
+        converted['nullable'] = True
+    if 'properties' in schema:
+        converted['properties'] = {name: to_response_schema(prop) for name, prop in schema['properties'].items()}
+    if 'items' in schema:
+        converted['items'] = to_response_schema(schema['items'])
+    return converted
+
+
+def validate(value, schema, path='$'):
+    """Check value against the schema and return a list of error messages."""
+    schema_type, nullable = _schema_type(schema)
+    if value is None:
+        return [] if nullable or schema_type is None else [f"{path}: null is not allowed"]
+
+    expected = JSON_TYPES.get(schema_type)
+    # bool is a subclass of int, but not a JSON number
+    if expected and (not isinstance(value, expected) or (schema_type in ('integer', 'number') and isinstance(value, bool))):
+        return [f"{path}: expected {schema_type}"]
+
+    errors = []
+    if 'enum' in schema and value not in schema['enum']:
+        errors.append(f"{path}: {value!r} is not one of {schema['enum']}")
+    if schema_type == 'object':
+        for name in schema.get('required', []):
+            if name not in value:
+                errors.append(f"{path}.{name}: missing")
+        for name, prop in schema.get('properties', {}).items():
+            if name in value:
+                errors.extend(validate(value[name], prop, f"{path}.{name}"))
+    elif schema_type == 'array' and 'items' in schema:
+        for index, item in enumerate(value):
+            errors.extend(validate(item, schema['items'], f"{path}[{index}]"))
+    return errors
+
+
+def schema_columns(schema, prefix=''):
+    """Fixed column names for a schema: nested objects become dotted columns."""
+    columns = []
+    for name, prop in schema.get('properties', {}).items():
+        column = f"{prefix}.{name}" if prefix else name
+        if _schema_type(prop)[0] == 'object' and 'properties' in prop:
+            columns.extend(schema_columns(prop, column))
+        else:
+            columns.append(column)
+    return columns
+
+
+class OutputSchema:
+    """A JSON Schema for structured output.
+
+    Provides the response schema passed to the model, validates the parsed
+    results and flattens them into a fixed set of columns.
+    """
+
+    def __init__(self, schema):
+        check_schema(schema)
+        if _schema_type(schema)[0] != 'object' or 'properties' not in schema:
+            raise ValueError("The output schema must be an object with properties")
+        self.schema = schema
+        self.response_schema = to_response_schema(schema)
+        self.columns = schema_columns(schema)
+        self.row_columns = self.columns + [column for column in ROW_META_COLUMNS if column not in self.columns]
+
+    @classmethod
+    def from_file(cls, path):
+        return cls(load_schema(path))
+
+    @property
+    def cache_tag(self):
+        """Identify the schema, so cached responses are not shared between schemas."""
+        canonical = json.dumps(self.schema, sort_keys=True, ensure_ascii=False)
+        return "schema:" + hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+    def generation_config(self):
+        """Generation settings that make the model answer with JSON matching the schema."""
+        return {"response_mime_type": "application/json", "response_schema": self.response_schema}
+
+    def to_row(self, result):
+        """Validate a parsed result and flatten it into the schema columns."""
+        if not isinstance(result, dict) or set(result) == {'raw_text'}:
+            return result
+        row = {}
+        for column in self.columns:
+            value = result
+            for part in column.split('.'):
+                value = value.get(part) if isinstance(value, dict) else None
+            if isinstance(value, (list, dict)):
+                value = json.dumps(value, ensure_ascii=False)
+            row[column] = value
+        errors = validate(result, self.schema)
+        if errors:
+            row['schema_errors'] = '; '.join(errors)
+        return row
@@ -0,0 +1,94 @@
+import os
+
+# Images sent together in one request when packing is enabled
+DEFAULT_PACK_SIZE = 8
+
+# Upper bound for the image bytes of one packed request (inline data is limited to 20 MB per request)
+DEFAULT_PACK_BYTES = 4 * 1024 * 1024
+
+# Keys a model may use to label the items of a list answer
+ID_KEYS = ('id', 'image_id', 'image')
+
+
+def pack_ids(count):
+    """Identifiers used to label the images of a packed request."""
+    return [f"image_{number}" for number in range(1, count + 1)]
+
+
+def job_size(job):
+    """Estimated upload size of a job.
+
+    Uses the file size; for a page of a multi-page file this is the size of
+    the whole file, so such pages are packed conservatively.
+    """
+    if job.data is not None:
+        return len(job.data)
+    try:
+        return os.path.getsize(job.path)
+    except OSError:
+        # Reading the job will fail and report the error
+        return 0
+
+
+def pack_jobs(jobs, max_images=DEFAULT_PACK_SIZE, max_bytes=DEFAULT_PACK_BYTES, skip=None):
+    """Group jobs into lists of at most max_images jobs and about max_bytes.
+
+    Lazily yields the groups in input order. A job larger than max_bytes
+    gets a group of its own. Jobs for which skip(job) is true (for example
+    ones already in the journal) are yielded as single-job groups so they
+    don't take a place in a pack.
+    """
+    group = []
+    group_bytes = 0
+    for job in jobs:
+        if skip is not None and skip(job):
+            if group:
+                yield group
+                group, group_bytes = [], 0
+            yield [job]
+            continue
+        size = job_size(job)
+        if group and (len(group) >= max_images or group_bytes + size > max_bytes):
+            yield group
+            group, group_bytes = [], 0
+        group.append(job)
+        group_bytes += size
+    if group:
+        yield group
+
+
+def pack_response_schema(ids, item_schema):
+    """Response schema for a packed answer: one property per image id."""
+    return {
+        'type': 'object',
+        'properties': {image_id: item_schema for image_id in ids},
+        'required': list(ids),
+    }
+
+
+def split_packed_response(result, ids):
+    """Split a parsed packed answer into {image_id: result}.
+
+    Accepts an object keyed by image id (possibly wrapped in a single
+    top-level key) or a list of objects labelled with an id. Returns None
+    when the answer doesn't cover every image, so the caller can fall back
+    to one request per image.
+    """
+    if isinstance(result, dict) and len(result) == 1 and not set(result) & set(ids):
+        result = next(iter(result.values()))
+
+    if isinstance(result, list):
+        items = {}
+        for item in result:
+            if not isinstance(item, dict):
+                return None
+            id_key = next((key for key in ID_KEYS if key in item), None)
+            if id_key is not None and item[id_key] in ids:
+                items[item[id_key]] = {key: value for key, value in item.items() if key != id_key}
+        result = items
+
+    if not isinstance(result, dict):
+        return None
+    if any(result.get(image_id) is None for image_id in ids):
+        return None
+    return {image_id: result[image_id] for image_id in ids}
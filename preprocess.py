@@ -0,0 +1,94 @@
+import io
+import threading
+
+DEFAULT_MAX_EDGE = 2048
+DEFAULT_JPEG_QUALITY = 85
+
+# EXIF tag of the orientation that exif_transpose applies (1 means upright)
+ORIENTATION_TAG = 0x0112
+
+
+def format_bytes(size):
+    """Format a byte count for progress and summary output."""
+    if abs(size) < 1024:
+        return f"{size} B"
+    for unit in ('KB', 'MB', 'GB'):
+        size /= 1024
+        if abs(size) < 1024 or unit == 'GB':
+            return f"{size:.1f} {unit}"
+
+
+class ImagePreprocessor:
+    """Downscale and re-encode images before they are uploaded.
+
+    Applies the EXIF orientation, shrinks the image so its long edge is at
+    most max_edge pixels and re-encodes it as JPEG (optionally grayscale).
+    An image that needs neither rotating nor shrinking is uploaded as it
+    was when the JPEG would not be smaller. Keeps running byte counters so
+    the savings can be reported per run.
+    Safe to share between worker threads.
+    """
+
+    def __init__(self, max_edge=DEFAULT_MAX_EDGE, quality=DEFAULT_JPEG_QUALITY, grayscale=False):
+        self.max_edge = max_edge
+        self.quality = quality
+        self.grayscale = grayscale
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.kept = 0
+        self.lock = threading.Lock()
+
+    @property
+    def cache_tag(self):
+        """Identify the settings, so cached responses are not shared between them."""
+        return f"preprocess:max_edge={self.max_edge};quality={self.quality};grayscale={self.grayscale}"
+
+    def process(self, image_bytes, mime_type=None):
+        """Return (image_bytes, mime_type) ready for upload.
+
+        mime_type is the type of image_bytes; without it the image is always re-encoded.
+        """
+        # Pillow is imported on first use, so runs without preprocessing start faster
+        from PIL import Image, ImageOps
+        with Image.open(io.BytesIO(image_bytes)) as original:
+            image = ImageOps.exif_transpose(original)
+            if self.max_edge and max(image.size) > self.max_edge:
+                image.thumbnail((self.max_edge, self.max_edge), Image.LANCZOS)
+            unchanged = image.size == original.size and original.getexif().get(ORIENTATION_TAG, 1) == 1
+
+            if self.grayscale:
+                image = image.convert('L')
+            elif image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info):
+                # JPEG has no alpha channel, so flatten onto white
+                image = image.convert('RGBA')
+                background = Image.new('RGB', image.size, (255, 255, 255))
+                background.paste(image, mask=image.getchannel('A'))
+                image = background
+            elif image.mode not in ('RGB', 'L'):
+                image = image.convert('RGB')
+
+            output = io.BytesIO()
+            image.save(output, format='JPEG', quality=self.quality, optimize=True)
+            processed = output.getvalue()
+
+        keep = mime_type is not None and unchanged and len(image_bytes) <= len(processed)
+        with self.lock:
+            self.bytes_in += len(image_bytes)
+            if keep:
+                self.kept += 1
+                self.bytes_out += len(image_bytes)
+            else:
+                self.bytes_out += len(processed)
+        if keep:
+            return image_bytes, mime_type
+        return processed, "image/jpeg"
+
+    def summary(self):
+        """Return a one-line upload size summary for the end of a run."""
+        saved = self.bytes_in - self.bytes_out
+        percent = (saved / self.bytes_in * 100) if self.bytes_in else 0
+        summary = (f"Preprocessing: {format_bytes(self.bytes_in)} -> {format_bytes(self.bytes_out)} "
+                   f"(saved {format_bytes(saved)}, {percent:.0f}%)")
+        if self.kept:
+            summary += f", {self.kept} images kept as they were"
+        return summary
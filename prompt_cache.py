@@ -0,0 +1,181 @@
+import time
+import threading
+
+from rate_limit import classify_error
+
+DEFAULT_PROMPT_CACHE_TTL = 600
+
+# An entry this close to expiring is created anew rather than extended
+EXPIRY_MARGIN_SECONDS = 10
+
+# An entry is extended once less than this fraction of its TTL (on top of the margin) is left
+REFRESH_FRACTION = 0.25
+
+# After a throttled or transient error creating an entry, the prompt is sent inline this long before trying again
+CREATE_RETRY_SECONDS = 60
+
+# Error class names of a cached-content entry that no longer exists (expired or deleted), matched by name
+MISSING_ERRORS = {'NotFound'}
+
+# The service may also report a missing entry as "403 CachedContent not found (or permission denied)"
+DENIED_ERRORS = {'PermissionDenied', 'Forbidden'}
+
+
+def is_missing_entry_error(error):
+    """True when error means the cached-content entry a request referred to is gone."""
+    name = type(error).__name__
+    code = getattr(error, 'code', None)
+    if name in MISSING_ERRORS or code == 404:
+        return True
+    return (name in DENIED_ERRORS or code == 403) and 'cachedcontent' in str(error).lower()
+
+
+class CachedPromptBackend:
+    """Backend that sends the shared prompt of its PromptCache as a cached-content entry.
+
+    Requests whose contents start with the prompt refer to the entry
+    instead of carrying the prompt; anything else is passed on unchanged.
+    The entry is created on first use and extended before it expires.
+    When the service refuses to create it (the model has no caching, the
+    prompt is below the model's minimum size, ...) the prompt is sent
+    inline for the rest of the run; after a throttled or transient error
+    creation is tried again a little later. A request whose entry has
+    disappeared is sent again with the prompt inline.
+    """
+
+    def __init__(self, backend, prompt_cache):
+        self.backend = backend
+        self.prompt_cache = prompt_cache
+        self.name = None
+        self.expires = 0.0
+        self.retry_at = 0.0
+        self.unavailable = None
+        self.lock = threading.Lock()
+
+    @property
+    def model(self):
+        return self.backend.model
+
+    def generate(self, contents, generation_config=None):
+        return self.generate_with_usage(contents, generation_config)[0]
+
+    def generate_with_usage(self, contents, generation_config=None):
+        """Send contents, referring to the cached prompt when they start with it; returns (response text, token usage)."""
+        if not contents or contents[0] != self.prompt_cache.prompt:
+            return self.backend.generate_with_usage(contents, generation_config)
+        name = self.entry()
+        if name is not None:
+            try:
+                result = self.backend.generate_with_usage(contents[1:], generation_config, cached_prompt=name)
+            except Exception as e:
+                if not is_missing_entry_error(e):
+                    raise
+                self.forget(name)
+            else:
+                self.prompt_cache.count('hits')
+                return result
+        self.prompt_cache.count('inline')
+        return self.backend.generate_with_usage(contents, generation_config)
+
+    def entry(self):
+        """Name of the cached prompt, created or extended as needed; None to send the prompt inline."""
+        ttl = self.prompt_cache.ttl
+        with self.lock:
+            now = time.monotonic()
+            if self.unavailable is not None or now < self.retry_at:
+                return None
+            if self.name is not None and now < self.expires - EXPIRY_MARGIN_SECONDS - ttl * REFRESH_FRACTION:
+                return self.name
+            if self.name is not None and now < self.expires - EXPIRY_MARGIN_SECONDS:
+                try:
+                    self.backend.refresh_cached_prompt(self.name, ttl)
+                except Exception as e:
+                    if not is_missing_entry_error(e):
+                        # Still valid for a while; extending it is tried again on the next request
+                        return self.name
+                else:
+                    self.expires = now + ttl
+                    self.prompt_cache.count('refreshed')
+                    return self.name
+            self.name = None
+            try:
+                self.name = self.backend.create_cached_prompt(self.prompt_cache.prompt, ttl)
+            except Exception as e:
+                kind, retry_after = classify_error(e)
+                if kind is None:
+                    self.unavailable = str(e)
+                    print(f"Prompt caching is not available for {self.model}: {e}; "
+                          f"the prompt is sent with every request")
+                else:
+                    self.retry_at = now + (retry_after or CREATE_RETRY_SECONDS)
+                return None
+            self.expires = now + ttl
+            self.prompt_cache.count('created')
+            return self.name
+
+    def forget(self, name):
+        """Drop an entry the service no longer has, so the next request creates a new one."""
+        with self.lock:
+            if self.name == name:
+                self.name = None
+
+    def close(self):
+        """Delete the entry, so it is not stored (and billed) until it expires."""
+        with self.lock:
+            name, self.name = self.name, None
+        if name is None:
+            return
+        try:
+            self.backend.delete_cached_prompt(name)
+        except Exception as e:
+            print(f"Could not delete the cached prompt {name}: {e}")
+
+
+class PromptCache:
+    """Send the prompt shared by every image request of a run once, as cached content.
+
+    Every request of a run starts with the same prompt, and a long custom
+    prompt is paid for again with each image. With a prompt cache the
+    prompt is stored on the service once per backend, that is once per
+    model and API key, and the requests refer to it. Entries live for ttl
+    seconds and are extended while the run keeps using them; close()
+    deletes them at the end. wrap(backend) returns the backend to use in
+    place of backend. Safe to share between worker threads.
+    """
+
+    def __init__(self, prompt, ttl=DEFAULT_PROMPT_CACHE_TTL):
+        if ttl <= EXPIRY_MARGIN_SECONDS:
+            raise ValueError(f"The prompt cache TTL must be more than {EXPIRY_MARGIN_SECONDS} seconds")
+        self.prompt = prompt
+        self.ttl = ttl
+        self.backends = []
+        self.counters = {'created': 0, 'refreshed': 0, 'hits': 0, 'inline': 0}
+        self.lock = threading.Lock()
+
+    def wrap(self, backend):
+        cached = CachedPromptBackend(backend, self)
+        with self.lock:
+            self.backends.append(cached)
+        return cached
+
+    def count(self, counter):
+        with self.lock:
+            self.counters[counter] += 1
+
+    def close(self):
+        """Delete every entry of the run."""
+        with self.lock:
+            backends = list(self.backends)
+        for backend in backends:
+            backend.close()
+
+    def summary(self):
+        """Return a one-line prompt caching summary for the end of a run."""
+        with self.lock:
+            counters = dict(self.counters)
+            unavailable = sorted({backend.model for backend in self.backends if backend.unavailable is not None})
+        summary = (f"Prompt cache: {counters['created']} entries created, {counters['refreshed']} extended, "
+                   f"{counters['hits']} requests used the cached prompt, {counters['inline']} sent it inline")
+        if unavailable:
+            summary += f" (not available for {', '.join(unavailable)})"
+        return summary
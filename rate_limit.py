@@ -0,0 +1,197 @@
+import re
+import time
+import random
+import threading
+
+DEFAULT_MAX_RETRIES = 5
+
+# Rough token cost of one inline image and of the characters in a prompt,
+# used to charge the tokens-per-minute bucket before the request is sent
+IMAGE_TOKENS = 258
+CHARS_PER_TOKEN = 4
+
+# Error class names raised by google.api_core / the HTTP stack, matched by
+# name so this module does not depend on the client library
+THROTTLE_ERRORS = {'ResourceExhausted', 'TooManyRequests'}
+TRANSIENT_ERRORS = {'ServiceUnavailable', 'InternalServerError', 'DeadlineExceeded', 'GatewayTimeout',
+                    'BadGateway', 'Aborted', 'ConnectionError', 'TimeoutError', 'RemoteDisconnected'}
+
+RETRY_DELAY_PATTERNS = (
+    re.compile(r'retry_delay\s*\{\s*seconds:\s*(\d+)'),
+    re.compile(r'retry in\s*([\d.]+)\s*s', re.IGNORECASE),
+    re.compile(r'retry-after:?\s*([\d.]+)', re.IGNORECASE),
+)
+
+
+def estimate_tokens(prompt, image_count=1):
+    """Estimate the input tokens of a request for rate limiting."""
+    return len(prompt) // CHARS_PER_TOKEN + IMAGE_TOKENS * image_count
+
+
+def classify_error(error):
+    """Return ('throttled' | 'transient' | None, retry_after_seconds) for an exception."""
+    name = type(error).__name__
+    code = getattr(error, 'code', None)
+    message = str(error)
+
+    retry_after = None
+    for pattern in RETRY_DELAY_PATTERNS:
+        match = pattern.search(message)
+        if match:
+            retry_after = float(match.group(1))
+            break
+
+    if name in THROTTLE_ERRORS or code == 429 or '429' in message[:20]:
+        return 'throttled', retry_after
+    if name in TRANSIENT_ERRORS or code in (500, 502, 503, 504):
+        return 'transient', retry_after
+    return None, None
+
+
+class TokenBucket:
+    """Token bucket refilled continuously at rate_per_minute."""
+
+    def __init__(self, rate_per_minute, capacity=None):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = capacity or rate_per_minute
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self, amount=1):
+        """Block until amount tokens are available, then take them."""
+        amount = min(amount, self.capacity)
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return
+                wait = (amount - self.tokens) / self.rate
+            time.sleep(wait)
+
+    def wait_time(self, amount=1):
+        """Seconds until amount tokens are available, without taking them."""
+        amount = min(amount, self.capacity)
+        with self.lock:
+            tokens = min(self.capacity, self.tokens + (time.monotonic() - self.updated) * self.rate)
+        return max(0.0, (amount - tokens) / self.rate)
+
+
+class AdaptiveConcurrency:
+    """Concurrency limit that backs off on throttling and recovers when healthy.
+
+    The limit is halved whenever a request is throttled and raised by one
+    after increase_after consecutive successes, up to maximum.
+    """
+
+    def __init__(self, maximum, minimum=1, increase_after=10):
+        self.maximum = max(1, maximum)
+        self.minimum = max(1, min(minimum, self.maximum))
+        self.limit = self.maximum
+        self.increase_after = increase_after
+        self.active = 0
+        self.successes = 0
+        self.condition = threading.Condition()
+
+    def acquire(self):
+        with self.condition:
+            while self.active >= self.limit:
+                self.condition.wait()
+            self.active += 1
+
+    def release(self):
+        with self.condition:
+            self.active -= 1
+            self.condition.notify()
+
+    def on_success(self):
+        with self.condition:
+            self.successes += 1
+            if self.successes >= self.increase_after and self.limit < self.maximum:
+                self.limit += 1
+                self.successes = 0
+                self.condition.notify()
+
+    def on_throttled(self):
+        with self.condition:
+            self.limit = max(self.minimum, self.limit // 2)
+            self.successes = 0
+
+
+class RetryPolicy:
+    """Exponential backoff with jitter that honors server retry hints."""
+
+    def __init__(self, max_retries=DEFAULT_MAX_RETRIES, base_delay=1.0, max_delay=60.0):
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def delay(self, attempt, retry_after=None):
+        """Seconds to wait before retry number attempt (starting at 0)."""
+        if retry_after is not None:
+            return min(self.max_delay, retry_after) + random.uniform(0, self.base_delay)
+        backoff = min(self.max_delay, self.base_delay * (2 ** attempt))
+        return random.uniform(backoff / 2, backoff)
+
+
+class RequestScheduler:
+    """Rate limiting, adaptive concurrency and retries around API calls.
+
+    One scheduler is shared by every worker of a run, so the request and
+    token budgets (rpm / tpm, 0 for unlimited) apply to the run as a whole.
+    """
+
+    def __init__(self, rpm=0, tpm=0, max_concurrency=8, retry_policy=None):
+        self.request_bucket = TokenBucket(rpm) if rpm else None
+        self.token_bucket = TokenBucket(tpm) if tpm else None
+        self.concurrency = AdaptiveConcurrency(max_concurrency)
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.retries = 0
+        self.throttled = 0
+        self.lock = threading.Lock()
+
+    def call(self, func, tokens=0):
+        """Call func() within the limits, retrying throttled and transient errors."""
+        attempt = 0
+        while True:
+            self.concurrency.acquire()
+            try:
+                if self.request_bucket:
+                    self.request_bucket.acquire()
+                if self.token_bucket and tokens:
+                    self.token_bucket.acquire(tokens)
+                result = func()
+            except Exception as e:
+                kind, retry_after = classify_error(e)
+                if kind is None or attempt >= self.retry_policy.max_retries:
+                    raise
+                if kind == 'throttled':
+                    self.concurrency.on_throttled()
+                with self.lock:
+                    self.retries += 1
+                    if kind == 'throttled':
+                        self.throttled += 1
+                delay = self.retry_policy.delay(attempt, retry_after)
+                attempt += 1
+            else:
+                self.concurrency.on_success()
+                return result
+            finally:
+                self.concurrency.release()
+            # Wait outside the concurrency slot so other requests can proceed
+            time.sleep(delay)
+
+    def wait_time(self, tokens=0):
+        """Seconds until a request of tokens would pass the rate limits."""
+        wait = self.request_bucket.wait_time() if self.request_bucket else 0.0
+        if self.token_bucket and tokens:
+            wait = max(wait, self.token_bucket.wait_time(tokens))
+        return wait
+
+    def summary(self):
+        """Return a one-line retry summary for the end of a run."""
+        return (f"Rate limiting: {self.retries} retries ({self.throttled} throttled), "
+                f"final concurrency {self.concurrency.limit}")
@@ -0,0 +1,121 @@
+import re
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Fenced code blocks, with or without a language tag (```json ... ```)
+FENCED_BLOCK_PATTERN = re.compile(r'```[ \t]*(?:json|JSON)?[ \t]*\r?\n(.*?)\r?\n?[ \t]*```', re.DOTALL)
+
+# Possible starts of a JSON value embedded in prose
+JSON_START_PATTERN = re.compile(r'[{\[]')
+
+# Give up on prose scanning after this many candidate starts
+MAX_EMBEDDED_ATTEMPTS = 20
+
+_decoder = json.JSONDecoder()
+
+
+def loads(text):
+    """Parse JSON text, using orjson when it is installed.
+
+    Both backends raise a ValueError subclass on invalid input.
+    """
+    if orjson is not None:
+        return orjson.loads(text)
+    return json.loads(text)
+
+
+def _try_loads(text):
+    try:
+        return loads(text), True
+    except ValueError:
+        return None, False
+
+
+def _merge_values(values):
+    """Combine the values of several JSON blocks into one result."""
+    if len(values) == 1:
+        return values[0]
+    if all(isinstance(value, dict) for value in values):
+        merged = {}
+        for value in values:
+            merged.update(value)
+        return merged
+    return values
+
+
+def _is_structured(value):
+    """Objects and arrays of objects; skips prose fragments such as "[1]"."""
+    if isinstance(value, dict):
+        return True
+    return isinstance(value, list) and bool(value) and all(isinstance(item, dict) for item in value)
+
+
+def _inside_json(text, start, end):
+    """True when text[start:end] looks like a fragment of a larger, broken JSON value."""
+    before = text[:start].rstrip()
+    if before.endswith(('[', '{', ',', '":')):
+        return True
+    return text[end:].lstrip().startswith((',', ']', '}', ':'))
+
+
+def _find_embedded(text):
+    """Find the first JSON object or array of objects embedded in surrounding prose.
+
+    Values nested inside a truncated or invalid JSON document are ignored,
+    so a broken response is not mistaken for one of its inner items.
+    """
+    for attempt, match in enumerate(JSON_START_PATTERN.finditer(text)):
+        if attempt >= MAX_EMBEDDED_ATTEMPTS:
+            break
+        try:
+            value, end = _decoder.raw_decode(text, match.start())
+        except json.JSONDecodeError:
+            continue
+        if _is_structured(value) and not _inside_json(text, match.start(), end):
+            return value, True
+    return None, False
+
+
+def parse_response(response_text):
+    """Parse a model response into JSON data, falling back to the raw text.
+
+    Handles, in order of cost: plain JSON (JSON-mode responses), one or more
+    fenced code blocks, and a JSON value embedded in prose. If nothing
+    parses, returns {"raw_text": response_text}.
+    """
+    text = response_text.strip()
+
+    # JSON-mode responses are the whole text
+    if text[:1] in ('{', '['):
+        value, ok = _try_loads(text)
+        if ok:
+            return value
+
+    # Fenced blocks; several blocks are merged
+    if '```' in text:
+        values = []
+        for block in FENCED_BLOCK_PATTERN.findall(text):
+            value, ok = _try_loads(block)
+            if not ok:
+                value, ok = _find_embedded(block)
+            if ok:
+                values.append(value)
+        if values:
+            return _merge_values(values)
+
+    # Bare JSON with leading or trailing prose
+    value, ok = _find_embedded(text)
+    if ok:
+        return value
+
+    # If the response is not valid JSON, just return the raw text
+    return {"raw_text": response_text}
+
+
+def is_parsed(result):
+    """True when a parse_response result is JSON data rather than the raw text fallback."""
+    return not (isinstance(result, dict) and set(result) == {'raw_text'})
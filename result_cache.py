@@ -0,0 +1,109 @@
+import time
+import sqlite3
+import hashlib
+import threading
+
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+
+
+def make_cache_key(image_bytes, model, prompt, variant=''):
+    """Build a content-addressed key from the image bytes, model name and final prompt.
+
+    variant distinguishes settings that change what is sent for the same
+    source bytes, such as image preprocessing.
+    """
+    digest = hashlib.sha256(image_bytes)
+    digest.update(b'\0' + model.encode('utf-8'))
+    digest.update(b'\0' + prompt.encode('utf-8'))
+    if variant:
+        digest.update(b'\0' + variant.encode('utf-8'))
+    return digest.hexdigest()
+
+
+class ResultCache:
+    """On-disk cache of model responses backed by SQLite.
+
+    Entries are evicted least-recently-used first once the stored responses
+    exceed max_bytes. With refresh, every lookup is a miss but new responses
+    are still stored. The cache is safe to share between worker threads.
+    """
+
+    def __init__(self, path, max_bytes=DEFAULT_MAX_BYTES, refresh=False):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.refresh = refresh
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        with self.conn:
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, response TEXT NOT NULL, "
+                "size INTEGER NOT NULL, last_access REAL NOT NULL)"
+            )
+            self.conn.execute(
+                "CREATE INDEX IF NOT EXISTS responses_last_access ON responses (last_access)"
+            )
+        self.total_bytes = self.conn.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM responses"
+        ).fetchone()[0]
+
+    def get(self, key):
+        """Return the cached response text for key, or None on a miss."""
+        with self.lock:
+            row = None
+            if not self.refresh:
+                row = self.conn.execute(
+                    "SELECT response FROM responses WHERE key = ?", (key,)
+                ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            with self.conn:
+                self.conn.execute(
+                    "UPDATE responses SET last_access = ? WHERE key = ?", (time.time(), key)
+                )
+            self.hits += 1
+            return row[0]
+
+    def put(self, key, response_text):
+        """Store a response and evict old entries if the cache is over its size limit."""
+        size = len(response_text.encode('utf-8'))
+        with self.lock:
+            with self.conn:
+                old = self.conn.execute(
+                    "SELECT size FROM responses WHERE key = ?", (key,)
+                ).fetchone()
+                if old:
+                    self.total_bytes -= old[0]
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO responses (key, response, size, last_access) "
+                    "VALUES (?, ?, ?, ?)",
+                    (key, response_text, size, time.time())
+                )
+                self.total_bytes += size
+                self._evict()
+
+    def _evict(self):
+        """Delete least recently used entries until the cache fits in max_bytes."""
+        while self.total_bytes > self.max_bytes:
+            rows = self.conn.execute(
+                "SELECT key, size FROM responses ORDER BY last_access LIMIT 100"
+            ).fetchall()
+            if not rows:
+                self.total_bytes = 0
+                break
+            for key, size in rows:
+                self.conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self.total_bytes -= size
+                if self.total_bytes <= self.max_bytes:
+                    break
+
+    def summary(self):
+        """Return a one-line hit/miss summary for the end of a run."""
+        return f"Cache: {self.hits} hits, {self.misses} misses"
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
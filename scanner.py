@@ -0,0 +1,164 @@
+import os
+import stat
+import fnmatch
+import hashlib
+
+from image_input import IMAGE_EXTENSIONS
+
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def file_hash(path):
+    """SHA-256 of a file's content, read in chunks."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def matches_any(rel_path, patterns):
+    """True when a relative path or its file name matches one of the glob patterns (case-insensitive)."""
+    rel_path = rel_path.replace(os.sep, '/').lower()
+    name = rel_path.rsplit('/', 1)[-1]
+    return any(fnmatch.fnmatchcase(rel_path, pattern) or fnmatch.fnmatchcase(name, pattern)
+               for pattern in patterns)
+
+
+class FolderScanner:
+    """Lazily find image files under a folder.
+
+    Iterating yields file paths as directories are read, so processing can
+    start while a large tree is still being scanned. Directories are walked
+    depth-first with os.scandir, entries of each directory in name order;
+    symbolic links to directories are not followed. Extensions are matched
+    case-insensitively.
+
+    include and exclude are glob patterns matched against the path relative
+    to the folder or the file name; an excluded directory is not entered.
+    Files can be filtered by size in bytes and by modification time
+    (timestamps). With dedup, files with the same content as an earlier
+    file are skipped; content is only hashed for files whose size matches
+    another file's.
+    """
+
+    def __init__(self, root, recursive=True, include=(), exclude=(), min_size=0, max_size=None,
+                 modified_after=None, modified_before=None, dedup=False, extensions=IMAGE_EXTENSIONS):
+        self.root = root
+        self.recursive = recursive
+        self.include = [pattern.lower() for pattern in include]
+        self.exclude = [pattern.lower() for pattern in exclude]
+        self.min_size = min_size
+        self.max_size = max_size
+        self.modified_after = modified_after
+        self.modified_before = modified_before
+        self.dedup = dedup
+        self.extensions = tuple(extension.lower() for extension in extensions)
+        self.found = 0
+        self.filtered = 0
+        self.duplicates = 0
+        self.sizes = {}  # size -> path of the first file with that size, until it is hashed
+        self.hashes = set()
+
+    def __iter__(self):
+        stack = [self.root]
+        while stack:
+            directory = stack.pop()
+            try:
+                with os.scandir(directory) as it:
+                    entries = sorted(it, key=lambda entry: entry.name)
+            except OSError as e:
+                print(f"Error reading directory {directory}: {e}")
+                continue
+
+            subdirectories = []
+            for entry in entries:
+                rel_path = os.path.relpath(entry.path, self.root)
+                if self.exclude and matches_any(rel_path, self.exclude):
+                    continue
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        if self.recursive:
+                            subdirectories.append(entry.path)
+                        continue
+                    if not entry.name.lower().endswith(self.extensions):
+                        continue
+                    if self.include and not matches_any(rel_path, self.include):
+                        continue
+                    info = entry.stat()
+                    if not stat.S_ISREG(info.st_mode):
+                        continue
+                    if not self.accept(info):
+                        self.filtered += 1
+                        continue
+                    if self.dedup and self.is_duplicate(entry.path, info.st_size):
+                        self.duplicates += 1
+                        continue
+                except OSError as e:
+                    print(f"Error reading {entry.path}: {e}")
+                    continue
+                self.found += 1
+                yield entry.path
+
+            # Visit subdirectories in name order
+            stack.extend(reversed(subdirectories))
+
+    def select(self, path):
+        """Apply the filters to a single file, such as one reported by a file system event.
+
+        Returns the file's os.stat result, or None when the file is not selected.
+        """
+        rel_path = os.path.relpath(path, self.root)
+        parts = rel_path.split(os.sep)
+        if parts[0] == os.pardir or (not self.recursive and len(parts) > 1):
+            return None
+        if self.exclude and any(matches_any(os.path.join(*parts[:depth]), self.exclude)
+                                for depth in range(1, len(parts) + 1)):
+            return None
+        if not path.lower().endswith(self.extensions):
+            return None
+        if self.include and not matches_any(rel_path, self.include):
+            return None
+        try:
+            info = os.stat(path)
+        except OSError:
+            return None
+        if not stat.S_ISREG(info.st_mode) or not self.accept(info):
+            return None
+        return info
+
+    def accept(self, info):
+        """Apply the size and modification time filters."""
+        if info.st_size < self.min_size:
+            return False
+        if self.max_size is not None and info.st_size > self.max_size:
+            return False
+        if self.modified_after is not None and info.st_mtime < self.modified_after:
+            return False
+        if self.modified_before is not None and info.st_mtime >= self.modified_before:
+            return False
+        return True
+
+    def is_duplicate(self, path, size):
+        """True when a file with the same content was already yielded."""
+        if size not in self.sizes:
+            # First file of this size; hashed only if another one shows up
+            self.sizes[size] = path
+            return False
+        first = self.sizes[size]
+        if first is not None:
+            self.hashes.add(file_hash(first))
+            self.sizes[size] = None
+        digest = file_hash(path)
+        if digest in self.hashes:
+            return True
+        self.hashes.add(digest)
+        return False
+
+    def summary(self):
+        summary = f"Scanned: {self.found} images"
+        if self.filtered:
+            summary += f", {self.filtered} filtered out"
+        if self.duplicates:
+            summary += f", {self.duplicates} duplicates skipped"
+        return summary
@@ -0,0 +1,324 @@
+import json
+import time
+import uuid
+import asyncio
+import hashlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit, parse_qs
+
+from image_input import ImageJob
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8080
+
+# Largest accepted upload (the API accepts up to 20 MB of inline data per request)
+DEFAULT_MAX_UPLOAD_BYTES = 20 * 1024 * 1024
+
+# Finished jobs kept for GET /jobs/<id>; the oldest are dropped first
+DEFAULT_MAX_RESULTS = 10000
+
+# Jobs waiting for a worker; further submissions are answered 503 until the queue drains (0: no limit)
+DEFAULT_MAX_QUEUED = 1000
+
+# Retry-After sent with a 503 for a full queue
+QUEUE_FULL_RETRY_SECONDS = 5
+
+MAX_HEADER_BYTES = 64 * 1024
+
+STATUS_TEXT = {
+    200: 'OK',
+    202: 'Accepted',
+    400: 'Bad Request',
+    404: 'Not Found',
+    405: 'Method Not Allowed',
+    411: 'Length Required',
+    413: 'Payload Too Large',
+    500: 'Internal Server Error',
+    503: 'Service Unavailable',
+}
+
+
+class HttpError(Exception):
+    def __init__(self, status, message, headers=None):
+        super().__init__(message)
+        self.status = status
+        self.headers = headers or {}
+
+
+class OcrJob:
+    """One submitted image and, once processed, its result row."""
+
+    def __init__(self, key, name, page, data):
+        self.id = uuid.uuid4().hex
+        self.key = key
+        self.name = name
+        self.page = page
+        self.data = data
+        self.status = 'queued'
+        self.result = None
+        self.submitted = time.time()
+        self.finished = None
+        self.done = asyncio.Event()
+
+    def to_dict(self):
+        info = {'id': self.id, 'status': self.status, 'image_file': self.name}
+        if self.page is not None:
+            info['page'] = self.page
+        if self.result is not None:
+            info['result'] = self.result
+            info['seconds'] = round(self.finished - self.submitted, 3)
+        return info
+
+
+class OcrService:
+    """Job queue in front of one shared OCR client.
+
+    process(job) is the blocking call that turns an ImageJob into a result
+    row; it runs on a thread pool with at most concurrency jobs at a time,
+    so every caller shares the same client, cache and rate limiter.
+    Submitting an image (same bytes and page) that is already queued or
+    being processed returns the existing job instead of a new one. At most
+    max_queued jobs wait for a worker; submit() raises asyncio.QueueFull
+    beyond that.
+    """
+
+    def __init__(self, process, concurrency=4, max_results=DEFAULT_MAX_RESULTS, max_queued=DEFAULT_MAX_QUEUED):
+        self.process = process
+        self.concurrency = max(1, concurrency)
+        self.max_results = max_results
+        self.max_queued = max(0, max_queued)
+        self.jobs = {}  # id -> OcrJob
+        self.finished = deque()  # ids of finished jobs, oldest first
+        self.in_flight = {}  # image key -> OcrJob still queued or running
+        self.queue = None
+        self.executor = None
+        self.workers = []
+        self.submitted = 0
+        self.coalesced = 0
+        self.completed = 0
+        self.rejected = 0
+
+    async def start(self):
+        self.queue = asyncio.Queue(maxsize=self.max_queued)
+        self.executor = ThreadPoolExecutor(max_workers=self.concurrency)
+        self.workers = [asyncio.create_task(self.work()) for _ in range(self.concurrency)]
+
+    async def stop(self):
+        for worker in self.workers:
+            worker.cancel()
+        await asyncio.gather(*self.workers, return_exceptions=True)
+        self.executor.shutdown(wait=False)
+
+    def submit(self, data, name, page=None):
+        """Queue an image; returns (job, coalesced). Raises asyncio.QueueFull when max_queued jobs are waiting."""
+        key = hashlib.sha256(data).hexdigest() + (f";page={page}" if page is not None else '')
+        job = self.in_flight.get(key)
+        if job is not None:
+            self.submitted += 1
+            self.coalesced += 1
+            return job, True
+        job = OcrJob(key, name, page, data)
+        try:
+            self.queue.put_nowait(job)
+        except asyncio.QueueFull:
+            self.rejected += 1
+            raise
+        self.submitted += 1
+        self.jobs[job.id] = job
+        self.in_flight[key] = job
+        return job, False
+
+    def get(self, job_id):
+        return self.jobs.get(job_id)
+
+    async def work(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            job = await self.queue.get()
+            job.status = 'running'
+            try:
+                job.result = await loop.run_in_executor(self.executor, self.process,
+                                                        ImageJob(job.name, job.page, job.data))
+            except Exception as e:
+                job.result = {'error': str(e)}
+            job.status = 'done'
+            job.finished = time.time()
+            job.data = None
+            del self.in_flight[job.key]
+            self.completed += 1
+            self.finished.append(job.id)
+            job.done.set()
+            self.forget_old_jobs()
+
+    def forget_old_jobs(self):
+        """Drop the oldest finished jobs beyond max_results."""
+        while len(self.finished) > self.max_results:
+            del self.jobs[self.finished.popleft()]
+
+    def stats(self):
+        return {
+            'queued': self.queue.qsize(),
+            'in_flight': len(self.in_flight),
+            'submitted': self.submitted,
+            'coalesced': self.coalesced,
+            'completed': self.completed,
+            'rejected': self.rejected,
+            'max_queued': self.max_queued,
+            'concurrency': self.concurrency,
+        }
+
+
+async def read_request(reader, max_body):
+    """Read one HTTP/1.1 request; returns (method, path, query, headers, body) or None at end of stream."""
+    try:
+        head = await reader.readuntil(b'\r\n\r\n')
+    except asyncio.IncompleteReadError as e:
+        if not e.partial:
+            return None
+        raise HttpError(400, 'Incomplete request')
+    except asyncio.LimitOverrunError:
+        raise HttpError(400, 'Request header too large')
+
+    lines = head.decode('latin-1').split('\r\n')
+    try:
+        method, target, _ = lines[0].split(' ', 2)
+    except ValueError:
+        raise HttpError(400, 'Malformed request line')
+    headers = {}
+    for line in lines[1:]:
+        if ':' in line:
+            name, value = line.split(':', 1)
+            headers[name.strip().lower()] = value.strip()
+
+    body = b''
+    if 'content-length' in headers:
+        try:
+            length = int(headers['content-length'])
+        except ValueError:
+            raise HttpError(400, 'Invalid Content-Length')
+        if length > max_body:
+            raise HttpError(413, f'Upload larger than {max_body} bytes')
+        body = await reader.readexactly(length)
+    elif method == 'POST':
+        raise HttpError(411, 'Content-Length required')
+
+    url = urlsplit(target)
+    query = {name: values[-1] for name, values in parse_qs(url.query).items()}
+    return method, url.path, query, headers, body
+
+
+def write_response(writer, status, payload, keep_alive, extra_headers=None):
+    """Send a JSON response, or a plain text one when payload is a string."""
+    if isinstance(payload, str):
+        body = payload.encode('utf-8')
+        content_type = 'text/plain; version=0.0.4; charset=utf-8'
+    else:
+        body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        content_type = 'application/json; charset=utf-8'
+    head = (f"HTTP/1.1 {status} {STATUS_TEXT.get(status, '')}\r\n"
+            f"Content-Type: {content_type}\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            + ''.join(f"{name}: {value}\r\n" for name, value in (extra_headers or {}).items())
+            + f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n")
+    writer.write(head.encode('latin-1') + body)
+
+
+class OcrServer:
+    """Minimal asyncio HTTP front end for an OcrService.
+
+    POST /jobs              body is the image file; ?name=<file name>&page=<n>&wait=1
+    GET  /jobs/<id>         job status and, when done, the result row; ?wait=1 blocks until done
+    GET  /health            queue and client statistics
+    GET  /metrics           stage timings and counters in the Prometheus text format
+
+    With wait=1 the response is sent when the job is done, otherwise
+    POST answers 202 with the job id right away. When the job queue is
+    full POST answers 503 with a Retry-After header.
+    """
+
+    def __init__(self, service, max_upload_bytes=DEFAULT_MAX_UPLOAD_BYTES, stats=None, metrics=None):
+        self.service = service
+        self.max_upload_bytes = max_upload_bytes
+        self.stats = stats
+        self.metrics = metrics
+
+    async def handle_connection(self, reader, writer):
+        try:
+            while True:
+                keep_alive = False
+                extra_headers = None
+                try:
+                    request = await read_request(reader, self.max_upload_bytes)
+                    if request is None:
+                        break
+                    method, path, query, headers, body = request
+                    keep_alive = headers.get('connection', '').lower() != 'close'
+                    status, payload = await self.route(method, path, query, body)
+                except HttpError as e:
+                    status, payload, extra_headers = e.status, {'error': str(e)}, e.headers
+                except (asyncio.IncompleteReadError, ConnectionError):
+                    break
+                except Exception as e:
+                    status, payload = 500, {'error': str(e)}
+                write_response(writer, status, payload, keep_alive, extra_headers)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def route(self, method, path, query, body):
+        wait = query.get('wait') in ('1', 'true', 'yes')
+        if path == '/jobs':
+            if method != 'POST':
+                raise HttpError(405, 'Use POST to submit an image')
+            if not body:
+                raise HttpError(400, 'The request body must contain the image')
+            try:
+                page = int(query['page']) if 'page' in query else None
+            except ValueError:
+                raise HttpError(400, 'page must be a number')
+            try:
+                job, coalesced = self.service.submit(body, query.get('name', 'upload'), page)
+            except asyncio.QueueFull:
+                raise HttpError(503, f'The job queue is full ({self.service.max_queued} jobs); try again later',
+                                {'Retry-After': QUEUE_FULL_RETRY_SECONDS})
+            if wait:
+                await job.done.wait()
+            return (200 if job.status == 'done' else 202), dict(job.to_dict(), coalesced=coalesced)
+
+        if path.startswith('/jobs/'):
+            if method != 'GET':
+                raise HttpError(405, 'Use GET to fetch a job')
+            job = self.service.get(path[len('/jobs/'):])
+            if job is None:
+                raise HttpError(404, 'Unknown or expired job id')
+            if wait:
+                await job.done.wait()
+            return 200, job.to_dict()
+
+        if path == '/health':
+            payload = {'status': 'ok', 'jobs': self.service.stats()}
+            if self.stats is not None:
+                payload.update(self.stats())
+            return 200, payload
+
+        if path == '/metrics' and self.metrics is not None:
+            return 200, self.metrics.to_prometheus()
+
+        raise HttpError(404, 'Not found')
+
+    async def serve(self, host=DEFAULT_HOST, port=DEFAULT_PORT, ready=None):
+        """Serve until cancelled; ready(host, port) is called once the socket is listening."""
+        await self.service.start()
+        server = await asyncio.start_server(self.handle_connection, host, port, limit=MAX_HEADER_BYTES)
+        if ready is not None:
+            ready(*server.sockets[0].getsockname()[:2])
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            await self.service.stop()
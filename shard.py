@@ -0,0 +1,212 @@
+import os
+import time
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+from image_input import ImageJob
+from journal import job_key
+
+# A claimed item is handed to another worker when its lease is not renewed for this long
+DEFAULT_LEASE_SECONDS = 300
+
+# Items that failed or whose worker died this many times are given up on (reported as errors on merge)
+DEFAULT_MAX_ATTEMPTS = 3
+
+# Seconds an idle worker waits before checking for reclaimable items again
+DEFAULT_IDLE_INTERVAL = 30
+
+PENDING = 'pending'
+LEASED = 'leased'
+DONE = 'done'
+FAILED = 'failed'
+
+
+def default_queue_path(output_path):
+    """Work queue database kept next to the output file."""
+    return output_path + '.shard.sqlite'
+
+
+def worker_output_path(output_path, worker):
+    """Per-worker result file, in the journal format, kept next to the output file."""
+    return f"{output_path}.shard-{worker}.jsonl"
+
+
+class WorkQueue:
+    """Work queue shared by several worker processes or hosts, backed by SQLite.
+
+    The database is meant to live on a file system every worker can reach
+    (such as an NFS or SMB share next to the images). Items are claimed
+    with a lease of lease_seconds that the worker renews with heartbeat()
+    while it is alive. An item whose lease has expired, because its worker
+    died or lost the share, is claimed again by another worker. An item
+    whose image failed is put back with fail() to be tried again. After
+    max_attempts attempts it is marked failed instead, so an image that
+    keeps failing or crashes workers does not stall the queue.
+
+    Claims run in an immediate (write-locked) transaction, so two workers
+    never get the same item while its lease is valid. The rollback journal
+    is used rather than WAL, which does not work on network file systems.
+    """
+
+    def __init__(self, path, lease_seconds=DEFAULT_LEASE_SECONDS, max_attempts=DEFAULT_MAX_ATTEMPTS):
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.lock = threading.Lock()
+        # Other workers may hold the write lock briefly; wait for it rather than failing
+        self.conn = sqlite3.connect(path, timeout=60, isolation_level=None, check_same_thread=False)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS items ("
+            "id INTEGER PRIMARY KEY, key TEXT UNIQUE NOT NULL, path TEXT NOT NULL, page INTEGER, "
+            "state TEXT NOT NULL, worker TEXT, lease_expires REAL, attempts INTEGER NOT NULL DEFAULT 0)"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS items_state ON items (state, id)")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS workers ("
+            "worker TEXT PRIMARY KEY, output_path TEXT NOT NULL, last_seen REAL NOT NULL)"
+        )
+
+    @contextmanager
+    def transaction(self):
+        """Run the caller's statements under the database write lock (BEGIN IMMEDIATE)."""
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield self.conn
+            except BaseException:
+                self.conn.execute("ROLLBACK")
+                raise
+            self.conn.execute("COMMIT")
+
+    def add(self, jobs, batch_size=1000):
+        """Add jobs to the queue in order; jobs already in it are skipped. Returns the number added."""
+        added = 0
+        batch = []
+
+        def flush():
+            nonlocal added
+            with self.transaction() as conn:
+                before = conn.total_changes
+                conn.executemany("INSERT OR IGNORE INTO items (key, path, page, state) VALUES (?, ?, ?, ?)", batch)
+                added += conn.total_changes - before
+            batch.clear()
+
+        for job in jobs:
+            batch.append((job_key(job), os.path.abspath(job.path), job.page, PENDING))
+            if len(batch) >= batch_size:
+                flush()
+        if batch:
+            flush()
+        return added
+
+    def register(self, worker, output_path):
+        """Record a worker and where it writes its results."""
+        with self.transaction() as conn:
+            conn.execute("INSERT OR REPLACE INTO workers (worker, output_path, last_seen) VALUES (?, ?, ?)",
+                         (worker, output_path, time.time()))
+
+    def claim(self, worker, count):
+        """Lease up to count pending or expired items to worker; returns [(id, ImageJob)]."""
+        now = time.time()
+        with self.transaction() as conn:
+            # Give up on items whose worker keeps dying
+            conn.execute("UPDATE items SET state = ?, worker = NULL WHERE state = ? AND lease_expires < ? "
+                         "AND attempts >= ?", (FAILED, LEASED, now, self.max_attempts))
+            rows = conn.execute(
+                "SELECT id, path, page FROM items WHERE state = ? OR (state = ? AND lease_expires < ?) "
+                "ORDER BY id LIMIT ?", (PENDING, LEASED, now, count)
+            ).fetchall()
+            conn.executemany("UPDATE items SET state = ?, worker = ?, lease_expires = ?, attempts = attempts + 1 "
+                             "WHERE id = ?", [(LEASED, worker, now + self.lease_seconds, row[0]) for row in rows])
+        return [(item_id, ImageJob(path, page)) for item_id, path, page in rows]
+
+    def heartbeat(self, worker):
+        """Renew the leases of every item worker holds."""
+        now = time.time()
+        with self.transaction() as conn:
+            conn.execute("UPDATE items SET lease_expires = ? WHERE state = ? AND worker = ?",
+                         (now + self.lease_seconds, LEASED, worker))
+            conn.execute("UPDATE workers SET last_seen = ? WHERE worker = ?", (now, worker))
+
+    def complete(self, item_id):
+        with self.transaction() as conn:
+            conn.execute("UPDATE items SET state = ?, lease_expires = NULL WHERE id = ?", (DONE, item_id))
+
+    def fail(self, item_id):
+        """Put an item whose image failed back in the queue, or mark it failed after max_attempts attempts."""
+        with self.transaction() as conn:
+            conn.execute("UPDATE items SET state = CASE WHEN attempts >= ? THEN ? ELSE ? END, worker = NULL, "
+                         "lease_expires = NULL WHERE id = ?", (self.max_attempts, FAILED, PENDING, item_id))
+
+    def release(self, worker):
+        """Return the items worker still holds to the queue (on a clean shutdown)."""
+        with self.transaction() as conn:
+            conn.execute("UPDATE items SET state = ?, worker = NULL, lease_expires = NULL, attempts = attempts - 1 "
+                         "WHERE state = ? AND worker = ?", (PENDING, LEASED, worker))
+
+    def counts(self):
+        """Return {state: item count}, counting expired leases as 'expired'."""
+        with self.lock:
+            counts = dict(self.conn.execute("SELECT state, COUNT(*) FROM items GROUP BY state").fetchall())
+            counts['expired'] = self.conn.execute(
+                "SELECT COUNT(*) FROM items WHERE state = ? AND lease_expires < ?", (LEASED, time.time())
+            ).fetchone()[0]
+        return counts
+
+    def is_finished(self):
+        """True when no item is pending or leased."""
+        counts = self.counts()
+        return not counts.get(PENDING) and not counts.get(LEASED)
+
+    def workers(self):
+        """Return [(worker, output_path, last_seen)]."""
+        with self.lock:
+            return self.conn.execute("SELECT worker, output_path, last_seen FROM workers ORDER BY worker").fetchall()
+
+    def items(self):
+        """Yield (ImageJob, state) for every item in the order they were added."""
+        with self.lock:
+            rows = self.conn.execute("SELECT path, page, state FROM items ORDER BY id").fetchall()
+        for path, page, state in rows:
+            yield ImageJob(path, page), state
+
+    def summary(self):
+        counts = self.counts()
+        total = sum(count for state, count in counts.items() if state != 'expired')
+        summary = (f"Queue: {counts.get(DONE, 0)}/{total} done, {counts.get(PENDING, 0)} pending, "
+                   f"{counts.get(LEASED, 0)} leased")
+        if counts['expired']:
+            summary += f" ({counts['expired']} with expired leases)"
+        if counts.get(FAILED):
+            summary += f", {counts[FAILED]} failed"
+        return summary
+
+    def close(self):
+        self.conn.close()
+
+
+class Heartbeat:
+    """Background thread that renews a worker's leases every interval seconds."""
+
+    def __init__(self, queue, worker, interval):
+        self.queue = queue
+        self.worker = worker
+        self.interval = interval
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+
+    def start(self):
+        self.thread.start()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            try:
+                self.queue.heartbeat(self.worker)
+            except sqlite3.Error as e:
+                # A slow share is retried on the next beat; the lease is long enough to absorb a miss
+                print(f"Heartbeat failed: {e}")
+
+    def stop(self):
+        self.stopped.set()
+        self.thread.join()
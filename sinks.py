@@ -0,0 +1,230 @@
+import os
+import csv
+import json
+from abc import ABC, abstractmethod
+
+PARQUET_BATCH_ROWS = 10000
+
+# openpyxl and pyarrow are slow to import, so they are only imported when
+# an output file of their format is opened
+
+
+def load_pyarrow():
+    """Return the pyarrow and pyarrow.parquet modules; raises ImportError when pyarrow is not installed."""
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        raise ImportError("Parquet output requires the pyarrow package")
+    return pyarrow, pyarrow.parquet
+
+
+def flatten_row(row, prefix='', sep='.'):
+    """Flatten nested dicts into dotted column names, like pandas.json_normalize.
+
+    Lists are stored as JSON text so they fit in a single cell.
+    """
+    flat = {}
+    for key, value in row.items():
+        column = f"{prefix}{sep}{key}" if prefix else str(key)
+        if isinstance(value, dict):
+            flat.update(flatten_row(value, column, sep))
+        elif isinstance(value, list):
+            flat[column] = json.dumps(value, ensure_ascii=False)
+        else:
+            flat[column] = value
+    return flat
+
+
+def ensure_parent_dir(path):
+    """Create the output directory if it doesn't exist."""
+    output_dir = os.path.dirname(path)
+    if output_dir and not os.path.exists(output_dir):
+        os.makedirs(output_dir)
+
+
+class JsonlSink:
+    """Write each row as one JSON line as soon as it arrives.
+
+    With append, rows are added to an existing file (used by watch mode).
+    """
+
+    def __init__(self, path, columns=None, append=False):
+        self.path = path
+        self.columns = columns
+        self.rows = 0
+        ensure_parent_dir(path)
+        self.file = open(path, 'a' if append else 'w', encoding='utf-8')
+
+    def write(self, row):
+        flat = flatten_row(row)
+        if self.columns is not None:
+            flat = {column: flat.get(column) for column in self.columns}
+        self.file.write(json.dumps(flat, ensure_ascii=False) + '\n')
+        self.file.flush()
+        self.rows += 1
+
+    def close(self):
+        self.file.close()
+
+
+class TabularSink(ABC):
+    """Base class for formats that need the full column set in a header.
+
+    With a fixed list of columns (for example from an output schema) rows
+    are written straight into the output file. Otherwise rows are flattened
+    and streamed to a JSONL spool file next to the output (visible as
+    partial output while the run is going), and the set of columns grows as
+    new keys appear. On close the spool is streamed into the final file and
+    removed, so memory use does not grow with the number of rows. If writing
+    the final file fails, the spool is kept.
+
+    Subclasses implement begin(columns), append(values) and finish().
+    """
+
+    def __init__(self, path, columns=None):
+        self.path = path
+        self.spool_path = path + '.partial.jsonl'
+        self.fixed = columns is not None
+        self.columns = dict.fromkeys(columns or [])
+        self.rows = 0
+        self.spool = None
+        ensure_parent_dir(path)
+        if self.fixed:
+            self.begin(list(self.columns))
+        else:
+            self.spool = open(self.spool_path, 'w', encoding='utf-8')
+
+    def write(self, row):
+        flat = flatten_row(row)
+        if self.fixed:
+            self.append([flat.get(column) for column in self.columns])
+        else:
+            for column in flat:
+                if column not in self.columns:
+                    self.columns[column] = None
+            self.spool.write(json.dumps(flat, ensure_ascii=False) + '\n')
+            self.spool.flush()
+        self.rows += 1
+
+    def iter_spool(self):
+        with open(self.spool_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                yield json.loads(line)
+
+    def close(self):
+        if self.fixed:
+            self.finish()
+            return
+        self.spool.close()
+        columns = list(self.columns)
+        self.begin(columns)
+        for row in self.iter_spool():
+            self.append([row.get(column) for column in columns])
+        self.finish()
+        os.remove(self.spool_path)
+
+    @abstractmethod
+    def begin(self, columns):
+        """Open the output file and write the header of columns."""
+
+    @abstractmethod
+    def append(self, values):
+        """Write one row of values, in the order of the columns."""
+
+    @abstractmethod
+    def finish(self):
+        """Write anything buffered and close the output file."""
+
+
+class CsvSink(TabularSink):
+    """CSV output (UTF-8 with BOM so Excel detects the encoding)."""
+
+    def begin(self, columns):
+        self.file = open(self.path, 'w', encoding='utf-8-sig', newline='')
+        self.writer = csv.writer(self.file)
+        self.writer.writerow(columns)
+
+    def append(self, values):
+        self.writer.writerow(values)
+
+    def finish(self):
+        self.file.close()
+
+
+class XlsxSink(TabularSink):
+    """Excel output written with openpyxl in write-only (streaming) mode."""
+
+    def begin(self, columns):
+        from openpyxl import Workbook
+        from openpyxl.cell.cell import ILLEGAL_CHARACTERS_RE
+        self.illegal_characters = ILLEGAL_CHARACTERS_RE
+        self.workbook = Workbook(write_only=True)
+        self.sheet = self.workbook.create_sheet()
+        self.sheet.append(columns)
+
+    def append(self, values):
+        self.sheet.append([self.cell_value(value) for value in values])
+
+    def finish(self):
+        self.workbook.save(self.path)
+
+    def cell_value(self, value):
+        # Control characters are not allowed in Excel cells
+        if isinstance(value, str):
+            return self.illegal_characters.sub('', value)
+        return value
+
+
+class ParquetSink(TabularSink):
+    """Parquet output written in row groups; every column is stored as text."""
+
+    def __init__(self, path, columns=None):
+        # Fail before processing starts rather than at the end of the run
+        self.pa, self.pq = load_pyarrow()
+        super().__init__(path, columns)
+
+    def begin(self, columns):
+        pa = self.pa
+        self.schema = pa.schema([(column, pa.string()) for column in columns])
+        self.writer = self.pq.ParquetWriter(self.path, self.schema)
+        self.batch = []
+
+    def append(self, values):
+        self.batch.append([self.cell_value(value) for value in values])
+        if len(self.batch) >= PARQUET_BATCH_ROWS:
+            self.flush_batch()
+
+    def finish(self):
+        self.flush_batch()
+        self.writer.close()
+
+    def flush_batch(self):
+        if self.batch:
+            pa = self.pa
+            arrays = [pa.array(column, pa.string()) for column in zip(*self.batch)]
+            self.writer.write_table(pa.Table.from_arrays(arrays, schema=self.schema))
+            self.batch = []
+
+    @staticmethod
+    def cell_value(value):
+        if value is None or isinstance(value, str):
+            return value
+        return json.dumps(value, ensure_ascii=False)
+
+
+SINKS = {
+    '.xlsx': XlsxSink,
+    '.csv': CsvSink,
+    '.jsonl': JsonlSink,
+    '.parquet': ParquetSink,
+}
+
+
+def open_sink(path, columns=None):
+    """Open a streaming output writer chosen by the file extension (Excel by default).
+
+    columns fixes the output columns up front; otherwise they grow with the rows.
+    """
+    extension = os.path.splitext(path)[1].lower()
+    return SINKS.get(extension, XlsxSink)(path, columns)
@@ -0,0 +1,33 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from gemini import iter_rows  # noqa: E402
+from image_input import ImageJob  # noqa: E402
+from journal import Journal  # noqa: E402
+
+
+def test_failed_job_is_retried_on_resume(tmp_path):
+    jobs = [ImageJob(str(tmp_path / name)) for name in ('a.png', 'b.png', 'c.png')]
+    journal_path = str(tmp_path / 'out.jsonl.journal.jsonl')
+
+    def first_run(job):
+        if job.path.endswith('b.png'):
+            return {'error': '429 Resource exhausted'}
+        return {'text': 'first'}
+
+    rows = list(iter_rows(jobs, first_run, workers=1, journal=Journal(journal_path)))
+    assert [row.get('error') for row in rows] == [None, '429 Resource exhausted', None]
+    assert len(Journal(journal_path).load()) == 2
+
+    processed = []
+
+    def second_run(job):
+        processed.append(os.path.basename(job.path))
+        return {'text': 'second'}
+
+    rows = list(iter_rows(jobs, second_run, workers=1, journal=Journal(journal_path), resume=True))
+    assert processed == ['b.png']
+    assert [row['text'] for row in rows] == ['first', 'second', 'first']
+    assert len(Journal(journal_path).load()) == 3
@@ -0,0 +1,19 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from metrics import Metrics, SAMPLE_SIZE  # noqa: E402
+
+
+def test_stage_timings_stay_bounded():
+    metrics = Metrics()
+    count = SAMPLE_SIZE * 3
+    for index in range(count):
+        metrics.record('api', index / count)
+    assert len(metrics.timings['api'].sample) == SAMPLE_SIZE
+    report = metrics.report()['stages']['api']
+    assert report['count'] == count
+    assert report['max_seconds'] == (count - 1) / count
+    assert abs(report['p50_seconds'] - 0.5) < 0.05
+    assert abs(report['p95_seconds'] - 0.95) < 0.05
@@ -0,0 +1,30 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from output_schema import OutputSchema  # noqa: E402
+
+
+@pytest.mark.parametrize('schema', [
+    [1],
+    'x',
+    None,
+    {'type': 'object', 'properties': {'a': 'string'}},
+    {'type': 'object', 'properties': ['a']},
+    {'type': 'object', 'properties': {'items': {'type': 'array', 'items': 'string'}}},
+])
+def test_malformed_schema_raises_value_error(schema):
+    with pytest.raises(ValueError):
+        OutputSchema(schema)
+
+
+def test_valid_schema_columns():
+    schema = OutputSchema({'type': 'object', 'properties': {
+        'total': {'type': 'number'},
+        'vendor': {'type': 'object', 'properties': {'name': {'type': 'string'}}},
+        'items': {'type': 'array', 'items': {'type': 'string'}},
+    }})
+    assert schema.columns == ['total', 'vendor.name', 'items']
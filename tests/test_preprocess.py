@@ -0,0 +1,47 @@
+import io
+import os
+import sys
+
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from preprocess import ImagePreprocessor, ORIENTATION_TAG  # noqa: E402
+
+
+def encode(image, format, **options):
+    output = io.BytesIO()
+    image.save(output, format=format, **options)
+    return output.getvalue()
+
+
+def noise(size):
+    return Image.frombytes('RGB', size, os.urandom(size[0] * size[1] * 3))
+
+
+def test_original_kept_when_reencoding_is_not_smaller():
+    original = encode(noise((200, 100)), 'JPEG', quality=20)
+    preprocessor = ImagePreprocessor(max_edge=1000, quality=95)
+    assert preprocessor.process(original, 'image/jpeg') == (original, 'image/jpeg')
+    assert preprocessor.bytes_out == preprocessor.bytes_in
+    assert '0 B' in preprocessor.summary() and '1 images kept' in preprocessor.summary()
+
+
+def test_resized_or_rotated_images_are_reencoded():
+    preprocessor = ImagePreprocessor(max_edge=100, quality=95)
+    shrunk, mime_type = preprocessor.process(encode(noise((200, 100)), 'JPEG', quality=20), 'image/jpeg')
+    assert mime_type == 'image/jpeg' and Image.open(io.BytesIO(shrunk)).size == (100, 50)
+
+    exif = Image.Exif()
+    exif[ORIENTATION_TAG] = 6
+    rotated = encode(noise((80, 40)), 'JPEG', quality=20, exif=exif)
+    upright, _ = ImagePreprocessor(max_edge=1000, quality=95).process(rotated, 'image/jpeg')
+    assert Image.open(io.BytesIO(upright)).size == (40, 80)
+
+
+def test_smaller_jpeg_replaces_the_original():
+    original = encode(Image.new('RGB', (300, 300), 'white'), 'PNG', compress_level=0)
+    preprocessor = ImagePreprocessor()
+    processed, mime_type = preprocessor.process(original, 'image/png')
+    assert mime_type == 'image/jpeg' and len(processed) < len(original)
+    assert preprocessor.kept == 0
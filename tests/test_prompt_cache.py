@@ -0,0 +1,55 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from key_pool import KeyPool, KeySpec  # noqa: E402
+from ocr_client import StubBackend, build_prompt  # noqa: E402
+from prompt_cache import PromptCache, is_missing_entry_error  # noqa: E402
+
+IMAGE = {'mime_type': 'image/png', 'data': b'image'}
+
+
+class PermissionDenied(Exception):
+    """Like google.api_core's 403 error."""
+    code = 403
+
+
+class ExpiringStub(StubBackend):
+    """Stub whose first request with a cached prompt finds the entry gone, reported as a 403."""
+
+    def __init__(self):
+        super().__init__()
+        self.denied = 0
+
+    def generate_with_usage(self, contents, generation_config=None, cached_prompt=None):
+        if cached_prompt and not self.denied:
+            self.denied += 1
+            raise PermissionDenied(f"403 CachedContent not found (or permission denied): {cached_prompt}")
+        return super().generate_with_usage(contents, generation_config, cached_prompt)
+
+
+def test_permission_denied_for_cached_content_counts_as_missing():
+    assert is_missing_entry_error(PermissionDenied("403 CachedContent not found (or permission denied)"))
+    assert not is_missing_entry_error(PermissionDenied("403 API key not valid"))
+
+
+def test_request_is_resent_inline_when_entry_is_denied():
+    prompt = build_prompt('fields ' * 2000)
+    prompt_cache = PromptCache(prompt, 600)
+    stubs = []
+
+    def make_backend(api_key):
+        stubs.append(ExpiringStub())
+        return prompt_cache.wrap(stubs[-1])
+
+    pool = KeyPool([KeySpec('AIzaKEY-0000000001')], make_backend)
+    text, usage = pool.generate_with_usage([prompt, IMAGE])
+    assert text == '{"text": "stub"}'
+    assert 'cached_tokens' not in usage
+    assert prompt_cache.counters['inline'] == 1
+    # The key is not benched as rejected, and the next request uses a new entry
+    assert pool.usage()[0]['rejected'] == 0
+    text, usage = pool.generate_with_usage([prompt, IMAGE])
+    assert usage['cached_tokens'] > 0
+    assert prompt_cache.counters['created'] == 2
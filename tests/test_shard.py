@@ -0,0 +1,61 @@
+import os
+import sys
+import json
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PIL import Image  # noqa: E402
+
+import shard  # noqa: E402
+from gemini import shard_main  # noqa: E402
+
+
+def make_images(folder, count):
+    for index in range(count):
+        Image.new('RGB', (8, 8), 'white').save(folder / f"{index}.png")
+
+
+def run(command, tmp_path, *options):
+    output_path = str(tmp_path / 'out.jsonl')
+    arguments = ['--output_path', output_path]
+    if command == 'init':
+        arguments += ['--photo_dir', str(tmp_path / 'images')]
+    if command == 'work':
+        arguments += ['--backend', 'stub', '--no_cache', '--max_retries', '0', '--workers', '1',
+                      '--idle_interval', '0']
+    shard_main([command] + arguments + list(options))
+    return output_path
+
+
+def read_rows(path):
+    with open(path, encoding='utf-8') as f:
+        return [json.loads(line) for line in f]
+
+
+def test_failed_images_are_retried_then_reported(tmp_path):
+    (tmp_path / 'images').mkdir()
+    make_images(tmp_path / 'images', 3)
+    run('init', tmp_path)
+    output_path = run('work', tmp_path, '--stub_error_rate', '1', '--max_attempts', '2')
+
+    queue = shard.WorkQueue(shard.default_queue_path(output_path))
+    assert queue.counts().get(shard.FAILED) == 3
+    assert all(attempts == 2 for attempts, in queue.conn.execute("SELECT attempts FROM items"))
+    queue.close()
+
+    run('merge', tmp_path)
+    rows = read_rows(output_path)
+    assert len(rows) == 3
+    assert all('503' in row['error'] for row in rows)
+
+
+def test_failed_images_succeed_on_a_later_attempt(tmp_path):
+    (tmp_path / 'images').mkdir()
+    make_images(tmp_path / 'images', 6)
+    run('init', tmp_path)
+    output_path = run('work', tmp_path, '--stub_error_rate', '0.5', '--max_attempts', '20')
+
+    run('merge', tmp_path)
+    rows = read_rows(output_path)
+    assert len(rows) == 6
+    assert not any('error' in row for row in rows)
@@ -0,0 +1,222 @@
+import io
+import json
+import math
+import threading
+
+DEFAULT_TILE_SIZE = 2048
+DEFAULT_TILE_OVERLAP = 256
+DEFAULT_TILE_WORKERS = 4
+DEFAULT_TILE_QUALITY = 90
+
+# Only this many items at the end of one tile's list are compared with the start of the next
+OVERLAP_WINDOW = 50
+
+# Shortest line that counts as the start or end of a longer one cut at a tile edge
+MIN_CUT_CHARS = 4
+
+
+def tile_spans(length, tile_size, overlap):
+    """(start, end) offsets of tiles of tile_size covering length, overlapping by at least overlap."""
+    if length <= tile_size:
+        return [(0, length)]
+    count = math.ceil((length - overlap) / (tile_size - overlap))
+    # Spread the tiles evenly, so the last one is not a thin sliver
+    stride = (length - tile_size) / (count - 1)
+    return [(round(index * stride), round(index * stride) + tile_size) for index in range(count)]
+
+
+def tile_boxes(width, height, tile_size, overlap):
+    """(left, top, right, bottom) boxes of the tiles of an image, in reading order."""
+    return [(left, top, right, bottom)
+            for top, bottom in tile_spans(height, tile_size, overlap)
+            for left, right in tile_spans(width, tile_size, overlap)]
+
+
+def normalize(item):
+    """Comparable text of a line or a structured item."""
+    if not isinstance(item, str):
+        item = json.dumps(item, ensure_ascii=False, sort_keys=True)
+    return ' '.join(item.split()).casefold()
+
+
+def similar(a, b):
+    """True when two normalized lines are the same line, possibly cut short at a tile edge.
+
+    Lines that differ anywhere else are kept apart: neighbouring lines of a
+    receipt or rows of a table often differ in a character or two, and
+    merging them would lose data, while a line misread in one tile only
+    shows up twice.
+    """
+    if a == b:
+        return True
+    shorter, longer = sorted((a, b), key=len)
+    return len(shorter) >= MIN_CUT_CHARS and (longer.startswith(shorter) or longer.endswith(shorter))
+
+
+def merge_sequences(previous, current):
+    """Append current to previous, removing the items both tiles read from their overlap.
+
+    Looks for the longest run of similar items at the end of previous and
+    the start of current; one item cut by the tile edge may be left over
+    on either side and is dropped. Of each matched pair the longer reading
+    is kept.
+    """
+    if not previous or not current:
+        return list(previous or current)
+    previous_keys = [normalize(item) for item in previous]
+    current_keys = [normalize(item) for item in current[:OVERLAP_WINDOW]]
+    best = None  # (length, start in previous, start in current)
+    for i in range(max(0, len(previous) - OVERLAP_WINDOW), len(previous)):
+        for j in range(min(2, len(current_keys))):
+            length = 0
+            while (i + length < len(previous) and j + length < len(current_keys)
+                   and similar(previous_keys[i + length], current_keys[j + length])):
+                length += 1
+            if length and len(previous) - (i + length) <= 1 and (best is None or length > best[0]):
+                best = (length, i, j)
+    if best is None:
+        return list(previous) + list(current)
+    length, i, j = best
+    matched = [max(previous[i + k], current[j + k], key=lambda item: len(normalize(item))) for k in range(length)]
+    return list(previous[:i]) + matched + list(current[j + length:])
+
+
+def merge_values(a, b, align=True):
+    """Merge the results of two neighbouring tiles.
+
+    With align, lists and lines are joined with merge_sequences, otherwise
+    (when the repeats were already removed) simply appended.
+    """
+    if a is None or a == '' or a == [] or a == {}:
+        return b
+    if b is None or b == '' or b == [] or b == {}:
+        return a
+    if isinstance(a, dict) and isinstance(b, dict):
+        merged = dict(a)
+        for key, value in b.items():
+            merged[key] = merge_values(merged[key], value, align) if key in merged else value
+        return merged
+    join = merge_sequences if align else lambda previous, current: previous + current
+    if isinstance(a, list) or isinstance(b, list):
+        return join(a if isinstance(a, list) else [a], b if isinstance(b, list) else [b])
+    if isinstance(a, str) and isinstance(b, str):
+        return '\n'.join(join(a.splitlines(), b.splitlines()))
+    # Numbers and other scalars can't be combined; the first tile's value wins
+    return a
+
+
+def collect_lines(value, lines):
+    """Add the normalized lines and list items found anywhere in value to the set lines."""
+    if isinstance(value, dict):
+        for item in value.values():
+            collect_lines(item, lines)
+    elif isinstance(value, list):
+        for item in value:
+            lines.add(normalize(item))
+            collect_lines(item, lines)
+    elif isinstance(value, str):
+        lines.update(normalize(line) for line in value.splitlines())
+    return lines
+
+
+def remove_repeats(value, seen):
+    """Drop the list items and lines of value that neighbouring tiles already read (normalized lines in seen)."""
+    def repeated(item):
+        # Only the shorter reading of a line cut at an edge is dropped; a longer one is never lost
+        key = normalize(item)
+        return any(key == other or (len(other) > len(key) >= MIN_CUT_CHARS and
+                                    (other.startswith(key) or other.endswith(key)))
+                   for other in seen)
+
+    if isinstance(value, dict):
+        return {key: remove_repeats(item, seen) for key, item in value.items()}
+    if isinstance(value, list):
+        return [item for item in value if not repeated(item)]
+    if isinstance(value, str):
+        return '\n'.join(line for line in value.splitlines() if not repeated(line))
+    return value
+
+
+def merge_results(results, columns=1):
+    """Merge the parsed results of an image's tiles, given in reading order with columns tiles per row.
+
+    A single column of tiles (a tall page) is merged by matching the end of
+    each tile with the start of the next. In a grid, the overlaps run along
+    the sides of the tiles rather than at the end of their text, so what a
+    tile shares with its left and upper neighbours is removed wherever it is.
+    """
+    merged = None
+    for index, result in enumerate(results):
+        if columns > 1:
+            row, column = divmod(index, columns)
+            neighbours = [(row, column - 1), (row - 1, column - 1), (row - 1, column), (row - 1, column + 1)]
+            seen = set()
+            for neighbour_row, neighbour_column in neighbours:
+                if neighbour_row >= 0 and 0 <= neighbour_column < columns:
+                    collect_lines(results[neighbour_row * columns + neighbour_column], seen)
+            result = remove_repeats(result, seen)
+        merged = merge_values(merged, result, align=columns == 1)
+    return merged if merged is not None else {}
+
+
+class ImageTiler:
+    """Split oversized images into overlapping tiles that are OCRed separately.
+
+    Images whose long edge is at most tile_size pixels are left alone.
+    Larger ones (tall receipts, long forms, large drawings) are cut into a
+    grid of tiles of at most tile_size pixels at full resolution, so small
+    text is not lost to downscaling. Neighbouring tiles overlap by overlap
+    pixels, so a line cut at one tile's edge is whole in the next; the
+    lines read twice are removed again by merge_results. Up to workers
+    tiles of an image are sent at once. Safe to share between worker
+    threads.
+    """
+
+    def __init__(self, tile_size=DEFAULT_TILE_SIZE, overlap=DEFAULT_TILE_OVERLAP, workers=DEFAULT_TILE_WORKERS,
+                 quality=DEFAULT_TILE_QUALITY):
+        if not 0 <= overlap < tile_size // 2:
+            raise ValueError("The tile overlap must be less than half the tile size")
+        self.tile_size = tile_size
+        self.overlap = overlap
+        self.workers = workers
+        self.quality = quality
+        self.images = 0
+        self.tiles = 0
+        self.lock = threading.Lock()
+
+    @property
+    def cache_tag(self):
+        """Identify the settings, so cached responses are not shared between them."""
+        return f"tiles:size={self.tile_size};overlap={self.overlap}"
+
+    def split(self, image_bytes):
+        """Return ([(tile_bytes, mime_type)] in reading order, tiles per row), or None when the image fits in one tile."""
+        # Pillow is imported on first use, like in the preprocessor
+        from PIL import Image, ImageOps
+        with Image.open(io.BytesIO(image_bytes)) as image:
+            if max(image.size) <= self.tile_size:
+                return None
+            image = ImageOps.exif_transpose(image)
+            if image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info):
+                # JPEG has no alpha channel, so flatten onto white
+                image = image.convert('RGBA')
+                background = Image.new('RGB', image.size, (255, 255, 255))
+                background.paste(image, mask=image.getchannel('A'))
+                image = background
+            elif image.mode not in ('RGB', 'L'):
+                image = image.convert('RGB')
+            tiles = []
+            columns = len(tile_spans(image.width, self.tile_size, self.overlap))
+            for box in tile_boxes(image.width, image.height, self.tile_size, self.overlap):
+                output = io.BytesIO()
+                image.crop(box).save(output, format='JPEG', quality=self.quality)
+                tiles.append((output.getvalue(), 'image/jpeg'))
+
+        with self.lock:
+            self.images += 1
+            self.tiles += len(tiles)
+        return tiles, columns
+
+    def summary(self):
+        """Return a one-line tiling summary for the end of a run."""
+        return f"Tiling: {self.images} images split into {self.tiles} tiles"
@@ -0,0 +1,182 @@
+import os
+import time
+import sqlite3
+import threading
+import importlib.util
+
+# Seconds between folder scans when file system events are not available
+DEFAULT_POLL_INTERVAL = 5.0
+
+# A file must keep the same size and modification time this long before it is processed
+DEFAULT_SETTLE = 2.0
+
+# Full rescan interval when file system events are used, to catch missed events
+DEFAULT_RESCAN_INTERVAL = 600.0
+
+
+def default_state_path(output_path):
+    """Watch state database kept next to the output file."""
+    return output_path + '.watch.sqlite'
+
+
+class WatchState:
+    """SQLite record of processed files, so a restarted watcher skips them.
+
+    A file counts as processed for the size and modification time it had
+    when it was processed; if it changes afterwards it is processed again.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS processed ("
+            "path TEXT PRIMARY KEY, size INTEGER NOT NULL, mtime REAL NOT NULL, processed_at REAL NOT NULL)"
+        )
+        self.conn.commit()
+        self.files = {path: (size, mtime) for path, size, mtime
+                      in self.conn.execute("SELECT path, size, mtime FROM processed")}
+
+    def is_processed(self, path, size, mtime):
+        return self.files.get(path) == (size, mtime)
+
+    def mark_processed(self, path, size, mtime):
+        self.files[path] = (size, mtime)
+        self.conn.execute("INSERT OR REPLACE INTO processed (path, size, mtime, processed_at) VALUES (?, ?, ?, ?)",
+                          (path, size, mtime, time.time()))
+        self.conn.commit()
+
+    def close(self):
+        self.conn.close()
+
+
+def events_available():
+    """True when the optional watchdog package is installed (checked without importing it)."""
+    return importlib.util.find_spec('watchdog') is not None
+
+
+class _EventHandler:
+    """Collects the paths reported by watchdog and wakes up the watcher.
+
+    watchdog only calls dispatch(event), so the handler does not need to
+    subclass its FileSystemEventHandler and watchdog is imported in start().
+    """
+
+    def __init__(self, watcher):
+        self.watcher = watcher
+
+    def dispatch(self, event):
+        paths = [event.src_path, getattr(event, 'dest_path', '')]
+        self.watcher.notify([path for path in paths if path], event.is_directory)
+
+
+class FolderWatcher:
+    """Detect new and changed files under a folder once they have stopped changing.
+
+    Uses file system events (inotify and friends, through the optional
+    watchdog package) when available and scans the folder every
+    poll_interval seconds otherwise. With events, only the reported paths
+    are checked, plus a full rescan every rescan_interval seconds to catch
+    anything the events missed.
+
+    A file is reported by poll() once its size and modification time have
+    not changed for settle seconds, so files that are still being copied
+    in are not picked up half-written. Files already recorded in the state
+    with the same size and modification time are skipped.
+    """
+
+    def __init__(self, scanner, state, poll_interval=DEFAULT_POLL_INTERVAL, settle=DEFAULT_SETTLE,
+                 rescan_interval=DEFAULT_RESCAN_INTERVAL, use_events=True):
+        self.scanner = scanner
+        self.state = state
+        self.poll_interval = poll_interval
+        self.settle = settle
+        self.rescan_interval = rescan_interval
+        self.use_events = use_events and events_available()
+        self.observer = None
+        self.pending = {}  # path -> (size, mtime, unchanged since)
+        self.dirty = set()
+        self.rescan_needed = True
+        self.last_scan = 0.0
+        self.lock = threading.Lock()
+        self.wakeup = threading.Event()
+
+    @property
+    def mode(self):
+        return 'file system events' if self.use_events else f'polling every {self.poll_interval:g}s'
+
+    def start(self):
+        if self.use_events:
+            from watchdog.observers import Observer
+            self.observer = Observer()
+            self.observer.schedule(_EventHandler(self), self.scanner.root, recursive=self.scanner.recursive)
+            self.observer.start()
+
+    def stop(self):
+        if self.observer is not None:
+            self.observer.stop()
+            self.observer.join()
+            self.observer = None
+
+    def notify(self, paths, is_directory=False):
+        """Record changed paths (called from the event thread) and wake up the watcher."""
+        with self.lock:
+            if is_directory:
+                # A directory moved in brings files without events of their own
+                self.rescan_needed = True
+            else:
+                self.dirty.update(paths)
+        self.wakeup.set()
+
+    def candidates(self):
+        """Paths to check: the whole folder on a rescan, otherwise the changed and settling files."""
+        now = time.time()
+        with self.lock:
+            rescan = (self.rescan_needed or not self.use_events
+                      or now - self.last_scan >= self.rescan_interval)
+            # Cleared before the changes are taken, so an event that arrives later wakes up the next wait()
+            self.wakeup.clear()
+            dirty, self.dirty = self.dirty, set()
+            self.rescan_needed = False
+        if rescan:
+            self.last_scan = now
+            paths = list(self.scanner)
+            # Forget settling files that have disappeared
+            found = set(paths)
+            self.pending = {path: value for path, value in self.pending.items() if path in found}
+            return paths
+        paths = [path for path in dirty if self.scanner.select(path) is not None]
+        return paths + [path for path in self.pending if path not in dirty]
+
+    def poll(self):
+        """Return [(path, size, mtime)] for files that are new or changed and have settled."""
+        now = time.time()
+        ready = []
+        for path in self.candidates():
+            try:
+                info = os.stat(path)
+            except OSError:
+                # Deleted or renamed while settling
+                self.pending.pop(path, None)
+                continue
+            key = (info.st_size, info.st_mtime)
+            if self.state.is_processed(path, *key):
+                self.pending.pop(path, None)
+                continue
+            previous = self.pending.get(path)
+            if previous is None or previous[:2] != key:
+                self.pending[path] = key + (now,)
+            elif now - previous[2] >= self.settle:
+                del self.pending[path]
+                ready.append((path,) + key)
+        return ready
+
+    def wait(self):
+        """Sleep until the next check: shortly while files are settling, otherwise until an event or the poll interval."""
+        if self.pending:
+            timeout = self.settle
+        elif self.use_events:
+            timeout = self.rescan_interval
+        else:
+            timeout = self.poll_interval
+        self.wakeup.wait(timeout)